@@ -0,0 +1,141 @@
+"""Scheduling of imports into many conduit directories at once."""
+
+import multiprocessing
+import os
+import Queue
+import sys
+import time
+
+from cvsgit.cvs import limit_parse_concurrency
+from cvsgit.main import Conduit
+from cvsgit.term import pause_progress
+
+def parse_conduit_list(lines):
+    """Return the conduit directories listed in 'lines', one per line.
+    Blank lines and comments starting with '#' are skipped.
+
+    >>> parse_conduit_list(['# modules\\n', '/srv/git/src\\n', '\\n',
+    ...                     '  /srv/git/ports  # big\\n'])
+    ['/srv/git/src', '/srv/git/ports']
+    """
+    directories = []
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if line:
+            directories.append(line)
+    return directories
+
+def read_conduit_list(filename):
+    """Read a conduit list from 'filename', or from standard input if
+    'filename' is "-".
+    """
+    if filename == '-':
+        return parse_conduit_list(sys.stdin.readlines())
+
+    f = open(filename, 'r')
+    try:
+        return parse_conduit_list(f.readlines())
+    finally:
+        f.close()
+
+def conduit_priority(directory):
+    """Return a sort key for the conduit in 'directory'.
+
+    Conduits with more changesets waiting to be imported come first,
+    then the ones that haven't been fetched for the longest time,
+    judging from the modification time of their meta database.
+    """
+    conduit = Conduit(directory)
+    filename = os.path.join(conduit.git.git_dir, 'cvsgit.db')
+    if not os.path.isfile(filename):
+        return (0, 0)
+    return (-conduit.cvs.count_changesets(), os.path.getmtime(filename))
+
+class PullResult(object):
+    """Outcome of pulling a single conduit directory.
+    """
+
+    def __init__(self, directory, commits=0, elapsed=0, error=None):
+        self.directory = directory
+        self.commits = commits
+        self.elapsed = elapsed
+        self.error = error
+
+def _pull(directory, options, queue):
+    """Pull into the conduit in 'directory' and put a PullResult into
+    'queue'.  This runs in a separate process.
+    """
+    start_time = time.time()
+    try:
+        conduit = Conduit(directory)
+        git = conduit.git
+        if git.ref_exists(conduit.branch):
+            before = git.rev_parse(conduit.branch)
+        else:
+            before = None
+        conduit.pull(quiet=True, **options)
+        if before is None:
+            revisions = conduit.branch
+        else:
+            revisions = '%s..%s' % (before, conduit.branch)
+        commits = int(git.rev_list('--count', revisions))
+        queue.put(PullResult(directory, commits, time.time() - start_time))
+    except KeyboardInterrupt:
+        pass
+    except Exception, e:
+        queue.put(PullResult(directory, elapsed=time.time() - start_time,
+                             error=str(e) or e.__class__.__name__))
+
+def pull_all(directories, jobs=1, parse_jobs=None, **options):
+    """Pull into each conduit in 'directories' and yield a PullResult
+    for each one as soon as it is done.
+
+    The conduits are ordered by conduit_priority() and pulled by up to
+    'jobs' worker processes at a time.  At most 'parse_jobs' RCS files
+    are parsed at any time by all of the workers together.  The other
+    keyword arguments are passed on to Conduit.pull().  An error in
+    one conduit does not stop the others.
+    """
+    if parse_jobs is not None:
+        limit_parse_concurrency(multiprocessing.Semaphore(parse_jobs))
+
+    pending = []
+    for directory in directories:
+        try:
+            pending.append((conduit_priority(directory), directory))
+        except Exception, e:
+            yield PullResult(directory, error=str(e) or
+                             e.__class__.__name__)
+    pending.sort()
+    pending = map(lambda p: p[1], pending)
+
+    queue = multiprocessing.Queue()
+    running = {}
+    try:
+        while len(pending) > 0 or len(running) > 0:
+            while len(pending) > 0 and len(running) < jobs:
+                directory = pending.pop(0)
+                process = multiprocessing.Process(
+                    target=_pull, args=(directory, options, queue))
+                with pause_progress():
+                    process.start()
+                running[directory] = process
+
+            try:
+                result = queue.get(timeout=1)
+            except Queue.Empty:
+                # Report workers that died without a result.
+                for directory, process in running.items():
+                    if process.exitcode is not None and queue.empty():
+                        del running[directory]
+                        yield PullResult(directory, error=
+                            'exit code %d' % process.exitcode)
+                continue
+
+            running.pop(result.directory).join()
+            yield result
+    finally:
+        for process in running.values():
+            process.terminate()
+            process.join()
+        limit_parse_concurrency(None)
@@ -0,0 +1,62 @@
+"""Lists of changed RCS files reported by repository mirroring tools."""
+
+import re
+import sys
+
+# rsync --itemize-changes: an update type, a file type and the change
+# flags, then the path.  Older rsync versions print 9 instead of 11
+# characters.
+_itemize_re = re.compile('^[<>ch.][fdLDS][.+?a-zA-Z ]{7,9} (.+)$')
+
+# cvsup/csup log lines: a capitalized verb and the path.
+_cvsup_re = re.compile('^([A-Z][a-z]+) (.+,v)$')
+
+def parse_change_list(lines):
+    """Return the RCS file paths listed as changed in 'lines'.
+
+    Each line may be rsync --itemize-changes output, a cvsup/csup log
+    line ending in the path (e.g. "Edit src/foo,v") or just a path.
+    Deletions, directories, non-RCS files and other noise are skipped.
+
+    >>> parse_change_list(['>f.st...... src/bin/ls/ls.c,v',
+    ...                    '*deleting   src/bin/ls/Attic/cmp.c,v',
+    ...                    'cd+++++++++ src/bin/cat/',
+    ...                    ' Edit src/bin/cat/cat.c,v',
+    ...                    ' Delete src/bin/cat/Attic/cat.c,v',
+    ...                    '/cvs/src/Makefile,v',
+    ...                    'sent 1,234 bytes  received 56 bytes'])
+    ['src/bin/ls/ls.c,v', 'src/bin/cat/cat.c,v', '/cvs/src/Makefile,v']
+    """
+    paths = []
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line.startswith('*deleting'):
+            continue
+
+        match = _itemize_re.match(line)
+        if match:
+            path = match.group(1)
+        else:
+            path = line.strip()
+            match = _cvsup_re.match(path)
+            if match:
+                if match.group(1) == 'Delete':
+                    continue
+                path = match.group(2)
+
+        if path.endswith(',v'):
+            paths.append(path)
+    return paths
+
+def read_change_list(filename):
+    """Read a change list from 'filename', or from standard input if
+    'filename' is "-", and return the RCS file paths in it.
+    """
+    if filename == '-':
+        return parse_change_list(sys.stdin.readlines())
+
+    f = open(filename, 'r')
+    try:
+        return parse_change_list(f.readlines())
+    finally:
+        f.close()
@@ -1,5 +1,7 @@
 """Changeset reconstruction logic for CVSGit."""
 
+import time
+
 QUIET_PERIOD = 60
 
 FILE_ADDED = 'A'
@@ -19,10 +21,13 @@ class Change(object):
     that this class is really just a dumb container.
 
     Change objects are integrated into a ChangeSet by a
-    ChangeSetGenerator."""
+    ChangeSetGenerator.  The optional 'commitid' is the identifier
+    which CVS 1.12 and later record for all files of one commit.
+    'branch' is the symbolic name of the CVS branch that the revision
+    is on, or None for the trunk."""
 
     def __init__(self, timestamp, author, log, filestatus, filename,
-                 revision, state, mode):
+                 revision, state, mode, commitid=None, branch=None):
         self.timestamp = timestamp
         self.author = author
         self.log = log
@@ -31,6 +36,8 @@ class Change(object):
         self.revision = revision
         self.state = state
         self.mode = mode
+        self.commitid = commitid
+        self.branch = branch
 
     def __str__(self):
         return '<%s %s, %s, %s %s %s %s>' % \
@@ -68,12 +75,30 @@ class ChangeSet(object):
     >>> cs.timestamp
     1303768250
 
+    Changes which carry a commitid are grouped by it alone:
+
+    >>> c3 = Change(1303768245, "jack", "Fix", FILE_MODIFIED,
+    ... "todo.txt", "1.2", "Exp", "", "100004DB3B17D2A5F4B")
+    >>> c4 = Change(1303768255, "jack", "Fix", FILE_MODIFIED,
+    ... "README", "1.2", "Exp", "", "100004DB3B2A71E8B41")
+    >>> ChangeSet(c3).integrate(c4)
+    False
+
+    Changes on different branches are never grouped together:
+
+    >>> c5 = Change(1303768249, "jack", "Initial commit", FILE_ADDED,
+    ... "NEWS", "1.1.2.1", "Exp", "", branch="STABLE")
+    >>> cs.integrate(c5)
+    False
+
     The timestamp returned for the changeset is based on the timestamp
     of the last change in the set because that is most likely the time
     when the commit actually completed and "cvs -D <timestamp>" can be
     used to create an equivalent working copy from CVS.
     """
 
+    snapshot = False
+
     def __init__(self, change, id=None, mark=None, provider=None):
         """'id' is an arbitrary value to distinguish this changeset.
 
@@ -90,6 +115,8 @@ class ChangeSet(object):
         self._provider = provider
         self.start_time = change.timestamp
         self.end_time = change.timestamp
+        self.commitid = change.commitid
+        self.branch = change.branch
         self.changes = [change]
 
     def get_provider(self):
@@ -124,6 +151,13 @@ class ChangeSet(object):
     def note(self, change):
         return self.provider.note(change, self)
 
+    def blobs(self):
+        """Return an iterator over the binary data of the files after
+        each change that doesn't delete a file, in order.
+        """
+        return self.provider.blobs(filter(lambda c: c.filestatus !=
+                                          FILE_DELETED, self.changes), self)
+
     def get_timestamp(self):
         # At first, this method returned start_time, but it makes more
         # sense to return end_time, which is when the last RCS change
@@ -152,9 +186,17 @@ class ChangeSet(object):
     filenames = property(get_filenames)
 
     def integrate(self, change):
-        if change.author != self.author or \
-           change.log != self.log or \
-           change.filename in self.filenames:
+        if change.branch != self.branch:
+            return False
+
+        if self.commitid or change.commitid:
+            if change.commitid != self.commitid:
+                return False
+        elif change.author != self.author or \
+             change.log != self.log:
+            return False
+
+        if change.filename in self.filenames:
             return False
 
         if change.timestamp < self.start_time:
@@ -174,6 +216,74 @@ class ChangeSet(object):
             (type(self).__name__, self.timestamp, self.author, changes,
              self.mark)
 
+class SnapshotChangeSet(ChangeSet):
+    """A changeset that represents the state of all files at a given
+    time.
+
+    A snapshot binds all changes up to its time, but only the last
+    change of each file is part of it, and files that were deleted by
+    their last change are left out:
+
+    >>> cs = SnapshotChangeSet(1303768300)
+    >>> c1 = Change(1303768245, "jack", "Add", FILE_ADDED,
+    ... "todo.txt", "1.1", "Exp", "")
+    >>> c2 = Change(1303768290, "jack", "Fix", FILE_MODIFIED,
+    ... "todo.txt", "1.2", "Exp", "")
+    >>> c3 = Change(1303768301, "jack", "Late", FILE_MODIFIED,
+    ... "todo.txt", "1.3", "Exp", "")
+    >>> cs.integrate(c2), cs.integrate(c1), cs.integrate(c3)
+    (True, True, False)
+    >>> [c.revision for c in cs.changes]
+    ['1.2']
+    >>> cs.timestamp
+    1303768300
+    >>> cs.log
+    'Snapshot of CVS as of 2011-04-25 21:51:40 UTC\\n'
+    """
+
+    snapshot = True
+
+    def __init__(self, timestamp, id=None, mark=None, provider=None):
+        self.id = id
+        self._mark = mark
+        self._provider = provider
+        self.start_time = timestamp
+        self.end_time = timestamp
+        self.commitid = None
+        self.branch = None
+        self.last_changes = {}
+
+    def get_changes(self):
+        return sorted(filter(lambda c: c.filestatus != FILE_DELETED,
+                             self.last_changes.values()),
+                      key=lambda c: c.filename)
+
+    def get_timestamp(self):
+        # The snapshot includes changes up to and including its time.
+        return self.end_time
+
+    def get_author(self):
+        return 'git-cvs'
+
+    def get_log(self):
+        return 'Snapshot of CVS as of %s\n' % \
+            time.strftime('%Y-%m-%d %H:%M:%S UTC',
+                          time.gmtime(self.end_time))
+
+    changes = property(get_changes)
+    timestamp = property(get_timestamp)
+    author = property(get_author)
+    log = property(get_log)
+
+    def integrate(self, change):
+        if change.timestamp > self.end_time or change.branch is not None:
+            return False
+
+        last = self.last_changes.get(change.filename)
+        if last is None or last.timestamp < change.timestamp:
+            self.last_changes[change.filename] = change
+        return True
+
 class ChangeSetGenerator(object):
     """Group a series of individual file changes into changesets that
     have likely been committed together.  The individual changes must
@@ -205,12 +315,19 @@ class ChangeSetGenerator(object):
         another ChangeSet `Y' and `Y.start_time - X.end_time >
         quiet_period`, i.e., after the complete ChangeSet there is at
         least one significantly younger one.
+
+        Changes with a commitid are grouped by looking up the open
+        ChangeSet with the same commitid.  Only changes without one are
+        grouped by author and log message.  The commitid does not tell
+        whether all files of a commit have been seen, though, so the
+        quiet period applies to all ChangeSets.
         """
 
         self.quiet_period = quiet_period
         self.limit = limit
         self.count = 0
         self.changesets = []
+        self.commitids = {}
 
     def integrate(self, change):
         """Integrate a single file change into the an appropriate
@@ -218,39 +335,97 @@ class ChangeSetGenerator(object):
         at least the "quiet period", relative to the given change."""
 
         # Yield changesets that have passed the "quiet period".
+        for cs in self.expire(change.timestamp):
+            yield(cs)
+
+        # Once the limit is reached, the change is left for the next
+        # run, like all changes after it.
+        if self.limit_reached():
+            return
+
+        # For all remaining changesets, try to find one that can
+        # integrate the change.  Otherwise, open a new changeset.
+        if change.commitid:
+            cs = self.commitids.get(change.commitid)
+            if cs is not None and cs.integrate(change):
+                return
+        else:
+            for cs in self.changesets:
+                if cs.commitid is None and cs.integrate(change):
+                    return
+        self.open(ChangeSet(change))
+
+    def open(self, changeset):
+        """Add 'changeset' to the open, possibly incomplete changesets.
+        """
+        self.changesets.append(changeset)
+        if changeset.commitid:
+            self.commitids[changeset.commitid] = changeset
+
+        # TODO: Is changeset ordering more stable with this?
+        #self.changesets.sort(key=lambda cs: cs.timestamp)
+
+    def limit_reached(self):
+        """Return True if as many changesets as the limit allows have
+        been yielded, after which no more changes are integrated.
+        """
+        return bool(self.limit) and self.count >= self.limit
+
+    def expire(self, timestamp):
+        """Yield changesets that haven't been modified for at least the
+        "quiet period" relative to 'timestamp', up to the limit (if one
+        was set), and retain all others.
+
+        Normally, 'timestamp' is that of the next change, but a caller
+        that watches a live CVS repository may pass the current time to
+        complete changesets without waiting for another commit.
+
+        >>> csg = ChangeSetGenerator(quiet_period=60)
+        >>> c = Change(1303768245, "jack", "Fix", FILE_MODIFIED,
+        ... "todo.txt", "1.2", "Exp", "")
+        >>> list(csg.integrate(c))
+        []
+        >>> list(csg.expire(1303768304))
+        []
+        >>> [cs.end_time for cs in csg.expire(1303768305)]
+        [1303768245]
+        >>> csg.changesets
+        []
+        """
+
         changesets = []
         count = self.count
-        for cs in self.changesets:
-            delta = change.timestamp - cs.end_time
+        for i, cs in enumerate(self.changesets):
+            if self.limit and count >= self.limit:
+                # The remaining changesets are neither scanned nor
+                # extended, since no more changes are integrated.
+                changesets.extend(self.changesets[i:])
+                break
+            delta = timestamp - cs.end_time
             if delta >= self.quiet_period:
-                if self.limit and count >= self.limit:
-                    return
                 count += 1
+                if self.commitids.get(cs.commitid) is cs:
+                    del self.commitids[cs.commitid]
                 yield(cs)
             else:
                 changesets.append(cs)
         self.changesets = changesets
         self.count = count
 
-        # For all remaining changesets, try to find one that can
-        # integrate the change.  Otherwise, open a new changeset.
-        for cs in self.changesets:
-            if cs.integrate(change):
-                return
-        self.changesets.append(ChangeSet(change))
-
-        # TODO: Is changeset ordering more stable with this?
-        #self.changesets.sort(key=lambda cs: cs.timestamp)
-
     def flush(self):
         """Yield remaining changesets up to the limit (if one was set),
         even potentially incomplete ones."""
 
+        changesets = []
         count = self.count
         for cs in self.changesets:
             if self.limit and count >= self.limit:
-                return
+                changesets.append(cs)
+                continue
             count += 1
             yield(cs)
-        self.changesets = []
+        self.changesets = changesets
+        self.commitids = dict(map(lambda cs: (cs.commitid, cs),
+                                  filter(lambda cs: cs.commitid,
+                                         changesets)))
         self.count = count
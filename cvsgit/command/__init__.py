@@ -0,0 +1,23 @@
+"""Subcommands of 'git-cvs'.
+
+Each command is implemented by a class in the module of this package
+that is named after the command.  The registry below maps command
+names to class names, so that the command line interface can find a
+command without scanning this package or importing any other command
+module.
+"""
+
+commands = {
+    'clone': 'Clone',
+    'dump-changes': 'DumpChanges',
+    'fetch': 'fetch',
+    'fetch-changes': 'FetchChanges',
+    'gc': 'gc',
+    'init': 'init',
+    'pull': 'pull',
+    'pull-all': 'pull_all',
+    'rcsdump': 'Rcsdump',
+    'search': 'search',
+    'verify': 'Verify',
+    'watch': 'watch',
+}
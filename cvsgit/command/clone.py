@@ -6,6 +6,7 @@ import shutil
 from cvsgit.main import Command, Conduit
 from cvsgit.i18n import _
 from cvsgit.command.verify import Verify
+from cvsgit.utils import parse_date
 
 class Clone(Command):
     __doc__ = _(
@@ -15,9 +16,21 @@ class Clone(Command):
 
     Clones an entire CVS repository or a module into a Git repository.
     The source argument <repository> must be a local path pointing at
-    the CVS repository root or a module directory within.  The
-    destination argument <directory> is selected automatically, based
-    on the last component of the source path.
+    the CVS repository root or a module directory within.  It can also
+    be such a path within an uncompressed tar or a zip archive, as in
+    "/var/tmp/cvs.tar/cvs/src", which is read without extracting it.
+    The destination argument <directory> is selected automatically,
+    based on the last component of the source path.
+
+    With -D, the history starts with a single commit that contains
+    every file as of DATE, whose fulltexts are extracted in parallel
+    with --jobs.
+    Only later changes are grouped into individual commits.
+
+    With --depth, only the last N changesets are imported as individual
+    commits, after a single commit with the state of all files before
+    them.  The remaining history can be imported later with "git-cvs
+    fetch --unshallow" without parsing the RCS files again.
     """)
 
     def initialize_options(self):
@@ -27,17 +40,32 @@ class Clone(Command):
             _("Create a bare Git repository without work tree."))
         self.add_option('--limit', type='int', metavar='COUNT', help=\
             _("Stop importing after COUNT new commits."))
+        self.add_option('-D', '--date', metavar='DATE', help=\
+            _("Start with a snapshot of all files as of DATE, given as "
+              "\"YYYY-MM-DD [HH:MM[:SS]]\" in UTC or as @SECONDS."))
+        self.add_option('--depth', type='int', metavar='N', help=\
+            _("Import only the last N changesets after a snapshot of "
+              "all files before them."))
         self.add_option('--domain', metavar='DOMAIN', help=\
             _("Set the e-mail domain to use for unknown authors."))
+        self.add_path_filter_options()
+        self.add_branches_option()
+        self.add_tags_option()
         self.add_option('--verify', action='store_true', help=\
             _("Run the verify command after cloning (does not work "
               "with --bare)."))
         self.add_option('--no-repack', action='store_true', help=\
             _("Don't run \"git repack -adF\" after cloning (so you "
               "end up with an uncompressed pack file)."))
+        self.add_option('--staging-limit', type='int', metavar='MIB',
+                        default=512, help=\
+            _("Keep the meta database in memory until it grows beyond "
+              "MIB mebibytes, 0 to write it to disk right away "
+              "(default: %default)."))
         self.add_quiet_option()
         self.add_verbose_option()
         self.add_no_skip_latest_option()
+        self.add_jobs_option()
         self.add_authors_option()
         self.add_stop_on_unknown_author_option()
 
@@ -53,17 +81,36 @@ class Clone(Command):
             self.usage_error(_('too many arguments'))
 
         self.finalize_authors_option()
+        self.finalize_jobs_option()
+
+        self.snapshot = None
+        if self.options.date:
+            try:
+                self.snapshot = parse_date(self.options.date)
+            except ValueError, e:
+                self.usage_error(str(e))
+
+        if self.options.depth is not None and self.options.depth < 1:
+            self.usage_error(_('--depth must be a positive number'))
+
+        if self.options.staging_limit < 0:
+            self.usage_error(_('--staging-limit must not be negative'))
 
     def run(self):
         if os.path.exists(self.directory):
             self.fatal(_("destination path '%s' already exists") % \
                        self.directory)
 
-        conduit = Conduit(self.directory)
+        conduit = Conduit(self.directory, staging_limit=\
+                              self.options.staging_limit * 1024 * 1024)
         conduit.init(self.repository,
                      bare=self.options.bare,
                      domain=self.options.domain,
-                     quiet=self.options.quiet)
+                     quiet=self.options.quiet,
+                     include=self.options.include,
+                     exclude=self.options.exclude,
+                     branches=self.options.branches,
+                     tags=self.options.tags)
         try:
             conduit.fetch(limit=self.options.limit,
                           quiet=self.options.quiet,
@@ -71,7 +118,10 @@ class Clone(Command):
                           flush=self.options.no_skip_latest,
                           authors=self.options.authors,
                           stop_on_unknown_author=\
-                              self.options.stop_on_unknown_author)
+                              self.options.stop_on_unknown_author,
+                          jobs=self.options.jobs,
+                          snapshot=self.snapshot,
+                          depth=self.options.depth)
 
             git = conduit.git
 
@@ -1,33 +1,99 @@
 """Command to dump changes fetched from CVS."""
 
-import re
-import subprocess
-from subprocess import PIPE
+import json
 import sys
 
-from cvsgit.cvs import split_cvs_source
 from cvsgit.i18n import _
 from cvsgit.main import Command, Conduit
-from cvsgit.utils import Tempdir, stripnl
-from cvsgit.term import NoProgress, Progress
+from cvsgit.utils import parse_date, tsv_escape
+
+# Fields of a change in the order of the TSV output.
+FIELDS = ['timestamp', 'author', 'filestatus', 'filename', 'revision',
+          'state', 'mode', 'commitid', 'branch', 'log']
 
 class DumpChanges(Command):
     __doc__ = _(
     """Dump changes fetched from CVS
 
-    Usage: %prog
+    Usage: %prog [options]
+
+    Dumps the previously fetched changes from the CVS repository in
+    the order of their timestamps, optionally only those matching all
+    of the given filters.
 
-    Dumps all previously fetched changes from the CVS repository.
+    With --format=json, each change is written as a JSON object on a
+    line of its own.  With --format=tsv, each change is written as a
+    line of tab-separated fields (timestamp, author, filestatus,
+    filename, revision, state, mode, commitid, branch and log) in
+    which backslash, tab and newline characters are escaped.
     """)
 
     def initialize_options(self):
-        pass
+        self.add_option('--author', action='append', metavar='LOGIN',
+                        help=_("Only dump changes committed by LOGIN. "
+                               "This option can be given more than once."))
+        self.add_option('--path', metavar='PREFIX', help=\
+            _("Only dump changes of files whose name starts with PREFIX."))
+        self.add_option('--since', metavar='DATE', help=\
+            _("Only dump changes made at or after DATE, given as "
+              "\"YYYY-MM-DD [HH:MM[:SS]]\" in UTC or as @SECONDS."))
+        self.add_option('--until', metavar='DATE', help=\
+            _("Only dump changes made at or before DATE."))
+        self.add_option('--processed', action='store_true', help=\
+            _("Only dump changes that belong to a changeset."))
+        self.add_option('--unprocessed', action='store_true', help=\
+            _("Only dump changes that don't belong to a changeset yet."))
+        self.add_option('--format', type='choice',
+                        choices=['text', 'json', 'tsv'], default='text',
+                        help=_("Output format: text, json or tsv "
+                               "(default: %default)."))
 
     def finalize_options(self):
         if len(self.args) > 0:
             self.usage_error(_('too many arguments'))
 
+        if self.options.processed and self.options.unprocessed:
+            self.usage_error(_('--processed and --unprocessed are '
+                               'mutually exclusive'))
+        elif self.options.processed:
+            self.processed = True
+        elif self.options.unprocessed:
+            self.processed = False
+        else:
+            self.processed = None
+
+        try:
+            self.min_time = self.options.since and \
+                parse_date(self.options.since)
+            self.max_time = self.options.until and \
+                parse_date(self.options.until)
+        except ValueError, e:
+            self.usage_error(str(e))
+
+        if self.options.path:
+            self.prefix = self.options.path.decode('utf-8')
+        else:
+            self.prefix = None
+
     def run(self):
         cvs = Conduit().cvs
-        for change in cvs.changes():
-            print change
+        # The changes are only read, so they can be streamed from a
+        # single cursor instead of being copied to a temporary table.
+        changes = cvs.changes(processed=self.processed, reentrant=False,
+                              min_time=self.min_time,
+                              max_time=self.max_time,
+                              authors=self.options.author,
+                              prefix=self.prefix)
+        format = self.options.format
+        for change in changes:
+            values = map(lambda f: getattr(change, f), FIELDS)
+            if format == 'json':
+                line = json.dumps(dict(zip(FIELDS, values)), sort_keys=True)
+            elif format == 'tsv':
+                line = u'\t'.join(map(tsv_escape, values))
+            else:
+                line = unicode(change)
+            sys.stdout.write(line.encode('utf-8') + '\n')
+
+if __name__ == '__main__':
+    DumpChanges()
@@ -5,7 +5,6 @@ import subprocess
 from subprocess import PIPE
 import sys
 
-from cvsgit.cvs import split_cvs_source
 from cvsgit.i18n import _
 from cvsgit.main import Command, Conduit
 from cvsgit.utils import Tempdir, stripnl
@@ -23,11 +22,14 @@ class FetchChanges(Command):
 
     def initialize_options(self):
         self.add_quiet_option()
+        self.add_changes_from_option()
 
     def finalize_options(self):
         if len(self.args) > 0:
             self.usage_error(_('too many arguments'))
 
+        self.finalize_changes_from_option()
+
         if self.options.quiet:
             self.progress = NoProgress()
         else:
@@ -36,4 +38,5 @@ class FetchChanges(Command):
     def run(self):
         conduit = Conduit()
         cvs = conduit.cvs
-        cvs.fetch_changes(progress=self.progress)
+        cvs.fetch_changes(progress=self.progress,
+                          changelist=self.options.changes_from)
@@ -12,6 +12,10 @@ class fetch(Command):
 
     Fetches unfetched changes from the CVS repository we are tracking,
     merges them into related changesets and imports them into Git.
+
+    With --unshallow, the history left out by "git-cvs clone --depth"
+    is imported first and grafted onto the tracking branch in place of
+    its snapshot commit using "git replace".
     """)
 
     def initialize_options(self):
@@ -21,6 +25,10 @@ class fetch(Command):
             _("Only report error and warning messages."))
         self.add_option('--verbose', action='store_true', help=\
             _("Display each changeset as it is imported."))
+        self.add_option('--unshallow', action='store_true', help=\
+            _("Import the history left out by a shallow clone."))
+        self.add_changes_from_option()
+        self.add_jobs_option()
         self.add_authors_option()
         self.add_stop_on_unknown_author_option()
 
@@ -29,15 +37,25 @@ class fetch(Command):
             self.usage_error(_('too many arguments'))
 
         self.finalize_authors_option()
+        self.finalize_jobs_option()
+        self.finalize_changes_from_option()
 
     def run(self):
         conduit = Conduit()
+        if self.options.unshallow:
+            conduit.unshallow(quiet=self.options.quiet,
+                              verbose=self.options.verbose,
+                              authors=self.options.authors,
+                              stop_on_unknown_author=\
+                                  self.options.stop_on_unknown_author)
         conduit.fetch(limit=self.options.limit,
                       quiet=self.options.quiet,
                       verbose=self.options.verbose,
                       authors=self.options.authors,
                       stop_on_unknown_author=\
-                          self.options.stop_on_unknown_author)
+                          self.options.stop_on_unknown_author,
+                      jobs=self.options.jobs,
+                      changelist=self.options.changes_from)
 
 if __name__ == '__main__':
     fetch()
@@ -0,0 +1,51 @@
+"""Command to compact the meta database."""
+
+import os.path
+
+from cvsgit.main import Command, Conduit
+from cvsgit.i18n import _
+
+class gc(Command):
+    __doc__ = _(
+    """Compact the meta database.
+
+    Usage: %prog [options]
+
+    Drops the log messages and commit ids of changes that have been
+    imported already, except for one log message per changeset that
+    the "search" command reports.  The revisions themselves are kept,
+    so that fetch still knows which ones were imported.  The stat()
+    information of RCS files that no longer exist is dropped as well,
+    and the log messages that are still stored uncompressed are
+    compressed.
+    Finally, the database file is rebuilt with VACUUM and its query
+    planner statistics are updated with ANALYZE.
+
+    After this, "dump-changes --processed" shows empty log messages
+    for most changes.
+    """)
+
+    def initialize_options(self):
+        self.add_quiet_option()
+
+    def finalize_options(self):
+        if len(self.args) > 0:
+            self.usage_error(_('too many arguments'))
+
+    def run(self):
+        conduit = Conduit()
+        filename = os.path.join(conduit.git.git_dir, 'cvsgit.db')
+        if os.path.isfile(filename):
+            size = os.path.getsize(filename)
+        else:
+            size = 0
+        changes, paths, logs = conduit.gc(quiet=self.options.quiet)
+        if not self.options.quiet:
+            print _('%d changes compacted, %d stale paths pruned, '
+                    '%d log messages compressed, '
+                    'database size %d KiB -> %d KiB') % \
+                (changes, paths, logs, size / 1024,
+                 os.path.getsize(filename) / 1024)
+
+if __name__ == '__main__':
+    gc()
@@ -21,6 +21,10 @@ class init(Command):
 
     If 'directory' is omitted, the current working directory will be
     initialized instead of the one specified.
+
+    With --include and --exclude, only the matching part of the module
+    is scanned and imported.  Patterns are matched against paths
+    relative to the module directory.
     """)
 
     def initialize_options(self):
@@ -33,6 +37,9 @@ class init(Command):
               "authors."))
         self.add_option('--quiet', action='store_true', help=\
             _("Only print error and warning messages."))
+        self.add_path_filter_options()
+        self.add_branches_option()
+        self.add_tags_option()
 
     def finalize_options(self):
         if len(self.args) < 1:
@@ -51,7 +58,11 @@ class init(Command):
         conduit.init(self.repository,
                      domain=self.options.domain,
                      bare=self.options.bare,
-                     quiet=self.options.quiet)
+                     quiet=self.options.quiet,
+                     include=self.options.include,
+                     exclude=self.options.exclude,
+                     branches=self.options.branches,
+                     tags=self.options.tags)
 
 if __name__ == '__main__':
     init()
@@ -0,0 +1,94 @@
+"""Command to pull changes from CVS into many Git repositories."""
+
+import time
+
+from cvsgit.main import Command
+from cvsgit.i18n import _
+from cvsgit.term import NoProgress, Progress
+
+class pull_all(Command):
+    __doc__ = _(
+    """Update many CVS tracking repositories in one go.
+
+    Usage: %prog [options] <list>
+
+    Does what the "pull" command does for each of the git-cvs
+    repositories listed in the file <list> ("-" for standard input),
+    one directory per line.  Repositories with changesets waiting to
+    be imported are updated first, then the ones that have not been
+    updated for the longest time.
+
+    The repositories are updated by a shared pool of worker processes
+    and the number of RCS files parsed at once can be limited for all
+    of them together, so that they don't compete for disk I/O.  A
+    report of all repositories is printed at the end.
+    """)
+
+    def initialize_options(self):
+        self.add_option('--jobs', type='int', metavar='N', default=1,
+                        help=_("Update N repositories at a time "
+                               "(default: %default)."))
+        self.add_option('--parse-jobs', type='int', metavar='N', help=\
+            _("Parse at most N RCS files at a time in all repositories "
+              "together."))
+        self.add_quiet_option()
+        self.add_no_skip_latest_option()
+        self.add_authors_option()
+        self.add_stop_on_unknown_author_option()
+
+    def finalize_options(self):
+        if len(self.args) < 1:
+            self.usage_error(_('missing list of repositories'))
+        elif len(self.args) > 1:
+            self.usage_error(_('too many arguments'))
+
+        self.finalize_authors_option()
+        self.finalize_jobs_option()
+        if self.options.parse_jobs is not None and \
+                self.options.parse_jobs < 1:
+            self.usage_error(_('--parse-jobs must be a positive number'))
+
+    def run(self):
+        # Imported here, so that "--help" doesn't load multiprocessing
+        # and rcsparse.
+        import cvsgit.batch
+        directories = cvsgit.batch.read_conduit_list(self.args[0])
+        if self.options.quiet:
+            progress = NoProgress()
+        else:
+            progress = Progress()
+
+        start_time = time.time()
+        results = []
+        with progress:
+            progress(_('Updating repositories'), 0, len(directories))
+            for result in cvsgit.batch.pull_all(directories,
+                    jobs=self.options.jobs,
+                    parse_jobs=self.options.parse_jobs,
+                    flush=self.options.no_skip_latest,
+                    authors=self.options.authors,
+                    stop_on_unknown_author=\
+                        self.options.stop_on_unknown_author):
+                results.append(result)
+                progress(_('Updating repositories'), len(results),
+                         len(directories))
+
+        returncode = 0
+        for result in results:
+            if result.error is not None:
+                self.error('%s: %s' % (result.directory, result.error))
+                returncode = 1
+            elif not self.options.quiet:
+                print _('%s: %d new commits in %.1fs') % \
+                    (result.directory, result.commits, result.elapsed)
+
+        if not self.options.quiet:
+            failed = len(filter(lambda r: r.error is not None, results))
+            print _('%d repositories updated, %d failed, %d new commits '
+                    'in %.1fs') % (len(results) - failed, failed,
+                                   sum(map(lambda r: r.commits, results)),
+                                   time.time() - start_time)
+        return returncode
+
+if __name__ == '__main__':
+    pull_all()
@@ -26,6 +26,8 @@ class pull(Command):
               "a fresh CVS checkout (does not work in a bare "
               "repository.)"))
         self.add_no_skip_latest_option()
+        self.add_changes_from_option()
+        self.add_jobs_option()
         self.add_authors_option()
         self.add_stop_on_unknown_author_option()
 
@@ -34,6 +36,8 @@ class pull(Command):
             self.usage_error(_('too many arguments'))
 
         self.finalize_authors_option()
+        self.finalize_jobs_option()
+        self.finalize_changes_from_option()
 
     def run(self):
         conduit = Conduit()
@@ -43,7 +47,9 @@ class pull(Command):
                      flush=self.options.no_skip_latest,
                      authors=self.options.authors,
                      stop_on_unknown_author=\
-                         self.options.stop_on_unknown_author)
+                         self.options.stop_on_unknown_author,
+                     jobs=self.options.jobs,
+                     changelist=self.options.changes_from)
 
         # Optionally verify the new HEAD revision and work tree
         # against a fresh CVS checkout.
@@ -3,12 +3,8 @@
 import os
 
 from cvsgit.main import Command
-from cvsgit.rcs import RCSFile
 from cvsgit.i18n import _
 
-# FIXME: RCS should expand keywords, not CVS
-from cvsgit.cvs import CVS
-
 class Rcsdump(Command):
     __doc__ = _(
     """Dump all changes on the HEAD branch of an RCS file.
@@ -32,6 +28,8 @@ class Rcsdump(Command):
             self.usage_error(_('too many arguments'))
 
     def run(self):
+        # Imported here, so that "--help" doesn't load rcsparse.
+        from cvsgit.rcs import RCSFile
         rcsfile = RCSFile(self.rcsfile)
 
         if self.options.checkout:
@@ -47,6 +45,8 @@ class Rcsdump(Command):
             rcsfile._print_revision(change.revision)
 
     def checkout(self, rcsfile, revision):
+        # FIXME: RCS should expand keywords, not CVS
+        from cvsgit.cvs import CVS
         change = rcsfile.change(revision)
         blob = rcsfile.blob(revision)
         cvs = CVS(os.path.join(os.path.dirname(rcsfile.filename)), None)
@@ -0,0 +1,49 @@
+"""Command to find imported changesets by their log message."""
+
+import time
+
+from cvsgit.main import Command, Conduit
+from cvsgit.i18n import _
+
+class search(Command):
+    __doc__ = _(
+    """Find imported changesets by their CVS log message.
+
+    Usage: %prog [options] <query>...
+
+    Lists the Git commits of the changesets whose log message matches
+    <query>, newest first, with their date, author and the first line
+    of the message.  All words of the query have to occur in a log
+    message.  A quoted phrase, prefix* and OR can be used as in SQLite
+    full-text queries.  The exit code is 1 if no changeset matches.
+    """)
+
+    def initialize_options(self):
+        self.add_option('--limit', type='int', metavar='COUNT', help=\
+            _("Show at most COUNT changesets."))
+
+    def finalize_options(self):
+        if len(self.args) < 1:
+            self.usage_error(_('missing query'))
+        if self.options.limit is not None and self.options.limit < 1:
+            self.usage_error(_('--limit must be a positive number'))
+
+    def run(self):
+        import sqlite3
+        query = ' '.join(self.args)
+        try:
+            results = Conduit().cvs.search_changesets(
+                query, limit=self.options.limit)
+        except sqlite3.OperationalError, e:
+            self.error(_('invalid query: %s') % e)
+            return 2
+
+        for commit, timestamp, author, log in results:
+            print '%s %s %s %s' % (commit, time.strftime('%Y-%m-%d',
+                time.gmtime(timestamp)), author, log.split('\n', 1)[0])
+        if len(results) == 0:
+            return 1
+        return 0
+
+if __name__ == '__main__':
+    search()
@@ -1,12 +1,13 @@
 """Command to compare a Git tree against CVS."""
 
 import os
+import random
 import re
 import subprocess
 from subprocess import PIPE
 import sys
+import time
 
-from cvsgit.cvs import split_cvs_source
 from cvsgit.git import GitCommandError
 from cvsgit.i18n import _
 from cvsgit.main import Command, Conduit
@@ -20,6 +21,20 @@ class Verify(Command):
 
     Compares the work tree against a clean checkout from CVS with the
     same timestamp as the HEAD commit.
+
+    With --blobs, the tree of the HEAD commit is instead compared with
+    blob hashes computed directly from the RCS files, which neither
+    needs a work tree nor the "cvs" and "diff" commands.  This is the
+    default in a bare repository, if cvs.include or cvs.exclude is
+    set and if the CVS repository is read from an archive.
+
+    With --sample or --budget, a random sample of files from the whole
+    history is verified that way instead.  Recent commits, binary files
+    and files with RCS keywords are more likely to be chosen.  The same
+    seed and HEAD always select the same sample.
+
+    With --jobs, the history is split into ranges of commits that are
+    verified by blob hash in several worker processes.
     """)
 
     def initialize_options(self):
@@ -32,17 +47,52 @@ class Verify(Command):
             _("Skip the first verification step and move HEAD "
               "backward instead, the opposite direction with "
               "--forward)."))
+        self.add_option('--blobs', action='store_true', help=\
+            _("Compare blob hashes computed from the RCS files "
+              "instead of checking out from CVS."))
+        self.add_option('--sample', type='int', metavar='N', help=\
+            _("Verify a random sample of N files from the history."))
+        self.add_option('--budget', type='float', metavar='SECONDS',
+                        help=_("Verify random samples for about SECONDS "
+                               "seconds."))
+        self.add_option('--seed', metavar='SEED', help=\
+            _("Seed for choosing the sample (default: the HEAD "
+              "commit)."))
+        self.add_option('--jobs', type='int', metavar='N', default=1,
+                        help=_("Verify the history by blob hash in N "
+                               "worker processes (default: %default)."))
         self.add_option('--quiet', action='store_true', help=\
             _("Only report error and warning messages."))
 
     def finalize_options(self):
         if len(self.args) > 0:
             self.usage_error(_('too many arguments'))
+        self.finalize_jobs_option()
+        if self.options.sample is not None and self.options.sample < 1:
+            self.usage_error(_('--sample must be a positive number'))
+        if self.options.budget is not None and self.options.budget <= 0:
+            self.usage_error(_('--budget must be a positive number'))
+        if (self.options.sample or self.options.budget) and \
+                (self.options.history or self.options.forward or
+                 self.options.skip):
+            self.usage_error(_('--sample and --budget cannot be combined '
+                               'with --history, --forward or --skip'))
 
     def run(self):
+        # Imported here, so that "--help" doesn't load rcsparse.
+        from cvsgit.cvs import split_cvs_source
         conduit = Conduit()
-        self.cvsroot, self.module = split_cvs_source(conduit.source)
         self.git = git = conduit.git
+        if self.options.sample or self.options.budget:
+            return self._run_sample(conduit)
+        # "cvs checkout" can't apply cvs.include and cvs.exclude, nor
+        # read from an archive.
+        if self.options.blobs or self.options.jobs > 1 or \
+                git.is_bare() or conduit.pathfilter or \
+                not os.path.isdir(conduit.source):
+            return self._run_blobs(conduit)
+        self.cvsroot, self.module = split_cvs_source(conduit.source)
+
         with Tempdir() as tempdir:
             self.tempdir = tempdir
 
@@ -102,6 +152,98 @@ class Verify(Command):
             returncode = 1
         return returncode
 
+    def _run_blobs(self, conduit):
+        """Verify the commits selected by the command-line options in
+        the repository itself.  The work tree and HEAD are left alone.
+
+        With --history, only the first commit is verified in full and
+        each later one incrementally, so the commits are always
+        verified from the oldest to the newest.
+        """
+        if self.options.forward:
+            head = self.git.rev_parse(self.commit)
+            commits = [head] + self.git.rev_list(
+                '--reverse', '%s..%s' % (head, conduit.branch)).split()
+        elif self.options.history:
+            commits = self.git.rev_list(self.commit).split()
+        else:
+            commits = [self.git.rev_parse(self.commit)]
+        if self.options.skip:
+            commits = commits[1:]
+        if not self.options.history:
+            commits = commits[:1]
+
+        if len(commits) == 0:
+            return 0
+
+        from cvsgit.verify import TreeVerifier, verify_history_parallel
+        verifier = TreeVerifier(conduit.cvs)
+        if self.options.history:
+            # Walk forward from the oldest commit and only verify the
+            # files touched since the previous commit.
+            if not self.options.forward:
+                commits.reverse()
+            if self.options.jobs > 1:
+                results = verify_history_parallel(conduit.cvs, self.git,
+                                                  commits, self.options.jobs)
+            else:
+                results = verifier.verify_history(self.git, commits[0],
+                                                  commits[-1])
+        else:
+            timestamp = self.git.commit_timestamp(commits[0])
+            results = [(commits[0], timestamp,
+                        verifier.verify(self.git.ls_tree(commits[0]),
+                                        timestamp))]
+
+        for commit, timestamp, mismatches in results:
+            if not self.options.quiet:
+                print "(%s) %s" % (commit[:7], time.strftime(
+                        '%Y-%m-%d %H:%M:%S UTC', time.gmtime(timestamp)))
+            for filename, message in mismatches:
+                sys.stdout.write('%s: %s\n' % (filename, message))
+            if len(mismatches) > 0:
+                return 1
+        return 0
+
+    def _run_sample(self, conduit):
+        """Verify a random sample of files from the history of HEAD
+        and report the coverage.
+        """
+        commits = self.git.rev_list(self.commit).split()
+        seed = self.options.seed
+        if seed is None:
+            seed = commits[0]
+        if not self.options.quiet:
+            print _("Sampling with seed %s") % seed
+
+        from cvsgit.verify import TreeVerifier
+        verifier = TreeVerifier(conduit.cvs)
+        returncode = 0
+        covered = set()
+        kinds = {}
+        count = 0
+        for commit, timestamp, filename, mismatches in \
+                verifier.verify_sample(self.git, commits, random.Random(seed),
+                                       count=self.options.sample,
+                                       budget=self.options.budget):
+            count += 1
+            covered.add(commit)
+            if verifier.expected_file(filename, timestamp) is not None:
+                kind = verifier.file_kind(filename)
+                kinds[kind] = kinds.get(kind, 0) + 1
+            for filename, message in mismatches:
+                sys.stdout.write('(%s) %s: %s\n' % \
+                                     (commit[:7], filename, message))
+                returncode = 1
+
+        if not self.options.quiet:
+            print _("Verified %d files in %d of %d commits (%.1f%%): "
+                    "%d binary, %d with keywords") % \
+                    (count, len(covered), len(commits),
+                     100.0 * len(covered) / max(len(commits), 1),
+                     kinds.get('binary', 0), kinds.get('keywords', 0))
+        return returncode
+
     def commit_date(self, commit):
         """Get the commit date as a string in UTC timezone.
         """
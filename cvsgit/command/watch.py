@@ -0,0 +1,50 @@
+"""Command to import changesets from CVS continuously."""
+
+from cvsgit.main import Command, Conduit
+from cvsgit.i18n import _
+
+class watch(Command):
+    __doc__ = _(
+    """Import new changesets from CVS as soon as they are complete.
+
+    Usage: %prog [options]
+
+    Stays resident and imports changesets into the CVS tracking branch
+    once they haven't been modified for the quiet period.  The stat()
+    cache, the meta database and potentially incomplete changesets are
+    kept in memory between scans.  Modified RCS files are noticed
+    through inotify if pyinotify is installed; otherwise, the
+    repository is rescanned periodically.
+
+    In a bare repository, the master branch is updated as well.
+    """)
+
+    def initialize_options(self):
+        self.add_option('--interval', type='int', metavar='SECONDS',
+                        default=60, help=\
+            _("Rescan the CVS repository every SECONDS seconds if "
+              "inotify is unavailable (default: %default)."))
+        self.add_quiet_option()
+        self.add_verbose_option()
+        self.add_authors_option()
+        self.add_stop_on_unknown_author_option()
+
+    def finalize_options(self):
+        if len(self.args) > 0:
+            self.usage_error(_('too many arguments'))
+        if self.options.interval <= 0:
+            self.usage_error(_('--interval must be a positive number'))
+
+        self.finalize_authors_option()
+
+    def run(self):
+        conduit = Conduit()
+        conduit.watch(interval=self.options.interval,
+                      quiet=self.options.quiet,
+                      verbose=self.options.verbose,
+                      authors=self.options.authors,
+                      stop_on_unknown_author=\
+                          self.options.stop_on_unknown_author)
+
+if __name__ == '__main__':
+    watch()
@@ -0,0 +1,76 @@
+"""Compression of short texts with a shared preset dictionary."""
+
+import zlib
+
+# Deflate can refer back at most 32 KiB, so a larger dictionary would
+# not help.
+MAX_DICTIONARY_SIZE = 32 * 1024
+
+def train_dictionary(texts, size=MAX_DICTIONARY_SIZE):
+    """Return a preset dictionary of at most 'size' bytes for texts
+    like those in 'texts', made of the words and then the lines that
+    occur in more than one of them.  The most frequent ones come last,
+    where deflate can refer to them most cheaply.
+
+    >>> train_dictionary(['Update to 1.2\\nok sthen@\\n',
+    ...                   'Update to 1.3\\nok sthen@\\n',
+    ...                   'Fix build\\n'])
+    'Update ok sthen@ to ok sthen@\\n'
+    """
+    lines = {}
+    words = {}
+    for text in set(texts):
+        for line in set(text.splitlines(True)):
+            lines[line] = lines.get(line, 0) + 1
+        for word in set(text.split()):
+            words[word] = words.get(word, 0) + 1
+
+    def common(counts, separator):
+        keys = filter(lambda k: counts[k] > 1, counts.keys())
+        keys.sort(key=lambda k: (counts[k], k))
+        return map(lambda k: k + separator, keys)
+
+    dictionary = ''
+    for part in reversed(common(words, ' ') + common(lines, '')):
+        if len(dictionary) + len(part) > size:
+            break
+        dictionary = part + dictionary
+    return dictionary
+
+class DictCompressor(object):
+    """Compress and decompress short texts with a preset dictionary.
+
+    Python 2's zlib module can't set a preset dictionary, so the
+    dictionary is compressed once as the start of a raw deflate stream
+    and each text is compressed as the continuation of a copy of that
+    stream.  Only the continuation is returned.
+
+    >>> c = DictCompressor('Update to ok sthen@\\n')
+    >>> data = c.compress('Update to 1.4\\n\\nok sthen@\\n')
+    >>> len(data) < len(zlib.compress('Update to 1.4\\n\\nok sthen@\\n'))
+    True
+    >>> c.decompress(data)
+    'Update to 1.4\\n\\nok sthen@\\n'
+    >>> DictCompressor('Update to ok sthen@\\n').decompress(data)
+    'Update to 1.4\\n\\nok sthen@\\n'
+    """
+
+    def __init__(self, dictionary):
+        self.dictionary = dictionary[-MAX_DICTIONARY_SIZE:]
+        self._compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        prefix = self._compressor.compress(self.dictionary) + \
+            self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self._decompressor = zlib.decompressobj(-15)
+        self._decompressor.decompress(prefix)
+
+    def compress(self, data):
+        """Return 'data' compressed.
+        """
+        compressor = self._compressor.copy()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        """Return the original of the compressed 'data'.
+        """
+        decompressor = self._decompressor.copy()
+        return decompressor.decompress(data) + decompressor.flush()
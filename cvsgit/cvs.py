@@ -1,20 +1,34 @@
 """CVS interface for CVSGit."""
 
+import multiprocessing
 import os.path
 import re
 import time
 
+from collections import deque
+from contextlib import contextmanager
+from fnmatch import fnmatchcase
+from itertools import imap
+from signal import signal, SIGTERM, SIG_DFL
 from subprocess import Popen, PIPE
 
-from cvsgit.changeset import ChangeSetGenerator, FILE_DELETED
-from cvsgit.rcs import RCSFile
+from cvsgit.changeset import ChangeSetGenerator, SnapshotChangeSet, \
+    FILE_DELETED
+from cvsgit.meta import MetaDb
+from cvsgit.pathfilter import PathFilter
+from cvsgit.rcs import REV_TIMESTAMP
+from cvsgit.source import DirectorySource, open_source
 from cvsgit.i18n import _
-from cvsgit.term import NoProgress
+from cvsgit.term import NoProgress, pause_progress
 from cvsgit.utils import stripnl
 
-def split_cvs_source(dirname):
-    """Split <dirname> into CVSROOT and module paths.
+def split_cvs_source(dirname, source=None):
+    """Split <dirname> into CVSROOT and module paths.  'source' is the
+    DirectorySource or ArchiveSource that contains <dirname>, by
+    default the filesystem.
     """
+    if source is None:
+        source = DirectorySource()
     cvsroot = dirname
     module = ''
     while True:
@@ -22,7 +36,7 @@ def split_cvs_source(dirname):
         if cvsroot == parent:
             raise TypeError, _('not a CVS repository path (%s): %s') \
                 % (_('no CVSROOT within nor above'), dirname)
-        if os.path.isdir(os.path.join(cvsroot, 'CVSROOT')):
+        if source.isdir(os.path.join(cvsroot, 'CVSROOT')):
             return (cvsroot, module,)
         if module == '':
             module = os.path.basename(cvsroot)
@@ -30,15 +44,102 @@ def split_cvs_source(dirname):
             module = os.path.join(os.path.basename(cvsroot), module)
         cvsroot = parent
 
+# Semaphore shared by several processes that parse RCS files, if the
+# number of files parsed at once should be limited (see pull_all in
+# cvsgit.batch).
+_parse_semaphore = None
+
+def limit_parse_concurrency(semaphore):
+    """Parse RCS files only while holding 'semaphore', which must be a
+    multiprocessing.Semaphore shared with the other processes, or
+    without limit if it is None.  Worker processes inherit it.
+    """
+    global _parse_semaphore
+    _parse_semaphore = semaphore
+
+@contextmanager
+def _parse_slot():
+    if _parse_semaphore is None:
+        yield
+    else:
+        with _parse_semaphore:
+            yield
+
+def _generate_window_changesets(args):
+    """Group the free changes in one window of time (as returned by
+    MetaDb.change_windows) into changesets in a worker process.
+
+    Returns the number of changes processed and the list of changesets.
+    """
+    filename, quiet_period, after, until, min_time, max_time = args
+    metadb = MetaDb(filename)
+    csg = ChangeSetGenerator(quiet_period=quiet_period)
+    changesets = []
+    count = 0
+    for change in metadb.changes_by_timestamp(processed=False,
+                                              reentrant=False,
+                                              after=after, until=until,
+                                              min_time=min_time,
+                                              max_time=max_time):
+        count += 1
+        changesets.extend(csg.integrate(change))
+    # The window ends with a gap longer than the quiet period, so all
+    # remaining changesets are complete.
+    changesets.extend(csg.flush())
+    return count, changesets
+
+# Minimum number of files in a changeset for which the fulltexts are
+# extracted by a pool of worker processes (see CVS.blobs).
+PARALLEL_BLOBS = 256
+
+# Number of fulltexts per worker process that may be extracted ahead
+# of the one the caller waits for (see CVS.blobs).
+BLOBS_IN_FLIGHT = 16
+
+# The CVS object of a worker process in the blob extraction pool.
+_blob_cvs = None
+
+def _init_blob_worker(dirname):
+    global _blob_cvs
+    # Blobs are extracted while Git.import_changesets() traps
+    # SIGTERM, but Pool.terminate() relies on it.
+    signal(SIGTERM, SIG_DFL)
+    _blob_cvs = CVS(dirname, None)
+
+def _extract_blob(change):
+    return _blob_cvs.blob(change, None)
+
 class CVS(object):
     """Represents a CVS repository.
     """
 
-    def __init__(self, dirname, metadb):
+    def __init__(self, dirname, metadb, pathfilter=None, branches=None,
+                 tags=None):
         self.metadb = metadb
 
+        # Only the files selected by 'pathfilter' are scanned for
+        # changes.  Directories are pruned as early as possible.
+        if pathfilter is None:
+            pathfilter = PathFilter()
+        self.pathfilter = pathfilter
+
+        # Changes on the trunk are always imported, changes on CVS
+        # branches only if the branch name matches one of the glob
+        # patterns in 'branches'.
+        self.branches = branches or []
+
+        # Tags whose name matches one of the glob patterns in 'tags'
+        # are indexed while RCS files are parsed.
+        self.tags = tags or []
+
+        # Number of worker processes that extract the fulltexts of
+        # large changesets (see blobs()).
+        self.jobs = 1
+
         # 'dirname' is a local filesystem path pointing at the root of
-        # a CVS repository or at a module within.  If it is a module
+        # a CVS repository or at a module within, which may also be a
+        # path within a tar or zip archive, as if the archive were a
+        # directory (see cvsgit.source).  If it is a module
         # path, operations will be limited to that module.  Otherwise,
         # the module path will be empty and operations will by default
         # apply to the whole repository.
@@ -48,28 +149,41 @@ class CVS(object):
         # sub-directory named 'CVSROOT' is found.  Repository path and
         # module path are available for reading in the instance
         # attributes 'root' and 'module', respectively.
+        #
+        # If 'dirname' is None, the repository is not available, for
+        # example while it is unmounted, and only the meta database
+        # can be used (see compact()).
 
-        if not os.path.isdir(dirname):
-            raise TypeError, _('not a CVS repository path (%s): %s') \
-                % (_('not even a directory'), dirname)
-
-        # Convert to absolute pathname, so that our logic doesn't
-        # break if anyone uses os.chdir() and so that the path
-        # traversal below can always assume an absolute path.
-        dirname = os.path.abspath(dirname)
-
-        # Split 'dirname' into self.root and self.module and also
-        # set self.prefix to the full absolute module path.
-        self.root, self.module = split_cvs_source(dirname)
-        if self.module == '':
-            self.prefix = self.root
-        else:
-            self.prefix = os.path.join(self.root, self.module)
-
+        self.root = self.module = self.prefix = None
+        self.source = None
         self.localid = None
-        self.parse_config()
 
-        self.statcache = {}
+        if dirname is not None:
+            # Convert to absolute pathname, so that our logic doesn't
+            # break if anyone uses os.chdir() and so that the path
+            # traversal below can always assume an absolute path.
+            dirname = os.path.abspath(dirname)
+
+            # All files of the repository are accessed through the source.
+            self.source = open_source(dirname)
+            if self.source is None:
+                raise TypeError, _('not a CVS repository path (%s): %s') \
+                    % (_('not even a directory'), dirname)
+
+            # Split 'dirname' into self.root and self.module and also
+            # set self.prefix to the full absolute module path.
+            self.root, self.module = split_cvs_source(dirname, self.source)
+            if self.module == '':
+                self.prefix = self.root
+            else:
+                self.prefix = os.path.join(self.root, self.module)
+
+            self.parse_config()
+
+        # The stat() cache is loaded from the meta database on first
+        # use and kept up to date in memory afterwards, so that a
+        # resident process doesn't have to reload it for every scan.
+        self.statcache = None
         self._rcs_log_keyword_re = re.compile('(.*)\$Log(?::[^$\r\n]+)?\$(.*)')
         self._rcs_keyword_re = re.compile('\$([A-Z][A-Za-z]+)(:[^$\r\n]*)?\$')
         self._rcs_strip_attic_re = re.compile('(Attic/)?([^/]+),v$')
@@ -80,52 +194,151 @@ class CVS(object):
         used from the file is the custom Id tag keyword 'tag'."""
 
         filename = os.path.join(self.root, 'CVSROOT', 'config')
-        if not os.path.isfile(filename):
+        if not self.source.isfile(filename):
             return
 
-        f = file(filename, 'r')
-        try:
-            for line in f.readlines():
-                # Skip empty and comment-only lines.
-                if re.match('^\s*(#.*)?$', line) != None:
-                    continue
+        for line in self.source.read(filename).splitlines():
+            # Skip empty and comment-only lines.
+            if re.match('^\s*(#.*)?$', line) != None:
+                continue
 
-                # Remaining lines must be "key=value" pairs.  split() will
-                # fail otherwise.
-                option, value = line.split('=', 2)
-                if option == 'tag':
-                    self.localid = value.strip()
-        finally:
-            f.close()
+            # Remaining lines must be "key=value" pairs.  split() will
+            # fail otherwise.
+            option, value = line.split('=', 2)
+            if option == 'tag':
+                self.localid = value.strip()
 
     # Helper function to check with the statcache and the stat()
     # system call if a file or directory is unmodified.
     def _unmodified(self, path):
-        st = os.stat(os.path.join(self.prefix, path))
+        st = self.source.stat(os.path.join(self.prefix, path))
         identity = (st.st_mtime, st.st_size,)
         return self.statcache.has_key(path) and \
                 self.statcache[path] == identity
 
-    def changed_rcs_filenames(self, progress=None):
+    def changed_rcs_filenames(self, progress=None, changelist=None):
         """Return the list of RCS filenames which need to be scanned for
         new changes to import.
+
+        If 'changelist' is given, it is a list of RCS file paths which
+        a mirroring tool reported as changed.  They can be absolute or
+        relative to the module, to the repository root or to its parent
+        directory.  Only those files are considered, unless the list is
+        inconsistent with the repository, in which case all RCS files
+        are scanned.
         """
         if not progress:
             progress = NoProgress()
 
         with progress:
+            if changelist is not None:
+                result = self._listed_rcs_filenames(changelist, progress)
+                if result is not None:
+                    return result
+                progress(_('Change list inconsistent, scanning all '
+                           'RCS files'))
             return self._changed_rcs_filenames(progress=progress)
 
-    def _changed_rcs_filenames(self, progress=None):
-        # Helper function to raise the OSError reported by os.walk().
+    def rcs_filenames(self, progress=None):
+        """Return the list of all RCS filenames in the module, relative
+        to the module directory, regardless of whether they have been
+        scanned before.
+        """
+        if not progress:
+            progress = NoProgress()
+
+        with progress:
+            return self._changed_rcs_filenames(progress=progress,
+                                               all=True)
+
+    def working_filename(self, rcsfile):
+        """Return the working copy path for the RCS filename 'rcsfile'.
+        """
+        # For the working copy path it does not matter if the RCS
+        # file is in the 'Attic' directory or not, so strip it.
+        return self._rcs_strip_attic_re.sub('\\2', rcsfile)
+
+    def _listed_rcs_filenames(self, changelist, progress):
+        if self.statcache is None:
+            self.statcache = self.metadb.load_statcache()
+        result = []
+        count = 0
+
+        bases = [self.prefix, self.root, os.path.dirname(self.root)]
+        for path in changelist:
+            count += 1
+            progress(_('Collecting RCS files'), count)
+
+            # Find the module-relative path of the listed file.  Files
+            # from other modules may be listed when the whole repository
+            # is mirrored; those are skipped.
+            rcsfile = None
+            outside = False
+            for base in bases:
+                abspath = os.path.normpath(os.path.join(base, path))
+                dirname, filename = os.path.split(abspath)
+                if os.path.basename(dirname) == 'Attic':
+                    dirname = os.path.dirname(dirname)
+                trunkfile = os.path.join(dirname, filename)
+                atticfile = os.path.join(dirname, 'Attic', filename)
+                if not self.source.isfile(trunkfile) and \
+                   not self.source.isfile(atticfile):
+                    continue
+                if not abspath.startswith(self.prefix + os.sep):
+                    outside = True
+                    continue
+                n = len(self.prefix) + 1
+                rcsfile = (trunkfile[n:], atticfile[n:])
+                break
+
+            if rcsfile is None:
+                if outside:
+                    continue
+                # Neither the file nor its counterpart in or out of
+                # the Attic exists.
+                return None
+
+            trunkfile, atticfile = rcsfile
+            if not self.pathfilter.selected(trunkfile[:-2]):
+                continue
+            filename = self._zombie_select(trunkfile, atticfile)
+            if filename not in result and not self._unmodified(filename):
+                result.append(filename)
+
+        return result
+
+    def _zombie_select(self, trunkfile, atticfile):
+        """Return whichever of 'trunkfile' and 'atticfile' is the real
+        copy of an RCS file, if one of them is a zombie, or the one that
+        exists.  Both paths are relative to the module.
+        """
+        trunkpath = os.path.join(self.prefix, trunkfile)
+        atticpath = os.path.join(self.prefix, atticfile)
+        if not self.source.isfile(atticpath):
+            return trunkfile
+        elif not self.source.isfile(trunkpath):
+            return atticfile
+
+        # FIXME: Same unreliable test as in _zombie_check().
+        if self.source.getsize(trunkpath) < \
+                self.source.getsize(atticpath):
+            return atticfile
+
+        raise RuntimeError, \
+            _("invalid path: %s (%s)") % (trunkfile, \
+            _('exists in Attic and parent directory'))
+
+    def _changed_rcs_filenames(self, progress=None, all=False):
+        # Helper function to raise the OSError reported by walk().
         def raise_error(e): raise e
 
-        self.statcache = self.metadb.load_statcache()
+        if self.statcache is None and not all:
+            self.statcache = self.metadb.load_statcache()
         result = []
         count = 0
 
         for dirpath, dirnames, filenames in \
-                os.walk(self.prefix, onerror=raise_error):
+                self.source.walk(self.prefix, onerror=raise_error):
 
             # Convert from absolute to relative path.
             assert(dirpath.startswith(self.prefix))
@@ -141,11 +354,23 @@ class CVS(object):
             in_attic = os.path.basename(dirpath) == 'Attic'
             if in_attic:
                 parent = os.path.dirname(dirpath)
+            else:
+                parent = dirpath
+
+            # Don't descend into directories that the path filter
+            # excludes entirely.  The Attic belongs to its parent.
+            if self.pathfilter:
+                dirnames[:] = filter(lambda d: d == 'Attic' or \
+                    not self.pathfilter.pruned(os.path.join(parent, d)),
+                    dirnames)
 
             for filename in filenames:
                 # Ignore all non-RCS files.
                 if not filename.endswith(',v'):
                     continue
+                if self.pathfilter and not self.pathfilter.selected(
+                        os.path.join(parent, filename[:-2])):
+                    continue
 
                 count += 1
                 progress(_('Collecting RCS files'), count)
@@ -167,7 +392,7 @@ class CVS(object):
                     continue
 
                 filename = os.path.join(dirpath, filename)
-                if not self._unmodified(filename):
+                if all or not self._unmodified(filename):
                     result.append(filename)
 
         return result
@@ -178,21 +403,22 @@ class CVS(object):
         it cannot be determined which one is the zombie and which one is
         the real copy, raise an error.
 
-        This function should only be called during an os.walk() run when
+        This function should only be called during a walk() run when
         searching for files an Attic directory.  This guarantees that we
         have already seen the other copy in the parent directory, if one
         exists.  The return value is True if the zombie is in the Attic
         and False if the zombie is in the parent directory."""
 
         trunkfile = os.path.join(parent, filename)
-        if not os.path.isfile(trunkfile):
+        if not self.source.isfile(trunkfile):
             # No zombie present; the file exists only in Attic.
             return False
 
         atticfile = os.path.join(parent, 'Attic', filename)
         # FIXME: Not a reliable test. We should make sure that the
         # zombie contains a subset of the revisions of the real copy.
-        if os.path.getsize(trunkfile) < os.path.getsize(atticfile):
+        if self.source.getsize(trunkfile) < \
+                self.source.getsize(atticfile):
             result.remove(trunkfile)
             return False
 
@@ -200,13 +426,16 @@ class CVS(object):
             _("invalid path: %s (%s)") % (trunkfile, \
             _('exists in Attic and parent directory'))
 
-    def fetch_changes(self, progress=None):
+    def fetch_changes(self, progress=None, changelist=None):
         """Fetch new revisions from the CVS repository.
+
+        See changed_rcs_filenames() for the 'changelist' argument.
         """
         if progress == None:
             progress = NoProgress()
 
-        filenames = self.changed_rcs_filenames(progress=progress)
+        filenames = self.changed_rcs_filenames(progress=progress,
+                                               changelist=changelist)
         with progress:
             self._fetch_changes(filenames, progress)
 
@@ -255,23 +484,85 @@ class CVS(object):
                     pass
 
     def _fetch_changes_from_rcsfile(self, rcsfile):
-        # For the working copy path it does not matter if the RCS
-        # file is in the 'Attic' directory or not, so strip it.
-        filename = self._rcs_strip_attic_re.sub('\\2', rcsfile)
+        filename = self.working_filename(rcsfile)
 
         abspath = os.path.join(self.prefix, rcsfile)
-        st = os.stat(abspath)
+        st = self.source.stat(abspath)
         identity = (st.st_mtime, st.st_size,)
 
-        for change in RCSFile(abspath).changes():
+        if len(self.branches) > 0:
+            branches = self.branch_selected
+        else:
+            branches = None
+        with _parse_slot():
+            rcs = self.source.rcsfile(abspath)
+            changes = list(rcs.changes(branches=branches))
+        for change in changes:
             # Record the file's actual working copy path, which
             # RCS alone cannot know about.
             change.filename = filename
             self.metadb.add_change(change)
 
+        if branches is not None:
+            bases = []
+            for name, number in rcs.branches().items():
+                if branches(name):
+                    bases.append((name, number.rsplit('.', 1)[0]))
+            self.metadb.set_branch_bases(filename, bases)
+
+        if len(self.tags) > 0:
+            symbols = []
+            for tag, revision in rcs.tags().items():
+                if self._selected(tag, self.tags) and \
+                        rcs.revs.has_key(revision):
+                    symbols.append((tag, revision,
+                                    rcs.revs[revision][REV_TIMESTAMP]))
+            self.metadb.set_symbols(filename, symbols)
+
         self.metadb.update_statcache({rcsfile:identity})
+        if self.statcache is not None:
+            self.statcache[rcsfile] = identity
+
+    def _selected(self, name, patterns):
+        for pattern in patterns:
+            if fnmatchcase(name, pattern):
+                return True
+        return False
+
+    def branch_selected(self, name):
+        """Return True if changes on the CVS branch 'name' should be
+        imported.
+        """
+        return self._selected(name, self.branches)
+
+    def changed_tags(self):
+        """Return a list of (tag, commit) tuples for the tags that need
+        to be created or moved and a list of the tags that cannot be
+        resolved to a single commit (see MetaDb.changed_tags).
+        """
+        return self.metadb.changed_tags()
+
+    def mark_tags(self, tags):
+        """Record the (tag, commit) tuples in 'tags' as imported.
+        """
+        self.metadb.mark_tags(tags)
+
+    def branch_base(self, name):
+        """Return the (id, mark) tuple of the changeset on the trunk
+        that contains the branch point of the CVS branch 'name', or
+        None if it is unknown (see MetaDb.branch_base).
+        """
+        return self.metadb.branch_base(name)
 
-    def generate_changesets(self, progress=None, limit=None, flush=False):
+    def branch_point(self, timestamp):
+        """Return the last commit on the trunk before 'timestamp', or
+        None if no commit was imported before that time.  This is where
+        a branch whose base revisions are unknown forks.
+        """
+        return self.metadb.trunk_mark(timestamp)
+
+    def generate_changesets(self, progress=None, limit=None, flush=False,
+                            generator=None, now=None, jobs=1):
         """Convert changes stored in the meta database into sets of
         related changes and store the resulting changesets in the meta
         database as well.
@@ -285,56 +576,216 @@ class CVS(object):
         retained for the next incremental import.  Use this flag if you can
         be sure that the CVS repository is consistent and is not going to be
         modified during the import.
+
+        Open changesets are saved in the meta database together with a
+        high-water mark of the changes integrated so far.  The next call
+        resumes with those changesets and only integrates changes added
+        since then.  A resident caller can keep the ChangeSetGenerator
+        from changeset_generator() and pass it as 'generator' to avoid
+        reloading the open changesets.  If 'now' is given, open
+        changesets which have not been modified for the quiet period
+        relative to that time are stored as well.
+
+        Once the limit is reached, no more changes are integrated, and
+        the open changesets and high-water mark of the previous call
+        are kept, so that the next call integrates the remaining
+        changes in the same order as a call without a limit would.
+
+        If 'jobs' is greater than one, no limit is given and there are
+        no open changesets, the changes are split into windows of time
+        that are separated by gaps longer than the quiet period, and
+        all but the last window, whose changesets may be incomplete,
+        are processed by 'jobs' worker processes.
         """
         if progress == None:
             progress = NoProgress()
 
+        if generator is None:
+            csg = self.changeset_generator(limit=limit)
+        else:
+            csg = generator
+
+        after = self.metadb.get_state('last_change', 0)
+        until = self.metadb.last_change()
+
+        complete = True
         with progress:
             count = 0
-            csg = ChangeSetGenerator(limit=limit)
-            total = self.metadb.count_changes()
+            total = self.metadb.count_changes(after=after)
             progress(_('Processing changes'), 0, total)
 
-            for change in self.changes(processed=False, reentrant=True):
+            if jobs > 1 and limit is None and len(csg.changesets) == 0:
+                count, min_time = self._generate_changesets_parallel(
+                    csg, progress, total, after, until, jobs)
+            else:
+                min_time = None
+
+            for change in self.changes(processed=False, reentrant=True,
+                                       after=after, until=until,
+                                       min_time=min_time):
                 count += 1
                 progress(_('Processing changes'), count, total)
                 for cs in csg.integrate(change):
                     self.metadb.add_changeset(cs)
+                if csg.limit_reached():
+                    complete = False
+                    break
+
+            if now is not None and complete:
+                for cs in csg.expire(now):
+                    self.metadb.add_changeset(cs)
 
-        if flush:
+        if flush and complete:
             # All changesets are assumed to be complete and will be
             # imported.  Note that the ChangeSetGenerator still counts
             # changesets from flush() against the specified limit.
             for cs in csg.flush():
                 self.metadb.add_changeset(cs)
-        elif len(csg.changesets) > 0:
+
+        # The open changesets are only saved if all changes up to
+        # 'until' have been integrated into them.  Otherwise, the
+        # changes bound to the new changesets are simply left out of
+        # the saved ones by open_changesets().
+        if complete:
+            self.metadb.save_open_changesets(csg.changesets, until)
+        self.metadb.commit()
+
+        if not flush and len(csg.changesets) > 0:
             # The ChangeSetGenerator retained some changesets because
             # they are potentially incomplete.
             progress(_('Retained changesets'), len(csg.changesets))
 
-    def fetch(self, progress=None, limit=None, flush=False):
+    def _generate_changesets_parallel(self, csg, progress, total, after,
+                                      until, jobs):
+        """Process all but the last window of changes in worker
+        processes and store the resulting changesets in order.  Returns
+        the number of changes processed and the start time of the last
+        window, which the caller must process with 'csg'.
+        """
+        windows = self.metadb.change_windows(csg.quiet_period,
+                                             after=after, until=until)
+        if len(windows) < 2:
+            return 0, None
+
+        # The workers read the changes from the database file.
+        self.metadb.save()
+        tasks = map(lambda w: (self.metadb.filename, csg.quiet_period,
+                               after, until, w[0], w[1]),
+                    windows[:-1])
+        count = 0
+        with pause_progress():
+            pool = multiprocessing.Pool(jobs)
+        try:
+            for n, changesets in pool.imap(_generate_window_changesets,
+                                           tasks):
+                for cs in changesets:
+                    self.metadb.add_changeset(cs)
+                count += n
+                progress(_('Processing changes'), count, total)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        return count, windows[-1][0]
+
+    def changeset_generator(self, limit=None):
+        """Return a ChangeSetGenerator that holds the open changesets
+        saved by the last call to generate_changesets().
+        """
+        csg = ChangeSetGenerator(limit=limit)
+        for cs in self.metadb.open_changesets():
+            csg.open(cs)
+        return csg
+
+    def fetch(self, progress=None, limit=None, flush=False,
+              changelist=None, jobs=1, snapshot=None):
         """Fetch new revisions and compute changesets.
+
+        If 'snapshot' is given, all changes up to that time are bound
+        to a single SnapshotChangeSet and only later changes are
+        grouped into changesets.
         """
-        self.fetch_changes(progress)
-        self.generate_changesets(progress, limit, flush)
+        self.fetch_changes(progress, changelist=changelist)
+        if snapshot is not None:
+            self.metadb.add_snapshot_changeset(snapshot)
+        self.metadb.save()
+        self.generate_changesets(progress, limit, flush, jobs=jobs)
 
     def changesets(self):
-        """Yield new changesets computed earlier.
+        """Yield new changesets computed earlier.  The snapshot that
+        stands in for deferred changesets (see shallow()) comes first
+        if it hasn't been imported yet.
         """
+        id = self.metadb.get_state('shallow')
+        if id is not None and self.metadb.changeset_mark(id) is None:
+            yield(self.shallow_snapshot(id))
+
         for changeset in self.metadb.changesets_by_start_time():
             changeset.provider = self
             yield(changeset)
 
-    def changes(self, processed=None, reentrant=True):
+    def shallow(self, depth):
+        """Defer all but the last 'depth' new changesets, which are
+        then preceded by a single snapshot commit of all files at the
+        end of the deferred changesets.  The deferred changesets can
+        be imported later by way of deferred_changesets().
+
+        Returns the id of the snapshot changeset or None if there is
+        nothing to defer.
+        """
+        end_time = self.metadb.defer_changesets(depth)
+        if end_time is None:
+            return None
+
+        # The changes remain bound to the deferred changesets, which is
+        # why the snapshot is computed from them in shallow_snapshot().
+        snapshot = SnapshotChangeSet(end_time)
+        self.metadb.add_changeset(snapshot)
+        self.metadb.set_state('shallow', snapshot.id)
+        self.metadb.commit()
+        return snapshot.id
+
+    def shallow_snapshot(self, id):
+        """Return the snapshot changeset with the given 'id' that was
+        recorded by shallow().
+        """
+        snapshot = None
+        for changeset in self.metadb.deferred_changesets():
+            if snapshot is None:
+                snapshot = SnapshotChangeSet(changeset.end_time, id=id,
+                                             provider=self)
+            snapshot.end_time = max(snapshot.end_time, changeset.end_time)
+            for change in changeset.changes:
+                snapshot.integrate(change)
+        return snapshot
+
+    def deferred_changesets(self):
+        """Yield the changesets deferred by shallow().
+        """
+        for changeset in self.metadb.deferred_changesets():
+            changeset.provider = self
+            yield(changeset)
+
+    def changes(self, processed=None, reentrant=True, after=None,
+                until=None, min_time=None, max_time=None, authors=None,
+                prefix=None):
         """Yields changes fetched earlier.
 
         The 'processed' keyword can be set to a boolean value to
         select whether changes which are already included in a
         previously computed changeset are to be considered.  If the
-        value is None, then all changes are considered.
+        value is None, then all changes are considered.  See
+        MetaDb.changes_by_timestamp() for the other keywords.
         """
         return self.metadb.changes_by_timestamp(processed=processed,
-                                                reentrant=reentrant)
+                                                reentrant=reentrant,
+                                                after=after, until=until,
+                                                min_time=min_time,
+                                                max_time=max_time,
+                                                authors=authors,
+                                                prefix=prefix)
 
     def rcsfilename(self, change):
         """Return the RCS filename corresponding to <change>.
@@ -342,13 +793,13 @@ class CVS(object):
         filename = change.filename + ',v'
 
         result = os.path.join(self.prefix, filename)
-        if os.path.isfile(result):
+        if self.source.isfile(result):
             return result
 
         result = os.path.join(self.prefix,
                               os.path.dirname(filename), 'Attic',
                               os.path.basename(filename))
-        if os.path.isfile(result):
+        if self.source.isfile(result):
             return result
 
         raise RuntimeError, _('no RCS file found for %s') % \
@@ -357,12 +808,12 @@ class CVS(object):
     def rcsfile(self, change):
         """Return an RCSFile object for <change>.
         """
-        return RCSFile(self.rcsfilename(change))
+        return self.source.rcsfile(self.rcsfilename(change))
 
     def perm(self, change):
         """Return the file permissions as a decimal number.
         """
-        return os.stat(self.rcsfilename(change)).st_mode & 0777
+        return self.source.stat(self.rcsfilename(change)).st_mode & 0777
 
     def blob(self, change, changeset):
         """Return the raw binary content of a file at the specified
@@ -370,11 +821,11 @@ class CVS(object):
         """
         filename = change.filename + ',v'
         rcsfile = os.path.join(self.prefix, filename)
-        if not os.path.isfile(rcsfile):
+        if not self.source.isfile(rcsfile):
             rcsfile = os.path.join(self.prefix,
                 os.path.dirname(filename), 'Attic',
                 os.path.basename(filename))
-        if not os.path.isfile(rcsfile):
+        if not self.source.isfile(rcsfile):
             raise RuntimeError, _('no RCS file found for %s') % filename
 
         # cvs has the odd behavior that it favors revision 1.1 over
@@ -387,10 +838,43 @@ class CVS(object):
         #    revision = change.revision
         revision = change.revision
 
-        rcsfile = RCSFile(rcsfile)
-        blob = rcsfile.blob(revision)
+        with _parse_slot():
+            rcsfile = self.source.rcsfile(rcsfile)
+            blob = rcsfile.blob(revision)
         return self.expand_keywords(blob, change, rcsfile, revision)
 
+    def blobs(self, changes, changeset):
+        """Return an iterator over the raw binary content of the files
+        after each of 'changes', in order.  For large changesets, such
+        as a snapshot, the fulltexts are extracted by 'jobs' worker
+        processes if that is more than one.
+        """
+        if self.jobs < 2 or len(changes) < PARALLEL_BLOBS:
+            return imap(lambda c: self.blob(c, changeset), changes)
+        return self._parallel_blobs(changes)
+
+    def _parallel_blobs(self, changes):
+        # Only a bounded number of fulltexts are extracted ahead, so
+        # that they don't pile up if the consumer is slower.
+        with pause_progress():
+            pool = multiprocessing.Pool(self.jobs,
+                                        initializer=_init_blob_worker,
+                                        initargs=(self.prefix,))
+        try:
+            pending = deque()
+            for change in changes:
+                pending.append(pool.apply_async(_extract_blob, (change,)))
+                if len(pending) >= self.jobs * BLOBS_IN_FLIGHT:
+                    yield pending.popleft().get()
+            while len(pending) > 0:
+                yield pending.popleft().get()
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
     def note(self, change, changeset):
         """Return a note that identies the revision.
         """
@@ -504,3 +988,48 @@ class CVS(object):
 
     def count_changesets(self):
         return self.metadb.count_changesets()
+
+    def compact(self, progress=None):
+        """Compact the meta database and return the number of changes
+        compacted, the number of paths removed from the stat() cache
+        and the number of log messages compressed (see
+        MetaDb.compact_changes and MetaDb.compress_logs).
+
+        The stat() information of RCS files and directories that no
+        longer exist is dropped, unless the CVS repository is not
+        available, since it may only be unmounted.
+        """
+        if progress == None:
+            progress = NoProgress()
+
+        missing = []
+        with progress:
+            if self.source is not None and self.source.isdir(self.prefix):
+                progress(_('Pruning stat cache'))
+                for path in self.metadb.load_statcache().keys():
+                    if not self.source.exists(os.path.join(self.prefix,
+                                                           path)):
+                        missing.append(path)
+                self.metadb.prune_statcache(missing)
+                self.statcache = None
+
+            progress(_('Compacting changes'))
+            count = self.metadb.compact_changes()
+            progress(_('Compressing log messages'))
+            compressed = self.metadb.compress_logs()
+            progress(_('Vacuuming database'))
+            self.metadb.vacuum()
+        return count, len(missing), compressed
+
+    def save(self):
+        """Write the meta database to disk if it is staged in memory
+        (see MetaDb.save).
+        """
+        self.metadb.save()
+
+    def search_changesets(self, query, limit=None):
+        """Return (commit, timestamp, author, log) tuples of the
+        imported changesets whose log message matches 'query' (see
+        MetaDb.search_changesets).
+        """
+        return self.metadb.search_changesets(query, limit)
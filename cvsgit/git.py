@@ -1,5 +1,6 @@
 """Git interface module for 'git-cvs'."""
 
+import hashlib
 import os
 import time
 import types
@@ -25,6 +26,52 @@ def safe_environ():
             del env[k]
     return env
 
+def config_key(varname):
+    """Return the canonical form of the config variable 'varname' in
+    which 'git config --list' reports it.  Section and variable names
+    are case-insensitive, but subsection names are not.
+
+    >>> config_key('Branch.Master.Remote')
+    'branch.Master.remote'
+    """
+    parts = varname.split('.')
+    parts[0] = parts[0].lower()
+    parts[-1] = parts[-1].lower()
+    return '.'.join(parts)
+
+def parse_config_list(data):
+    """Parse the output of 'git config --list -z' into a dictionary
+    mapping each variable to the list of its values.  A variable
+    without a value has the empty string as its value, as with 'git
+    config --get'.
+
+    >>> config = parse_config_list('core.bare\\nfalse\\0cvs.include\\nsrc\\0'
+    ...                            'cvs.include\\ndoc\\0foo.bar\\0')
+    >>> config['cvs.include']
+    ['src', 'doc']
+    >>> config['foo.bar']
+    ['']
+    """
+    config = {}
+    for entry in data.split('\0'):
+        if entry == '':
+            continue
+        if '\n' in entry:
+            varname, value = entry.split('\n', 1)
+        else:
+            varname, value = entry, ''
+        config.setdefault(varname, []).append(value)
+    return config
+
+def blob_sha1(data):
+    """Return the SHA-1 that Git would assign to a blob with the
+    content 'data'.
+
+    >>> blob_sha1('hello\\n')
+    'ce013625030ba8dba906f756967f9e9ca394464a'
+    """
+    return hashlib.sha1('blob %d\0%s' % (len(data), data)).hexdigest()
+
 class GitError(Error):
     """Base exception for errors in the cvsgit.git module"""
     pass
@@ -74,6 +121,7 @@ class Git(object):
             self._directory = os.getcwd()
         else:
             self._directory = directory
+        self._config = None
 
     def get_directory(self):
         """Return the repository top-level path.
@@ -152,6 +200,7 @@ class Git(object):
             dummy, stderr = pipe.communicate()
             if pipe.returncode != 0:
                 raise GitCommandError(command, pipe.returncode, stderr)
+            self._config = None
         except:
             if directory_created:
                 shutil.rmtree(self.directory)
@@ -188,6 +237,94 @@ class Git(object):
         """
         return self.check_command('rev-list', *args, stdout=PIPE)
 
+    def ls_tree(self, treeish):
+        """Return a dictionary that maps the paths of all files in
+        'treeish' (recursively) to (mode, sha1) tuples, where 'mode'
+        is an octal string as in "git ls-tree" output.
+        """
+        command = ['git', 'ls-tree', '-r', '-z', treeish]
+        pipe = self._popen(command, stdout=PIPE, stderr=PIPE)
+        stdout, stderr = pipe.communicate()
+        if pipe.returncode != 0:
+            raise GitCommandError(command, pipe.returncode, stderr)
+
+        tree = {}
+        for entry in stdout.split('\0'):
+            if entry == '':
+                continue
+            info, path = entry.split('\t', 1)
+            mode, type, sha1 = info.split(' ')
+            if type == 'blob':
+                tree[path] = (mode, sha1)
+        return tree
+
+    def commit_timestamp(self, commit):
+        """Return the commit time of 'commit' in seconds since the
+        epoch.
+        """
+        return int(self.check_command('log', '-1', '--format=%ct',
+                                      commit, stdout=PIPE))
+
+    def log_raw(self, revisions, notes=None):
+        """Yield a (sha1, timestamp, note, changes) tuple for each
+        commit listed by 'git log --reverse <revisions>', oldest first,
+        where 'timestamp' is the commit time in seconds since the epoch
+        and 'changes' is a list of
+        (mode, sha1, status, path) tuples for the files modified by the
+        commit, as in the output of "git log --raw".  Deleted files
+        have the null SHA-1.
+
+        If 'notes' is given, 'note' is the text of the commit's note
+        in that notes ref or an empty string.
+        """
+        if notes:
+            notes_args = ['--notes=%s' % notes]
+        else:
+            notes_args = ['--no-notes']
+        # With -z, paths are never quoted and each is terminated by
+        # a NUL character, as is the information before it.
+        command = ['git', 'log', '--raw', '-z',
+                   '--no-renames', '--no-abbrev',
+                   '--reverse', '--format=%x01%H %ct%n%N%x02'] + \
+                   notes_args + [revisions]
+        pipe = self._popen(command, stdout=PIPE, stderr=PIPE)
+        stdout, stderr = pipe.communicate()
+        if pipe.returncode != 0:
+            raise GitCommandError(command, pipe.returncode, stderr)
+
+        for entry in stdout.split('\x01')[1:]:
+            header, rest = entry.split('\n', 1)
+            sha1, timestamp = header.split(' ')
+            note, raw = rest.split('\x02', 1)
+            changes = []
+            fields = raw.split('\0')
+            i = 0
+            while i < len(fields) - 1:
+                info = fields[i].lstrip('\n')
+                if info.startswith(':'):
+                    dummy, mode, dummy, blob, status = info.split(' ')
+                    changes.append((mode, blob, status, fields[i + 1]))
+                    i += 2
+                else:
+                    i += 1
+            yield (sha1, int(timestamp), note, changes)
+
+    def ref_exists(self, ref):
+        """Return True iff 'ref' names an existing commit.
+        """
+        command = ['git', 'rev-parse', '--verify', '--quiet', ref + '^0']
+        pipe = self._popen(command, stdout=PIPE, stderr=PIPE)
+        pipe.communicate()
+        return pipe.returncode == 0
+
+    def refs(self, *patterns):
+        """Return the names of all refs matching 'patterns' (see
+        git-for-each-ref(1)).
+        """
+        output = self.check_command('for-each-ref', '--format=%(refname)',
+                                    *patterns, stdout=PIPE)
+        return filter(None, output.split('\n'))
+
     def symbolic_ref(self, *args):
         """Return the output of 'git symbolic-ref <*args>'
         """
@@ -229,28 +366,59 @@ class Git(object):
         if stdout == PIPE:
             return stripnl(out)
 
+    def config_list(self):
+        """Return a dictionary of all config variables, mapping each
+        variable to the list of its values.
+
+        The configuration is read with a single 'git config --list'
+        call on first use and cached until it is changed through this
+        object or the repository is (re)initialized.  This method may
+        be called before the repository exists.  In that case it will
+        always return an empty dictionary.
+        """
+        if self._config is not None:
+            return self._config
+        if not os.path.isdir(self.directory):
+            return {}
+        command = ['git', 'config', '--list', '-z']
+        pipe = self._popen(command, stdout=PIPE, stderr=PIPE)
+        stdout, stderr = pipe.communicate()
+        if pipe.returncode != 0:
+            raise GitCommandError(command, pipe.returncode, stderr)
+        self._config = parse_config_list(stdout)
+        return self._config
+
     def config_get(self, varname, default=None):
         """Retrieve the value of a config variable.
 
         This method may be called before the repository exists.  In
         that case it will always return the default value.
         """
-        if not os.path.isdir(self.directory):
-            return default
-        command = ['git', 'config', '--get', varname]
-        pipe = self._popen(command, stdout=PIPE, stderr=PIPE)
-        stdout, stderr = pipe.communicate()
-        if pipe.returncode == 0:
-            return stripnl(stdout)
-        elif pipe.returncode == 1:
-            return default
+        values = self.config_list().get(config_key(varname))
+        if values:
+            return values[-1]
         else:
-            raise GitCommandError(command, pipe.returncode, stderr)
+            return default
+
+    def config_get_all(self, varname):
+        """Retrieve all values of a multi-valued config variable as a
+        list, which is empty if the variable is unset.
+        """
+        return list(self.config_list().get(config_key(varname), []))
 
     def config_set(self, varname, value):
         """Set the value of a config variable.
         """
         self.check_command('config', varname, value)
+        if self._config is not None:
+            self._config[config_key(varname)] = [value]
+
+    def config_add(self, varname, value):
+        """Add a value to a multi-valued config variable.
+        """
+        self.check_command('config', '--add', varname, value)
+        if self._config is not None:
+            self._config.setdefault(config_key(varname), []).append(value)
 
     def import_changesets(self, changesets, branch, domain=None,
                           limit=None, verbose=False,
@@ -260,10 +428,9 @@ class Git(object):
         """
         if progress == None:
             progress = NoProgress()
-        with progress:
-            self._import_changesets(changesets, branch, domain,
-                                    limit, verbose, progress,
-                                    total, authors, stop_on_unknown_author)
+        self._import_changesets(changesets, branch, domain,
+                                limit, verbose, progress,
+                                total, authors, stop_on_unknown_author)
 
     def _import_changesets(self, changesets, branch, domain, limit,
                            verbose, progress, total, authors,
@@ -306,37 +473,57 @@ class Git(object):
 
         fi = GitFastImport(pipe, branch, domain=domain, verbose=verbose,
                            authors=authors, stop_on_unknown_author=\
-                               stop_on_unknown_author)
+                               stop_on_unknown_author,
+                           existing_refs=self.refs())
         changeset_ids = []
         db = None
         try:
-            for changeset in changesets:
-                if limit != None and len(changeset_ids) >= limit:
-                    break
-
-                fi.add_changeset(changeset)
-                if db == None: db = changeset.provider.metadb # FIXME
-                changeset_ids.append(changeset.id)
-                do_progress(len(changeset_ids), total)
-
-                if sigaction.isset(SIGINT):
-                    raise KeyboardInterrupt()
-                elif sigaction.isset():
-                    break
+            with progress:
+                try:
+                    for changeset in changesets:
+                        if limit != None and len(changeset_ids) >= limit:
+                            break
+
+                        fi.add_changeset(changeset)
+                        if db == None: db = changeset.provider.metadb # FIXME
+                        changeset_ids.append(changeset.id)
+                        do_progress(len(changeset_ids), total)
+
+                        if sigaction.isset(SIGINT):
+                            raise KeyboardInterrupt()
+                        elif sigaction.isset():
+                            break
+                finally:
+                    fi.close()
         finally:
             try:
-                fi.close()
+                self.mark_changesets(db, changeset_ids, progress)
             finally:
-                self.mark_changesets(db, changeset_ids)
                 for signalnum in signalset:
                     signal(signalnum, old_sigaction[signalnum])
 
         if fi.returncode != 0:
             raise RuntimeError, _('git fast-import failed')
 
-    def mark_changesets(self, db, changeset_ids):
+    def import_tags(self, tags, prefix='refs/tags/'):
+        """Create or move a lightweight tag for each (name, commit)
+        tuple in 'tags' with a single "git fast-import" run.
+        """
+        command = ['git', 'fast-import', '--quiet', '--force']
+        pipe = self._popen(command, stdin=PIPE)
+        for name, commit in tags:
+            pipe.stdin.write('reset %s%s\nfrom %s\n\n' % \
+                                 (prefix, name, commit))
+        pipe.stdin.close()
+        if pipe.wait() != 0:
+            raise RuntimeError, _('git fast-import failed')
+
+    def mark_changesets(self, db, changeset_ids, progress=None):
+        """Record the commits that fast-import exported as the marks
+        of the changesets with the given ids in the meta database 'db'.
+        """
         filename = os.path.join(self.git_dir, 'cvsgit.marks')
-        if not os.path.isfile(filename):
+        if len(changeset_ids) == 0 or not os.path.isfile(filename):
             return
 
         marks = {}
@@ -348,25 +535,72 @@ class Git(object):
         finally:
             f.close()
 
-        for id in changeset_ids:
-            if marks.has_key(id):
-                sha1 = marks[id]
-                db.mark_changeset(id, sha1)
+        if progress is None:
+            progress = NoProgress()
+        with progress:
+            db.mark_changesets(map(lambda id: (id, marks[id]),
+                                   filter(marks.has_key, changeset_ids)),
+                               progress=progress)
 
 class GitFastImport(object):
     def __init__(self, pipe, branch, domain=None, verbose=False,
-                 authors=None, stop_on_unknown_author=False):
+                 authors=None, stop_on_unknown_author=False,
+                 existing_refs=()):
+        """Changesets on the trunk are committed to 'branch', and those
+        on a CVS branch to a ref of the same name next to it.  The
+        first commit to each ref continues it if it is one of the
+        'existing_refs'.  Otherwise, a new CVS branch forks from the
+        trunk, and the trunk starts a new history.
+        """
         self.pipe = pipe
         self.branch = branch
+        self.existing_refs = set(existing_refs)
         self.domain = domain
         self.verbose = verbose
         self.authors = authors
         self.stop_on_unknown_author = stop_on_unknown_author
         self.last_changeset = None
+        self.last_marks = {}
+        self.trunk_commits = []
+        self.trunk_ids = set()
         self.write('feature notes\n')
 
+    def branch_ref(self, name):
+        """Return the ref for commits on the CVS branch 'name', which is
+        None for the trunk.
+        """
+        if name is None:
+            return self.branch
+        return self.branch.rsplit('/', 1)[0] + '/' + name
+
+    def branch_point(self, changeset):
+        """Return the commit on the trunk from which the CVS branch of
+        'changeset' forks, if it is the first changeset on the branch.
+
+        That is the changeset which contains the base revisions of the
+        branch, whether it was imported earlier or in this session.
+        Only if it is unknown, the branch forks from the last commit on
+        the trunk before 'changeset'.
+        """
+        base = changeset.provider.branch_base(changeset.branch)
+        if base is not None:
+            id, mark = base
+            if mark is not None:
+                return mark
+            elif id in self.trunk_ids:
+                return ':%s' % id
+        for end_time, mark in reversed(self.trunk_commits):
+            if end_time < changeset.start_time:
+                return mark
+        return changeset.provider.branch_point(changeset.start_time)
+
     def add_changeset(self, changeset):
-        name = self.author_name(changeset.author)
+        if changeset.snapshot:
+            # Snapshots are made by git-cvs, not by a CVS author, so
+            # they are not looked up in the author map.
+            name = changeset.author
+        else:
+            name = self.author_name(changeset.author)
         email = self.author_email(changeset.author)
         when = self.raw_date(changeset.timestamp)
 
@@ -379,20 +613,27 @@ class GitFastImport(object):
                 teaser = teaser[:68] + '...'
             print '\t%s' % teaser.encode('ascii', 'replace')
 
-        self.write('commit %s\n' % self.branch)
+        ref = self.branch_ref(changeset.branch)
+        if not self.last_marks.has_key(ref) and \
+                ref not in self.existing_refs and \
+                changeset.branch is not None:
+            base = self.branch_point(changeset)
+            if base is not None:
+                self.write('reset %s\nfrom %s\n\n' % (ref, base))
+
+        self.write('commit %s\n' % ref)
         self.write('mark :%s\n' % changeset.id)
         self.write('committer %s <%s> %s\n' % (name, email, when))
         self.data(changeset.log.encode('utf-8'))
 
-        # FIXME: this is a hack; find out if the branch exists
-        if changeset.id != 1:
-            if self.last_changeset is None:
-                self.write('from %s^0\n' % self.branch)
-            else:
-                self.write('from :%s\n' % self.last_changeset.id)
+        if self.last_marks.has_key(ref):
+            self.write('from %s\n' % self.last_marks[ref])
+        elif ref in self.existing_refs:
+            self.write('from %s^0\n' % ref)
 
         note = ''
 
+        blobs = changeset.blobs()
         for c in changeset.changes:
             if self.verbose:
                 print '\t%s %s %s' % (c.filestatus, c.filename, c.revision)
@@ -401,7 +642,7 @@ class GitFastImport(object):
                 self.write('D %s\n' % c.filename)
             else:
                 perm = changeset.perm(c)
-                blob = changeset.blob(c)
+                blob = blobs.next()
 
                 # Git according to git-fast-import(1) only supports
                 # these two file modes for plain files.
@@ -419,14 +660,17 @@ class GitFastImport(object):
         self.write('commit refs/notes/cvs\n')
         self.write('committer %s <%s> %s\n' % ('git-cvs', '', when))
         self.data('')
-        # FIXME: this is a hack; find out if the branch exists
-        if changeset.id != 1:
-            if self.last_changeset is None:
-                self.write('from %s^0\n' % notes_ref)
+        if self.last_changeset is None and notes_ref in self.existing_refs:
+            self.write('from %s^0\n' % notes_ref)
         self.write('N inline :%s\n' % changeset.id)
         self.data(note)
 
         self.last_changeset = changeset
+        self.last_marks[ref] = ':%s' % changeset.id
+        if changeset.branch is None:
+            self.trunk_commits.append((changeset.end_time,
+                                       ':%s' % changeset.id))
+            self.trunk_ids.add(changeset.id)
 
     def close(self):
         try:
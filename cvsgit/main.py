@@ -3,12 +3,14 @@
 
 import os.path
 import re
+import sys
+import time
 
+from cvsgit.changelist import read_change_list
 from cvsgit.cmd import Cmd
 from cvsgit.error import Error
 from cvsgit.git import Git
-from cvsgit.cvs import CVS
-from cvsgit.meta import MetaDb
+from cvsgit.pathfilter import PathFilter
 from cvsgit.i18n import _
 from cvsgit.term import Progress
 
@@ -50,6 +52,49 @@ class Command(Cmd):
         self.add_option('--verbose', action='store_true', help=\
             _("Display each changeset as it is imported."))
 
+    def add_changes_from_option(self):
+        self.add_option('--changes-from', metavar='FILE', help=\
+            _("Only scan the RCS files listed in FILE (\"-\" for "
+              "standard input), e.g. the output of rsync "
+              "--itemize-changes from mirroring the CVS repository."))
+
+    def finalize_changes_from_option(self):
+        if self.options.changes_from:
+            self.options.changes_from = \
+                read_change_list(self.options.changes_from)
+
+    def add_jobs_option(self):
+        self.add_option('--jobs', type='int', metavar='N', default=1,
+                        help=_("Group changes into changesets and extract "
+                               "the files of snapshots in N worker "
+                               "processes (default: %default)."))
+
+    def finalize_jobs_option(self):
+        if self.options.jobs < 1:
+            self.usage_error(_('--jobs must be a positive number'))
+
+    def add_path_filter_options(self):
+        self.add_option('--include', action='append', metavar='PATTERN',
+                        help=_("Only import files matching the glob "
+                               "PATTERN or below a matching directory "
+                               "(may be repeated; sets 'cvs.include')."))
+        self.add_option('--exclude', action='append', metavar='PATTERN',
+                        help=_("Skip files matching the glob PATTERN or "
+                               "below a matching directory (may be "
+                               "repeated; sets 'cvs.exclude')."))
+
+    def add_branches_option(self):
+        self.add_option('--branches', action='append', metavar='PATTERN',
+                        help=_("Also import the CVS branches whose names "
+                               "match the glob PATTERN as cvs/<branch> "
+                               "(may be repeated; sets 'cvs.branches')."))
+
+    def add_tags_option(self):
+        self.add_option('--tags', action='append', metavar='PATTERN',
+                        help=_("Import the CVS tags whose names match the "
+                               "glob PATTERN as lightweight tags (may be "
+                               "repeated; sets 'cvs.tags')."))
+
     def add_no_skip_latest_option(self):
         self.add_option('--no-skip-latest', action='store_true', help=\
             _("Import potentially incomplete changesets instead of retaining them for the next incremental import."))
@@ -81,27 +126,36 @@ class Conduit(object):
     """CVS-to-Git conduit logic
     """
 
-    def __init__(self, directory=None):
+    def __init__(self, directory=None, staging_limit=None):
+        """If 'staging_limit' is given, a new meta database is staged
+        in memory up to that many bytes (see MetaDb).
+        """
         self.git = Git(directory)
         self.branch = 'refs/heads/cvs/HEAD'
+        self.staging_limit = staging_limit
         self._cvs = None
-        self._config = {}
 
     def config_get(self, varname):
         """Get a Git variable from the 'cvs' section
         """
-        if self._config.has_key(varname):
-            return self._config[varname]
-        else:
-            value = self.git.config_get('cvs.' + varname)
-            self._config[varname] = value
-            return value
+        return self.git.config_get('cvs.' + varname)
+
+    def config_get_all(self, varname):
+        """Get all values of a multi-valued Git variable from the 'cvs'
+        section
+        """
+        return self.git.config_get_all('cvs.' + varname)
 
     def config_set(self, varname, value):
         """Set a Git variable in the 'cvs' section
         """
         self.git.config_set('cvs.' + varname, value)
-        self._config[varname] = value
+
+    def config_add(self, varname, value):
+        """Add a value to a multi-valued Git variable in the 'cvs'
+        section
+        """
+        self.git.config_add('cvs.' + varname, value)
 
     def get_source(self):
         """Get the CVS repository source path
@@ -126,16 +180,42 @@ class Conduit(object):
 
     domain = property(get_domain, set_domain)
 
-    def get_cvs(self):
+    def get_pathfilter(self):
+        """Get the filter built from the 'cvs.include' and
+        'cvs.exclude' glob patterns
+        """
+        return PathFilter(self.config_get_all('include'),
+                          self.config_get_all('exclude'))
+
+    pathfilter = property(get_pathfilter)
+
+    def get_cvs(self, require_source=True):
+        """Return the CVS object for the source repository and the
+        meta database.  Unless 'require_source' is true, a source
+        repository that is not available is not an error, and only
+        the meta database can be used.
+        """
         if self._cvs == None:
+            # Imported here, so that commands which never look at the
+            # CVS repository don't load rcsparse and sqlite3.
+            from cvsgit.cvs import CVS
+            from cvsgit.meta import MetaDb
+            from cvsgit.source import open_source
             filename = os.path.join(self.git.git_dir, 'cvsgit.db')
-            metadb = MetaDb(filename)
-            self._cvs = CVS(self.source, metadb)
+            metadb = MetaDb(filename, staging_limit=self.staging_limit)
+            source = self.source
+            if not require_source and \
+                    open_source(os.path.abspath(source)) is None:
+                source = None
+            self._cvs = CVS(source, metadb, self.pathfilter,
+                            self.config_get_all('branches'),
+                            self.config_get_all('tags'))
         return self._cvs
 
     cvs = property(get_cvs)
 
-    def init(self, repository, domain=None, bare=False, quiet=True):
+    def init(self, repository, domain=None, bare=False, quiet=True,
+             include=None, exclude=None, branches=None, tags=None):
         self.git.init(bare=bare, quiet=quiet)
 
         if not self.git.is_bare() and \
@@ -149,17 +229,51 @@ class Conduit(object):
         if domain:
             self.domain = domain
 
+        for pattern in include or []:
+            self.config_add('include', pattern)
+        for pattern in exclude or []:
+            self.config_add('exclude', pattern)
+        for pattern in branches or []:
+            self.config_add('branches', pattern)
+        for pattern in tags or []:
+            self.config_add('tags', pattern)
+
     def fetch(self, limit=None, quiet=True, verbose=False,
-              flush=False, authors=None, stop_on_unknown_author=False):
+              flush=False, authors=None, stop_on_unknown_author=False,
+              changelist=None, jobs=1, snapshot=None, depth=None):
         """Fetch new changesets into the CVS tracking branch.
+
+        'changelist' is an optional list of RCS files that a mirroring
+        tool reported as changed (see CVS.changed_rcs_filenames).
+        'jobs' is the number of worker processes for changeset
+        generation (see CVS.generate_changesets) and for extracting
+        the files of snapshots (see CVS.blobs).  'snapshot' is the
+        time up to which all changes are imported as a single commit
+        (see CVS.fetch).  If 'depth' is given, only that many of the
+        new changesets are imported after a snapshot of the others
+        (see CVS.shallow and unshallow).
         """
         if quiet or verbose:
             progress = None
         else:
             progress = Progress()
 
-        self.cvs.fetch(progress=progress, limit=limit, flush=flush)
-
+        self.cvs.jobs = jobs
+        self.cvs.fetch(progress=progress, limit=limit, flush=flush,
+                       changelist=changelist, jobs=jobs, snapshot=snapshot)
+        if depth is not None:
+            self.cvs.shallow(depth)
+        self.import_changesets(limit=limit, verbose=verbose,
+                               progress=progress, authors=authors,
+                               stop_on_unknown_author=\
+                                   stop_on_unknown_author)
+        self.cvs.save()
+
+    def import_changesets(self, limit=None, verbose=False, progress=None,
+                          authors=None, stop_on_unknown_author=False):
+        """Import changesets computed earlier into the CVS tracking
+        branch.
+        """
         # XXX: Should not access private self.cvs.metadb.
         if authors and stop_on_unknown_author:
             unknown = []
@@ -178,21 +292,157 @@ class Conduit(object):
                                    authors=authors,
                                    stop_on_unknown_author=\
                                        stop_on_unknown_author)
+        self.import_tags()
+
+    def import_tags(self):
+        """Create or move the tags selected by 'cvs.tags' to match the
+        imported changesets.
+        """
+        tags, skipped = self.cvs.changed_tags()
+        for tag in skipped:
+            sys.stderr.write(_("warning: skipping tag %s: its revisions "
+                               "are not all imported on the trunk or on "
+                               "one branch\n") % tag)
+        if len(tags) > 0:
+            self.git.import_tags(tags)
+            self.cvs.mark_tags(tags)
+
+    def gc(self, quiet=True):
+        """Compact the meta database and return the number of changes
+        compacted, the number of stale paths removed from the stat()
+        cache and the number of log messages compressed (see
+        CVS.compact).  This works while the source repository is not
+        available.
+        """
+        if quiet:
+            progress = None
+        else:
+            progress = Progress()
+        cvs = self.get_cvs(require_source=False)
+        return cvs.compact(progress=progress)
+
+    def unshallow(self, quiet=True, verbose=False, authors=None,
+                  stop_on_unknown_author=False):
+        """Import the changesets that were left out by fetch() with
+        'depth' and graft them onto the history in place of the
+        snapshot commit, using "git replace".
+        """
+        # XXX: Should not access private self.cvs.metadb.
+        metadb = self.cvs.metadb
+        id = metadb.get_state('shallow')
+        if id is None:
+            return
+        snapshot = metadb.changeset_mark(id)
+        if snapshot is None:
+            raise ConduitError, \
+                _('the shallow snapshot has not been imported yet')
+
+        if quiet or verbose:
+            progress = None
+        else:
+            progress = Progress()
+
+        # The deferred history is imported as a separate root commit
+        # and kept reachable only through the replace ref.
+        ref = 'refs/cvsgit/unshallow'
+        self.git.import_changesets(self.cvs.deferred_changesets(), ref,
+                                   domain=self.domain,
+                                   verbose=verbose,
+                                   progress=progress,
+                                   authors=authors,
+                                   stop_on_unknown_author=\
+                                       stop_on_unknown_author)
+        if metadb.count_deferred_changesets() > 0:
+            raise ConduitError, _('interrupted while importing the '
+                                  'deferred changesets')
+
+        self.git.check_command('replace', '-f', snapshot,
+                               self.git.rev_parse(ref))
+        self.git.check_command('update-ref', '-d', ref)
+        metadb.set_state('shallow', None)
+        metadb.undefer_changesets()
 
     def pull(self, limit=None, quiet=True, verbose=False, flush=False,
-             authors=None, stop_on_unknown_author=False):
+             authors=None, stop_on_unknown_author=False, changelist=None,
+             jobs=1):
         self.fetch(limit=limit, quiet=quiet, verbose=verbose,
                    flush=flush, authors=authors, stop_on_unknown_author=
-                   stop_on_unknown_author)
+                   stop_on_unknown_author, changelist=changelist,
+                   jobs=jobs)
 
         args = []
         if quiet:
             args.append('--quiet')
 
         if self.git.is_bare():
-          self.git.check_command('branch', '-f', 'master', self.branch)
+          self.update_bare_master()
         else:
           # XXX: --quiet is not enough if branch.<branch>.rebase is true
           #self.git.pull(*args)
           import subprocess
           self.git.check_command('pull', *args, stdout=subprocess.PIPE)
+
+    def update_bare_master(self):
+        """Point the master branch of a bare repository at the CVS
+        tracking branch.
+        """
+        self.git.check_command('branch', '-f', 'master', self.branch)
+
+    def watch(self, interval=60, quiet=True, verbose=False, authors=None,
+              stop_on_unknown_author=False):
+        """Import changesets into the CVS tracking branch as soon as
+        they are complete, until interrupted.
+
+        The meta database, the stat() cache and the open changesets
+        are kept in memory between scans.  Changed RCS files are
+        noticed through inotify, if available, or by rescanning the
+        repository every 'interval' seconds.  An open changeset is
+        considered complete once it hasn't been modified for the quiet
+        period in wall-clock time.
+        """
+        if quiet or verbose:
+            progress = None
+        else:
+            progress = Progress()
+
+        from cvsgit.watch import Watcher
+        csg = self.cvs.changeset_generator()
+        watcher = Watcher(self.cvs.prefix)
+        try:
+            changed = True
+            changelist = None
+            while True:
+                if changed:
+                    self.cvs.fetch_changes(progress=progress,
+                                           changelist=changelist)
+                self.cvs.generate_changesets(progress=progress,
+                                             generator=csg,
+                                             now=time.time())
+
+                if self.cvs.count_changesets() > 0:
+                    self.import_changesets(verbose=verbose,
+                                           progress=progress,
+                                           authors=authors,
+                                           stop_on_unknown_author=\
+                                               stop_on_unknown_author)
+                    if self.git.is_bare():
+                        self.update_bare_master()
+
+                # Wake up when the oldest open changeset expires, even
+                # if no RCS files are modified in the meantime.
+                timeout = interval
+                if len(csg.changesets) > 0:
+                    end_time = min(map(lambda cs: cs.end_time,
+                                       csg.changesets))
+                    expires = end_time + csg.quiet_period - time.time()
+                    timeout = min(timeout, max(expires, 0) + 1)
+                elif watcher.notifier is not None:
+                    timeout = None
+                changed = watcher.wait(timeout)
+                if watcher.notifier is not None and not watcher.rescan:
+                    changelist = list(watcher.changed)
+                else:
+                    changelist = None
+                watcher.clear()
+        finally:
+            watcher.close()
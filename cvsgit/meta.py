@@ -4,8 +4,14 @@ import os.path
 import re
 import sqlite3
 
-from cvsgit.changeset import Change, ChangeSet
+from cvsgit.changeset import Change, ChangeSet, SnapshotChangeSet
+from cvsgit.compress import DictCompressor, train_dictionary
 from cvsgit.i18n import _
+from cvsgit.term import NoProgress
+
+# Number of changes from which the dictionary for compressing log
+# messages is trained.
+LOG_DICTIONARY_SAMPLE = 1000
 
 class MetaDb(object):
     """Database of CVS revisions (changes) and combined changesets.
@@ -14,15 +20,38 @@ class MetaDb(object):
     pending or already grouped into changesets and a mark indicating
     whether a changeset was already processed.  For Git, the mark is
     the SHA1 commit hash.  Unprocessed changesets have the mark None.
+
+    If 'staging_limit' is given and the database file doesn't exist
+    yet, the database is staged in memory and only written to the file
+    by save(), until it grows beyond 'staging_limit' bytes.  From then
+    on, it is used on disk as usual.  Anything not saved is lost when
+    the process exits.
+
+    Once enough changes have been recorded, the log messages of new
+    changes are compressed with a dictionary trained from the earlier
+    ones (see train_log_dictionary()).  This is transparent to the
+    callers, which always see the log messages as text.
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, staging_limit=None):
         self.filename = filename
         self._dbh = None
+        self._log_index = False
+        self._log_compressor = None
+
+        # "VACUUM INTO", which save() relies on, needs SQLite 3.27.
+        if staging_limit and not os.path.exists(filename) and \
+                sqlite3.sqlite_version_info >= (3, 27, 0):
+            self.staging_limit = staging_limit
+        else:
+            self.staging_limit = None
 
     def get_dbh(self):
         if self._dbh is None:
-            dbh = sqlite3.connect(self.filename)
+            if self.staging_limit:
+                dbh = sqlite3.connect(':memory:')
+            else:
+                dbh = sqlite3.connect(self.filename)
 
             # http://web.utk.edu/~jplyon/sqlite/SQLite_optimization_FAQ.html
             dbh.execute("PRAGMA synchronous=OFF")
@@ -33,6 +62,9 @@ class MetaDb(object):
             # ROLLBACK command to become undefined.
             dbh.execute("PRAGMA journal_mode=OFF")
 
+            # Make compressed log messages readable in queries.
+            dbh.create_function('log_text', 1, self._log_text)
+
             # This helps for the temporary table which we create when
             # iterating over changes for changeset generation, but
             # bloats the process image a lot.
@@ -41,7 +73,8 @@ class MetaDb(object):
             # Create the table that contains changes pulled from CVS.
             #
             # 'changeset_id' is NULL until a change is associated with
-            # a complete changeset.
+            # a complete changeset.  'branch' is the symbolic name of
+            # the CVS branch and NULL for changes on the trunk.
             sql = 'CREATE TABLE IF NOT EXISTS change (' \
                   'timestamp DATETIME NOT NULL, ' \
                   'author VARCHAR NOT NULL, ' \
@@ -52,29 +85,82 @@ class MetaDb(object):
                   'state VARCHAR(8) NOT NULL, ' \
                   'mode CHAR(1) NOT NULL, ' \
                   'changeset_id INTEGER, ' \
+                  'commitid VARCHAR, ' \
+                  'branch VARCHAR, ' \
                   'PRIMARY KEY (filename, revision))'
             dbh.execute(sql)
+            self._add_column(dbh, 'change', 'commitid VARCHAR')
+            self._add_column(dbh, 'change', 'branch VARCHAR')
             sql = 'CREATE INDEX IF NOT EXISTS change__changeset_id ' \
                   'ON change (changeset_id)'
             dbh.execute(sql)
             dbh.execute("""
                 CREATE INDEX IF NOT EXISTS change__timestamp
                 ON change (timestamp)""")
+            dbh.execute("""
+                CREATE INDEX IF NOT EXISTS change__commitid
+                ON change (commitid)""")
 
             # Create the table that defines the attributes of complete
             # changesets.  'id' will be referenced by one or more rows
-            # in the 'change' table.
+            # in the 'change' table.  'snapshot' is 1 for a changeset
+            # that binds all changes up to its time, of which only the
+            # last one of each file is part of the commit.  'deferred'
+            # is 1 for changesets left out of a shallow clone.  'branch'
+            # is that of the changes.
             sql = 'CREATE TABLE IF NOT EXISTS changeset (' \
                   'id INTEGER PRIMARY KEY, ' \
                   'start_time DATETIME NOT NULL, ' \
                   'end_time DATETIME NOT NULL, ' \
-                  'mark VARCHAR)'
+                  'mark VARCHAR, ' \
+                  'snapshot INTEGER NOT NULL DEFAULT 0, ' \
+                  'deferred INTEGER NOT NULL DEFAULT 0, ' \
+                  'branch VARCHAR)'
             dbh.execute(sql)
+            self._add_column(dbh, 'changeset',
+                             'snapshot INTEGER NOT NULL DEFAULT 0')
+            self._add_column(dbh, 'changeset',
+                             'deferred INTEGER NOT NULL DEFAULT 0')
+            self._add_column(dbh, 'changeset', 'branch VARCHAR')
             sql = 'CREATE UNIQUE INDEX IF NOT EXISTS ' \
                   'changeset__id__start_time__mark ' \
                   'ON changeset (id, start_time, mark)'
             dbh.execute(sql)
 
+            # Create the table of the revision at which each file was
+            # branched for every selected CVS branch, which is filled
+            # in while the RCS files are parsed.
+            dbh.execute("""
+                CREATE TABLE IF NOT EXISTS branch_base (
+                    branch VARCHAR NOT NULL,
+                    filename VARCHAR NOT NULL,
+                    revision VARCHAR NOT NULL,
+                    PRIMARY KEY (branch, filename))""")
+            dbh.execute("""
+                CREATE INDEX IF NOT EXISTS branch_base__filename
+                ON branch_base (filename)""")
+
+            # Create the index of the tags in all RCS files, which is
+            # filled in while the files are parsed.  'timestamp' is
+            # that of the tagged revision.
+            dbh.execute("""
+                CREATE TABLE IF NOT EXISTS symbol (
+                    tag VARCHAR NOT NULL,
+                    filename VARCHAR NOT NULL,
+                    revision VARCHAR NOT NULL,
+                    timestamp DATETIME NOT NULL,
+                    PRIMARY KEY (tag, filename))""")
+            dbh.execute("""
+                CREATE INDEX IF NOT EXISTS symbol__filename
+                ON symbol (filename)""")
+
+            # Create the table that records the commit that each tag
+            # was last imported as.
+            dbh.execute("""
+                CREATE TABLE IF NOT EXISTS tag (
+                    name VARCHAR PRIMARY KEY,
+                    mark VARCHAR NOT NULL)""")
+
             # Create the table that stores stat() information for all
             # paths in the CVS repository.  This allows the CVS change
             # scanner to skip unmodified RCS files and directories.
@@ -88,11 +174,160 @@ class MetaDb(object):
             #    CREATE INDEX IF NOT EXISTS statcache_index
             #    ON statcache (path, mtime, size)""")
 
+            # Create the table that records which free changes are in
+            # the ChangeSetGenerator's open (possibly incomplete)
+            # changesets, so that the next run can resume with them.
+            dbh.execute("""
+                CREATE TABLE IF NOT EXISTS open_change (
+                    filename VARCHAR NOT NULL,
+                    revision VARCHAR NOT NULL,
+                    open_changeset_id INTEGER NOT NULL,
+                    PRIMARY KEY (filename, revision))""")
+
+            # Create the table for miscellaneous named values, such as
+            # the high-water mark of changes already processed.
+            dbh.execute("""
+                CREATE TABLE IF NOT EXISTS state (
+                    name VARCHAR PRIMARY KEY,
+                    value)""")
+
+            row = dbh.execute("""
+                SELECT value FROM state
+                WHERE name='log_dictionary'""").fetchone()
+            if row is not None:
+                self._log_compressor = DictCompressor(str(row[0]))
+
+            self._log_index = self._create_log_index(dbh)
+
             self._dbh = dbh
         return self._dbh
     
     dbh = property(get_dbh)
 
+    def _create_log_index(self, dbh):
+        """Create the full-text index of changeset log messages unless
+        it exists and return True, or False if SQLite was built without
+        FTS4.
+
+        The index is keyed by changeset id and contentless, because
+        the log messages are already stored in the 'change' table.  A
+        new index is filled from the changesets recorded by an earlier
+        version.  Snapshot changesets are not indexed, since their
+        commit messages are made up.
+        """
+        if dbh.execute("""
+            SELECT COUNT(*) FROM sqlite_master
+            WHERE name='changeset_log'""").fetchone()[0] > 0:
+            return True
+        try:
+            dbh.execute("""
+                CREATE VIRTUAL TABLE changeset_log
+                USING fts4(content='', log)""")
+        except sqlite3.OperationalError:
+            return False
+        dbh.execute("""
+            INSERT INTO changeset_log (docid, log)
+            SELECT cs.id, log_text(c.log)
+            FROM changeset cs
+            INNER JOIN change c ON c.rowid =
+                (SELECT MIN(rowid) FROM change
+                 WHERE changeset_id = cs.id)
+            WHERE NOT cs.snapshot""")
+        dbh.commit()
+        return True
+
+    def _log_text(self, value):
+        """Return the log message stored as 'value' in the change
+        table as text.
+        """
+        if isinstance(value, buffer):
+            data = self._log_compressor.decompress(str(value))
+            return data.decode('utf-8')
+        return value
+
+    def _log_value(self, log):
+        """Return the value to store in the change table for the log
+        message 'log', which is compressed if there is a dictionary
+        and that makes it shorter.
+        """
+        if self._log_compressor is None:
+            return log
+        if isinstance(log, unicode):
+            data = log.encode('utf-8')
+        else:
+            try:
+                log.decode('utf-8')
+            except UnicodeDecodeError:
+                return log
+            data = log
+        compressed = self._log_compressor.compress(data)
+        if len(compressed) < len(data):
+            return buffer(compressed)
+        return log
+
+    def train_log_dictionary(self, sample=LOG_DICTIONARY_SAMPLE):
+        """Train the dictionary for compressing log messages from the
+        'sample' most recently added changes unless there is one
+        already or fewer changes have been recorded.  Return True if
+        there is a dictionary afterwards.
+
+        The dictionary is never replaced, because the log messages
+        compressed with it could no longer be read.
+        """
+        dbh = self.dbh
+        if self._log_compressor is not None:
+            return True
+        if self.last_change() < sample:
+            return False
+        logs = map(lambda row: self._log_text(row[0]), dbh.execute("""
+            SELECT log FROM change
+            ORDER BY rowid DESC
+            LIMIT ?""", (sample,)))
+        dictionary = train_dictionary(map(lambda log: log.encode('utf-8'),
+                                          logs))
+        self.set_state('log_dictionary', buffer(dictionary))
+        dbh.commit()
+        self._log_compressor = DictCompressor(dictionary)
+        return True
+
+    def compress_logs(self):
+        """Compress the log messages still stored as text, training
+        the dictionary from the changes recorded so far if necessary,
+        and return the number of log messages compressed.
+        """
+        if not self.train_log_dictionary(sample=1):
+            return 0
+        count = 0
+        last = 0
+        while True:
+            rows = self.dbh.execute("""
+                SELECT rowid, log FROM change
+                WHERE rowid > ? AND typeof(log) = 'text' AND log != ''
+                ORDER BY rowid
+                LIMIT 1000""", (last,)).fetchall()
+            if len(rows) == 0:
+                break
+            for rowid, log in rows:
+                value = self._log_value(log)
+                if isinstance(value, buffer):
+                    self.dbh.execute('UPDATE change SET log=? '
+                                     'WHERE rowid=?', (value, rowid,))
+                    count += 1
+            last = rows[-1][0]
+        self.dbh.commit()
+        return count
+
+    def _add_column(self, dbh, table, column):
+        """Add 'column' (a column definition) to 'table' unless the
+        table already has it, as in databases created by an earlier
+        version.
+        """
+        name = column.split()[0]
+        for row in dbh.execute('PRAGMA table_info(%s)' % table):
+            if row[1] == name:
+                return
+        dbh.execute('ALTER TABLE %s ADD COLUMN %s' % (table, column))
+
     def load_statcache(self):
         """Load the complete stat() cache and return it as a dictionary
         of the form {path:(mtime, size)}.
@@ -113,6 +348,28 @@ class MetaDb(object):
             values = (path,) + statcache[path]
             self.dbh.execute(sql, values)
 
+    def prune_statcache(self, paths):
+        """Remove the stat() information of 'paths' from the cache.
+        """
+        self.dbh.executemany('DELETE FROM statcache WHERE path=?',
+                             map(lambda path: (path,), paths))
+        self.commit()
+
+    def get_state(self, name, default=None):
+        """Return the value named 'name' from the state table.
+        """
+        row = self.dbh.execute('SELECT value FROM state WHERE name=?',
+                               (name,)).fetchone()
+        if row is None:
+            return default
+        return row[0]
+
+    def set_state(self, name, value):
+        """Store 'value' under 'name' in the state table.
+        """
+        self.dbh.execute('INSERT OR REPLACE INTO state (name, value) '
+                         'VALUES (?,?)', (name, value,))
+
     def add_change(self, change):
         """Insert a single file change into the database.
 
@@ -126,22 +383,56 @@ class MetaDb(object):
         self.dbh.execute("""
             INSERT OR IGNORE INTO change
                 (timestamp, author, log, filestatus, filename,
-                revision, state, mode)
-            VALUES (?,?,?,?,?,?,?,?)""",
-            (change.timestamp, change.author, change.log,
+                revision, state, mode, commitid, branch)
+            VALUES (?,?,?,?,?,?,?,?,?,?)""",
+            (change.timestamp, change.author, self._log_value(change.log),
              change.filestatus, change.filename, change.revision,
-             change.state, change.mode,))
+             change.state, change.mode, change.commitid,
+             change.branch,))
+
+    def set_branch_bases(self, filename, bases):
+        """Replace the branch points recorded for the working copy
+        file 'filename' with 'bases', a list of (branch, revision)
+        tuples.
+        """
+        self.dbh.execute('DELETE FROM branch_base WHERE filename=?',
+                         (filename,))
+        self.dbh.executemany("""
+            INSERT INTO branch_base (branch, filename, revision)
+            VALUES (?,?,?)""",
+            map(lambda b: (b[0], filename, b[1]), bases))
+
+    def set_symbols(self, filename, symbols):
+        """Replace the tags recorded for the working copy file
+        'filename' with 'symbols', a list of (tag, revision, timestamp)
+        tuples.
+        """
+        self.dbh.execute('DELETE FROM symbol WHERE filename=?',
+                         (filename,))
+        self.dbh.executemany("""
+            INSERT INTO symbol (tag, filename, revision, timestamp)
+            VALUES (?,?,?,?)""",
+            map(lambda s: (s[0], filename, s[1], s[2]), symbols))
 
     def add_changeset(self, changeset):
         """Record the attributes of 'changeset' and mark the
-        referenced changes as belonging to this changeset.
+        referenced changes as belonging to this changeset.  The new
+        id is assigned to 'changeset'.
 
         Associating changes with a changeset can be considered an
-        atomic operation from the caller's perspective.
+        atomic operation from the caller's perspective.  The changes
+        of a snapshot changeset are not bound, though; that is up to
+        the caller.
         """
         id = self.dbh.execute("""
-            INSERT INTO changeset (start_time, end_time) VALUES (?,?)
-            """, (changeset.start_time, changeset.end_time,)).lastrowid
+            INSERT INTO changeset (start_time, end_time, snapshot, branch)
+            VALUES (?,?,?,?)""", (changeset.start_time, changeset.end_time,
+                                 int(changeset.snapshot),
+                                 changeset.branch,)).lastrowid
+        changeset.id = id
+        if changeset.snapshot:
+            return
+
         try:
             self.dbh.executemany("""
                 UPDATE change SET changeset_id=%d
@@ -155,43 +446,275 @@ class MetaDb(object):
                 """ % id)
             raise
 
+        if self._log_index:
+            self.dbh.execute('INSERT INTO changeset_log (docid, log) '
+                             'VALUES (?,?)', (id, changeset.log,))
+
+    def add_snapshot_changeset(self, timestamp):
+        """Record a snapshot changeset at 'timestamp' and bind all free
+        changes on the trunk up to that time to it (see
+        SnapshotChangeSet).  Nothing is recorded if there are no such
+        changes.
+        """
+        if self.dbh.execute("""
+            SELECT COUNT(*) FROM change
+            WHERE changeset_id IS NULL AND branch IS NULL
+            AND timestamp <= ?""",
+            (timestamp,)).fetchone()[0] == 0:
+            return
+
+        changeset = SnapshotChangeSet(timestamp)
+        self.add_changeset(changeset)
+        self.dbh.execute("""
+            UPDATE change SET changeset_id=?
+            WHERE changeset_id IS NULL AND branch IS NULL
+            AND timestamp <= ?""",
+            (changeset.id, timestamp,))
+        self.commit()
+
+    def defer_changesets(self, keep):
+        """Defer all unmarked changesets on the trunk except for the
+        last 'keep' ones, so that they are not returned by
+        changesets_by_start_time() until undefer_changesets() is called.
+
+        Returns the end time of the last deferred changeset or None if
+        no changesets were deferred.
+        """
+        ids = map(lambda row: row[0], self.dbh.execute("""
+            SELECT id FROM changeset
+            WHERE mark IS NULL AND NOT deferred AND branch IS NULL
+            ORDER BY end_time DESC, id DESC
+            LIMIT -1 OFFSET ?""", (keep,)).fetchall())
+        if len(ids) == 0:
+            return None
+
+        self.dbh.executemany('UPDATE changeset SET deferred=1 WHERE id=?',
+                             map(lambda id: (id,), ids))
+        self.commit()
+        return self.dbh.execute("""
+            SELECT MAX(end_time) FROM changeset WHERE deferred
+            """).fetchone()[0]
+
+    def undefer_changesets(self):
+        """Return all deferred changesets to the unmarked changesets.
+        """
+        self.dbh.execute('UPDATE changeset SET deferred=0 WHERE deferred')
+        self.commit()
+
+    def deferred_changesets(self):
+        """Yield all unmarked deferred changesets, ordered as in
+        changesets_by_start_time().
+        """
+        where = '%(changeset)s.mark IS NULL AND %(changeset)s.deferred'
+        return self._select_changesets(where)
+
+    def changeset_mark(self, id):
+        """Return the mark of the changeset with the given 'id'.
+        """
+        row = self.dbh.execute('SELECT mark FROM changeset WHERE id=?',
+                               (id,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def trunk_mark(self, timestamp):
+        """Return the mark of the last imported changeset on the trunk
+        that ended before 'timestamp', or None if there is none.
+        """
+        row = self.dbh.execute("""
+            SELECT mark FROM changeset
+            WHERE mark IS NOT NULL AND branch IS NULL AND end_time < ?
+            ORDER BY end_time DESC, id DESC LIMIT 1""",
+            (timestamp,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def branch_base(self, branch):
+        """Return the (id, mark) tuple of the changeset on the trunk
+        from which the CVS branch 'branch' forks, or None if the base
+        revisions of the branch are unknown or not in a changeset yet.
+
+        That changeset is the one with the latest end time among those
+        that contain a base revision of the branch.  The mark is None
+        if the changeset hasn't been imported yet.
+        """
+        return self.dbh.execute("""
+            SELECT cs.id, cs.mark
+            FROM branch_base b
+            INNER JOIN change c
+                ON c.filename = b.filename AND c.revision = b.revision
+            INNER JOIN changeset cs ON cs.id = c.changeset_id
+            WHERE b.branch = ? AND cs.branch IS NULL
+            ORDER BY cs.end_time DESC, cs.id DESC LIMIT 1""",
+            (branch,)).fetchone()
+
     def mark_changeset(self, id, mark):
         """Mark 'changeset' as having been integrated.
         """
         assert(id != None)
         sql = 'UPDATE changeset SET mark=? WHERE id=?'
         self.dbh.execute(sql, (mark, id,))
+        self.commit()
+
+    def mark_changesets(self, marks, progress=None):
+        """Mark many changesets as having been integrated at once.
+        'marks' is a list of (id, mark) tuples.
+
+        The marks are loaded into a temporary table and applied with a
+        single UPDATE in one transaction.
+        """
+        if progress is None:
+            progress = NoProgress()
+
+        message = _('Marking changesets')
+        progress(message, 0, len(marks))
+        self.dbh.execute("""
+            CREATE TEMPORARY TABLE changeset_mark (
+                id INTEGER PRIMARY KEY,
+                mark VARCHAR NOT NULL)""")
+        try:
+            self.dbh.executemany('INSERT INTO changeset_mark (id, mark) '
+                                 'VALUES (?,?)', marks)
+            self.dbh.execute("""
+                UPDATE changeset
+                SET mark = (SELECT m.mark FROM changeset_mark m
+                            WHERE m.id = changeset.id)
+                WHERE id IN (SELECT id FROM changeset_mark)""")
+        finally:
+            self.dbh.execute('DROP TABLE IF EXISTS changeset_mark')
+        self.commit()
+        progress(message, len(marks), len(marks))
+
+    def compact_changes(self):
+        """Drop the parts of changes in imported changesets that are no
+        longer needed and return the number of changes compacted.
+
+        The rows themselves are kept, because add_change() relies on
+        them to skip revisions that were imported already when an RCS
+        file is scanned again, and tags are resolved through them.
+        The commitid only serves to group free changes, and the log
+        message is kept only for the first change of each changeset,
+        which is the one that search_changesets() reports.
+        """
+        first = """
+            SELECT MIN(rowid) FROM change
+            WHERE changeset_id IS NOT NULL
+            GROUP BY changeset_id"""
+        count = self.dbh.execute("""
+            UPDATE change
+            SET commitid=NULL,
+                log=CASE WHEN rowid IN (%s) THEN log ELSE '' END
+            WHERE changeset_id IN
+                (SELECT id FROM changeset WHERE mark IS NOT NULL)
+            AND (commitid IS NOT NULL OR
+                 (log != '' AND rowid NOT IN (%s)))""" % (first, first)
+            ).rowcount
+        self.commit()
+        return count
+
+    def vacuum(self):
+        """Merge the segments of the full-text index, rebuild the
+        database file without unused pages and update the statistics
+        of the query planner.
+        """
+        if self._log_index:
+            self.dbh.execute("INSERT INTO changeset_log (changeset_log) "
+                             "VALUES ('optimize')")
+            self.dbh.commit()
+        self.dbh.execute('VACUUM')
+        self.dbh.execute('ANALYZE')
+        self.dbh.commit()
+
+    def save(self):
+        """Write the database staged in memory to the database file,
+        which is replaced as a whole.  Nothing is done if the database
+        is not staged.
+        """
+        if not self.staging_limit or self._dbh is None:
+            return
         self.dbh.commit()
+        tempname = self.filename + '.tmp'
+        if os.path.exists(tempname):
+            os.unlink(tempname)
+        self.dbh.execute('VACUUM INTO ?', (tempname,))
+        os.rename(tempname, self.filename)
+
+    def _check_staging_limit(self):
+        """Save the database staged in memory and continue with the
+        database file if the staged one has grown beyond the limit.
+        """
+        if not self.staging_limit or self._dbh is None:
+            return
+        page_count = self.dbh.execute('PRAGMA page_count').fetchone()[0]
+        page_size = self.dbh.execute('PRAGMA page_size').fetchone()[0]
+        if page_count * page_size > self.staging_limit:
+            self.save()
+            self._dbh.close()
+            self._dbh = None
+            self.staging_limit = None
 
     def begin_transaction(self):
         """Starts a new transaction (disables autocommit).
+
+        The database is moved from memory to disk at this point if the
+        staging limit has been reached, and the dictionary for log
+        messages is trained once enough changes have been recorded.
         """
+        self._check_staging_limit()
+        self.train_log_dictionary()
         self.dbh.execute('BEGIN TRANSACTION')
 
     def commit(self):
         """Commits the current transaction.
+
+        The database is moved from memory to disk at this point if the
+        staging limit has been reached, so callers must not be in the
+        middle of a reentrant query such as changes(reentrant=True).
         """
         self.dbh.commit()
+        self._check_staging_limit()
 
     def end_transaction(self):
         """Ends a new transaction (enables autocommit).
         """
         self.dbh.execute('END TRANSACTION')
 
-    def count_changes(self):
+    def count_changes(self, after=None):
         """Return the number of free changes (not bound in a changeset).
+
+        If 'after' is given, only count changes that were added after
+        the high-water mark 'after' (see last_change()).
         """
         return self.dbh.execute("""
             SELECT COUNT(*)
             FROM change
-            WHERE changeset_id IS NULL""").fetchone()[0]
+            WHERE changeset_id IS NULL AND rowid > ?""",
+            (after or 0,)).fetchone()[0]
+
+    def last_change(self):
+        """Return a high-water mark for the changes added so far.
+        """
+        return self.dbh.execute('SELECT MAX(rowid) FROM change'
+                                ).fetchone()[0] or 0
 
-    def changes_by_timestamp(self, processed=None, reentrant=True):
+    def changes_by_timestamp(self, processed=None, reentrant=True,
+                             after=None, until=None, min_time=None,
+                             max_time=None, authors=None, prefix=None):
         """Yields a list of changes recorded in the database.
 
         The 'processed' keyword determines wheather changes which are
         already included in a changeset are to be included or not.  If
         the value is neuter True nor False, all changes are included.
+
+        'after' and 'until' are optional high-water marks as returned
+        by last_change() and limit the changes to those added after
+        'after' and up to 'until'.  'min_time' and 'max_time' limit the
+        changes to those with a timestamp in that (inclusive) range.
+        'authors' limits the changes to those by the given login names
+        and 'prefix' to files whose name starts with it.  Changes with
+        the same timestamp are yielded in the order in which they were
+        added.
         """
         if processed == True:
             where = 'changeset_id IS NOT NULL'
@@ -199,26 +722,45 @@ class MetaDb(object):
             where = 'changeset_id IS NULL'
         else:
             where = '1'
+        if after is not None:
+            where += ' AND rowid > %d' % after
+        if until is not None:
+            where += ' AND rowid <= %d' % until
+        if min_time is not None:
+            where += ' AND timestamp >= %d' % min_time
+        if max_time is not None:
+            where += ' AND timestamp <= %d' % max_time
+        args = []
+        if authors:
+            where += ' AND author IN (%s)' % ','.join('?' * len(authors))
+            args += authors
+        if prefix:
+            # A range instead of LIKE, so that the primary key index
+            # on (filename, revision) can be used.
+            where += ' AND filename >= ? AND filename < ?'
+            args += [prefix, prefix[:-1] + unichr(ord(prefix[-1]) + 1)]
 
         def mkchange(row):
-            return Change(timestamp=row[0], author=row[1], log=row[2],
+            return Change(timestamp=row[0], author=row[1],
+                          log=self._log_text(row[2]),
                           filestatus=row[3], filename=row[4],
-                          revision=row[5], state=row[6], mode=row[7])
+                          revision=row[5], state=row[6], mode=row[7],
+                          commitid=row[8], branch=row[9])
 
         if not reentrant:
             for row in self.dbh.execute("""
                 SELECT timestamp, author, log, filestatus, filename,
-                       revision, state, mode
+                       revision, state, mode, commitid, branch
                 FROM change
                 WHERE %s
-                ORDER BY timestamp, filename, revision""" % where):
+                ORDER BY timestamp, rowid""" % where, args):
                 yield(mkchange(row))
             return
 
         self.dbh.execute("""
             CREATE TEMPORARY TABLE free_change AS
             SELECT timestamp, author, log, filestatus, filename,
-                   revision, state, mode
+                   revision, state, mode, commitid, branch
             FROM change
             LIMIT 0""")
         self.dbh.execute("""
@@ -230,17 +772,18 @@ class MetaDb(object):
         self.dbh.execute("""
             INSERT INTO free_change
             SELECT timestamp, author, log, filestatus, filename,
-                   revision, state, mode
+                   revision, state, mode, commitid, branch
             FROM change
-            WHERE %s""" % where)
+            WHERE %s
+            ORDER BY rowid""" % where, args)
 
         try:
             while True:
                 rows = self.dbh.execute("""
                     SELECT timestamp, author, log, filestatus, filename,
-                           revision, state, mode
+                           revision, state, mode, commitid, branch
                     FROM free_change
-                    ORDER BY timestamp
+                    ORDER BY timestamp, rowid
                     LIMIT 1000""").fetchall()
                 if len(rows) == 0:
                     break
@@ -254,10 +797,159 @@ class MetaDb(object):
         finally:
             self.dbh.execute('DROP TABLE IF EXISTS free_change')
 
+    def change_windows(self, quiet_period, after=None, until=None):
+        """Split the free changes into windows of time separated by
+        gaps of at least 'quiet_period' seconds, during which there
+        were no changes.  A ChangeSetGenerator can process the changes
+        in each window independently.
+
+        Returns a list of (min_time, max_time) tuples in ascending
+        order.  See changes_by_timestamp() for 'after' and 'until'.
+        """
+        where = 'changeset_id IS NULL AND rowid > %d' % (after or 0)
+        if until is not None:
+            where += ' AND rowid <= %d' % until
+
+        windows = []
+        min_time = None
+        for timestamp, next_timestamp in self.dbh.execute("""
+            SELECT t.timestamp,
+                   (SELECT MIN(c.timestamp) FROM change c
+                    WHERE c.timestamp > t.timestamp AND %(where)s)
+            FROM (SELECT DISTINCT timestamp FROM change
+                  WHERE %(where)s) t
+            ORDER BY t.timestamp""" % {'where':where}):
+            if min_time is None:
+                min_time = timestamp
+            if next_timestamp is None or \
+               next_timestamp - timestamp >= quiet_period:
+                windows.append((min_time, timestamp,))
+                min_time = None
+        return windows
+
+    def open_changesets(self):
+        """Return the list of open changesets saved by a previous call
+        to save_open_changesets(), in their original order.  Changes
+        which have been bound to a changeset since then are left out.
+        """
+        changesets = []
+        changeset = None
+        open_changeset_id = None
+        for row in self.dbh.execute("""
+            SELECT oc.open_changeset_id, c.timestamp, c.author, c.log,
+                   c.filestatus, c.filename, c.revision, c.state,
+                   c.mode, c.commitid, c.branch
+            FROM open_change oc
+            INNER JOIN change c
+                ON c.filename = oc.filename AND c.revision = oc.revision
+            WHERE c.changeset_id IS NULL
+            ORDER BY oc.open_changeset_id, c.timestamp"""):
+            change = Change(timestamp=row[1], author=row[2],
+                            log=self._log_text(row[3]),
+                            filestatus=row[4], filename=row[5],
+                            revision=row[6], state=row[7], mode=row[8],
+                            commitid=row[9], branch=row[10])
+            if changeset is None or open_changeset_id != row[0] or \
+               not changeset.integrate(change):
+                changeset = ChangeSet(change)
+                changesets.append(changeset)
+                open_changeset_id = row[0]
+        return changesets
+
+    def save_open_changesets(self, changesets, last_change):
+        """Replace the saved open changesets with 'changesets' and
+        record 'last_change' as the high-water mark of changes which
+        have been integrated into changesets.
+        """
+        self.dbh.execute('DELETE FROM open_change')
+        rows = []
+        for id, changeset in enumerate(changesets):
+            for change in changeset.changes:
+                rows.append((change.filename, change.revision, id,))
+        self.dbh.executemany("""
+            INSERT OR REPLACE INTO open_change
+                (filename, revision, open_changeset_id)
+            VALUES (?,?,?)""", rows)
+        self.set_state('last_change', last_change)
+
+    def changed_tags(self):
+        """Return a tuple (tags, skipped) where 'tags' is a sorted list
+        of (tag, mark) tuples for the tags that need to be created or
+        moved and 'skipped' is a sorted list of the tags that cannot be
+        resolved.
+
+        A tag is resolved to the imported changeset with the latest
+        end time among those that contain a tagged revision, after
+        which all tagged revisions are in place unless some were
+        committed out of order.  This requires that the tagged
+        revisions are all on the trunk or all on the same branch,
+        where the base revisions of the branch count as on the branch,
+        and that all of them are imported.  Other tags are skipped,
+        such as those on a branch that isn't imported.  A tag with
+        revisions that are waiting to be imported is left alone until
+        they are.
+        """
+        tags, skipped = [], []
+        # SQLite takes the bare column 'cs.mark' from the row with the
+        # maximum end time of each group.  The last column counts the
+        # trunk revisions of a branch tag that aren't on the branch.
+        for tag, mark, missing, pending, branches, last_mark, \
+                off_branch in self.dbh.execute("""
+            SELECT t.tag, t.mark, t.missing, t.pending, t.branches,
+                   t.last_mark,
+                   (SELECT COUNT(*)
+                    FROM symbol s
+                    INNER JOIN change c
+                        ON c.filename = s.filename
+                        AND c.revision = s.revision
+                    LEFT JOIN branch_base b
+                        ON b.branch = t.branch
+                        AND b.filename = s.filename
+                        AND b.revision = s.revision
+                    WHERE s.tag = t.tag AND c.branch IS NULL
+                    AND b.branch IS NULL)
+            FROM (SELECT s.tag AS tag, cs.mark AS mark,
+                         MAX(cs.end_time) AS end_time,
+                         COUNT(*) - COUNT(c.filename) AS missing,
+                         COUNT(c.filename) - COUNT(cs.mark) AS pending,
+                         COUNT(DISTINCT c.branch) AS branches,
+                         GROUP_CONCAT(DISTINCT c.branch) AS branch,
+                         tag.mark AS last_mark
+                  FROM symbol s
+                  LEFT JOIN change c
+                      ON c.filename = s.filename
+                      AND c.revision = s.revision
+                  LEFT JOIN changeset cs
+                      ON cs.id = c.changeset_id AND cs.mark IS NOT NULL
+                  LEFT JOIN tag ON tag.name = s.tag
+                  GROUP BY s.tag) t
+            ORDER BY t.tag"""):
+            if missing > 0 or branches > 1 or \
+                    (branches == 1 and off_branch > 0):
+                skipped.append(tag)
+            elif pending == 0 and mark != last_mark:
+                tags.append((tag, mark))
+        return tags, skipped
+
+    def mark_tags(self, tags):
+        """Record the (tag, mark) tuples in 'tags' as imported.
+        """
+        self.dbh.executemany('INSERT OR REPLACE INTO tag (name, mark) '
+                             'VALUES (?,?)', tags)
+        self.commit()
+
     def count_changesets(self):
         """Return the number of unmarked changesets (not imported).
         """
-        sql = 'SELECT COUNT(*) FROM changeset WHERE mark IS NULL'
+        sql = 'SELECT COUNT(*) FROM changeset ' \
+              'WHERE mark IS NULL AND NOT deferred'
+        return self.dbh.execute(sql).fetchone()[0]
+
+    def count_deferred_changesets(self):
+        """Return the number of unmarked deferred changesets.
+        """
+        sql = 'SELECT COUNT(*) FROM changeset ' \
+              'WHERE mark IS NULL AND deferred'
         return self.dbh.execute(sql).fetchone()[0]
 
     def _select_changesets(self, where):
@@ -265,7 +957,8 @@ class MetaDb(object):
         sql = """
             SELECT cs.id, cs.start_time, cs.end_time, c.timestamp,
                    c.author, c.log, c.filestatus, c.filename,
-                   c.revision, c.state, c.mode
+                   c.revision, c.state, c.mode, c.commitid, cs.snapshot,
+                   c.branch
             FROM changeset cs
             INNER JOIN change c ON c.changeset_id = cs.id
             WHERE %s
@@ -275,21 +968,29 @@ class MetaDb(object):
         for row in self.dbh.execute(sql):
             change = Change(timestamp=row[3],
                             author=row[4],
-                            log=row[5],
+                            log=self._log_text(row[5]),
                             filestatus=row[6],
                             filename=row[7],
                             revision=row[8],
                             state=row[9],
-                            mode=row[10])
+                            mode=row[10],
+                            commitid=row[11],
+                            branch=row[13])
 
             if changeset is None or changeset.id != row[0]:
                 if changeset:
                     yield(changeset)
 
-                changeset = ChangeSet(change, id=row[0])
+                if row[12]:
+                    changeset = SnapshotChangeSet(row[2], id=row[0])
+                    changeset.integrate(change)
+                else:
+                    changeset = ChangeSet(change, id=row[0])
                 changeset.provider = self
                 changeset.start_time = row[1]
                 changeset.end_time = row[2]
+            elif row[12]:
+                changeset.integrate(change)
             else:
                 changeset.changes.append(change)
 
@@ -308,9 +1009,42 @@ class MetaDb(object):
         """Yield a list of all unmarked changesets currently recorded
         in the database, ordered by their start time.
         """
-	where = '%(changeset)s.mark IS NULL'
+	where = '%(changeset)s.mark IS NULL AND NOT %(changeset)s.deferred'
         return self._select_changesets(where)
 
+    def search_changesets(self, query, limit=None):
+        """Return (mark, timestamp, author, log) tuples for at most
+        'limit' imported changesets whose log message matches 'query',
+        newest first.
+
+        'query' uses the SQLite full-text query syntax, e.g. "PR 1234"
+        matches messages with both words and '"PR 1234"' the phrase.
+        Without the full-text index, each word of 'query' is looked up
+        as a substring of the log messages instead, which is slow.
+        """
+        dbh = self.dbh
+        if limit is None:
+            limit = -1
+        if self._log_index:
+            where = 'cs.id IN (SELECT docid FROM changeset_log ' \
+                    'WHERE changeset_log MATCH ?)'
+            args = [query]
+        else:
+            words = query.split()
+            where = ' AND '.join(['log_text(c.log) LIKE ?'] *
+                                 len(words)) or '1'
+            args = map(lambda w: '%' + w + '%', words)
+        rows = dbh.execute("""
+            SELECT cs.mark, cs.end_time, c.author, c.log
+            FROM changeset cs
+            INNER JOIN change c ON c.rowid =
+                (SELECT MIN(rowid) FROM change
+                 WHERE changeset_id = cs.id)
+            WHERE cs.mark IS NOT NULL AND NOT cs.snapshot AND %s
+            ORDER BY cs.end_time DESC, cs.id DESC
+            LIMIT ?""" % where, args + [limit]).fetchall()
+        return map(lambda row: row[:3] + (self._log_text(row[3]),), rows)
+
     def all_authors(self):
         """Return a list of all author login names.
         """
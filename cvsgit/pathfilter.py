@@ -0,0 +1,87 @@
+"""Include and exclude rules for the files of a CVS module."""
+
+from fnmatch import fnmatchcase
+
+def _match(pattern, components):
+    """Return True if the glob 'pattern' matches the leading path
+    'components', one component at a time, so that '*' does not
+    match a '/'.
+    """
+    for p, c in zip(pattern, components):
+        if not fnmatchcase(c, p):
+            return False
+    return True
+
+class PathFilter(object):
+    """Select working copy paths relative to the module directory by
+    shell glob patterns.
+
+    A pattern matches a path if it matches the path itself or one of
+    its parent directories.  A path is selected if it matches one of
+    the 'include' patterns, or if there are none, and doesn't match
+    any of the 'exclude' patterns:
+
+    >>> f = PathFilter(['src', 'doc/*.txt'], ['src/*/tests'])
+    >>> f.selected('src/bin/ls.c'), f.selected('src/bin/tests/t.c')
+    (True, False)
+    >>> f.selected('doc/README.txt'), f.selected('doc/api/index.txt')
+    (True, False)
+    >>> f.selected('Makefile')
+    False
+
+    Directories can be pruned if nothing below them can be selected:
+
+    >>> f.pruned('src/bin'), f.pruned('src/bin/tests'), f.pruned('doc')
+    (False, True, False)
+    >>> f.pruned('lib')
+    True
+    >>> PathFilter().pruned('lib')
+    False
+    """
+
+    def __init__(self, include=None, exclude=None):
+        self.include = map(lambda p: p.strip('/').split('/'),
+                           include or [])
+        self.exclude = map(lambda p: p.strip('/').split('/'),
+                           exclude or [])
+
+    def __nonzero__(self):
+        """A filter is true if it doesn't select everything.
+        """
+        return len(self.include) > 0 or len(self.exclude) > 0
+
+    def selected(self, path):
+        """Return True if the file 'path' is selected.
+        """
+        components = path.split('/')
+        for pattern in self.exclude:
+            if len(pattern) <= len(components) and \
+                    _match(pattern, components):
+                return False
+        if len(self.include) == 0:
+            return True
+        for pattern in self.include:
+            if len(pattern) <= len(components) and \
+                    _match(pattern, components):
+                return True
+        return False
+
+    def pruned(self, dirpath):
+        """Return True if no file below the directory 'dirpath' can be
+        selected.  The empty path is the module directory.
+        """
+        if dirpath == '':
+            return False
+        components = dirpath.split('/')
+        for pattern in self.exclude:
+            if len(pattern) <= len(components) and \
+                    _match(pattern, components):
+                return True
+        if len(self.include) == 0:
+            return False
+        # An include pattern may still match the directory itself, one
+        # of its parents or something below it.
+        for pattern in self.include:
+            if _match(pattern, components):
+                return False
+        return True
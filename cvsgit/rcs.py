@@ -30,7 +30,7 @@ REV_AUTHOR = 2
 REV_STATE = 3
 REV_BRANCHES = 4
 REV_NEXT = 5
-REV_MODE = 6
+REV_COMMITID = 6
 
 class RCSError(Error):
     """Base class for exceptions from the cvsgit.rcs module.
@@ -74,19 +74,26 @@ class RCSFile(object):
     """Represents a single RCS file.
     """
 
-    def __init__(self, filename, encoding='iso8859-1'):
+    def __init__(self, filename, encoding='iso8859-1', path=None):
         """'encoding' sets the encoding assumed of log messages and
         delta text in RCS files.
+
+        'path' is the file to parse if it isn't 'filename', which is
+        then only the name by which the RCS file is known, e.g. in the
+        expansion of the $Source$ keyword.
         """
         self.filename = filename
         self.encoding = encoding
-        self.rcsfile = rcsparse.rcsfile(filename)
+        if path is None:
+            path = filename
+        self.rcsfile = rcsparse.rcsfile(path)
 
     head = property(lambda self: self.rcsfile.head)
     branch = property(lambda self: self.rcsfile.branch)
     expand = property(lambda self: self.rcsfile.expand)
     mode = property(lambda self: self.rcsfile.mode)
     revs = property(lambda self: self.rcsfile.revs)
+    symbols = property(lambda self: self.rcsfile.symbols)
 
     def revisions(self):
         """Yield all revision numbers from current HEAD backwards.
@@ -108,26 +115,109 @@ class RCSFile(object):
             yield(revision)
             revision = self.revs[revision][REV_NEXT]
 
-    def changes(self):
+    def branches(self):
+        """Return a dictionary that maps the symbolic names of all
+        branches to their branch numbers, e.g. 'STABLE' to '1.2.2' for
+        the "magic" branch number '1.2.0.2'.
+
+        Vendor branches are left out, since revisions() follows the
+        default branch already.
+        """
+        branches = {}
+        for name, number in self.symbols.items():
+            parts = number.split('.')
+            if len(parts) >= 4 and len(parts) % 2 == 0 and \
+                    parts[-2] == '0':
+                branches[name] = '.'.join(parts[:-2] + parts[-1:])
+        return branches
+
+    def tags(self):
+        """Return a dictionary that maps the symbolic names of all tags
+        to the revision numbers they refer to.
+        """
+        tags = {}
+        for name, number in self.symbols.items():
+            parts = number.split('.')
+            if len(parts) % 2 == 0 and not \
+                    (len(parts) >= 4 and parts[-2] == '0'):
+                tags[name] = number
+        return tags
+
+    def branch_revisions(self, number):
+        """Yield all revision numbers on the branch 'number' from the
+        oldest to the most recent.  Unlike on the trunk, the revisions
+        on a branch are linked in that direction.
+        """
+        base = number.rsplit('.', 1)[0]
+        if not self.revs.has_key(base):
+            return
+
+        prefix = number + '.'
+        for revision in self.revs[base][REV_BRANCHES]:
+            if revision.startswith(prefix):
+                break
+        else:
+            return
+
+        while revision != None:
+            yield(revision)
+            revision = self.revs[revision][REV_NEXT]
+
+    def changes(self, branches=None):
         """Yield Change objects for all revisions on HEAD
 
         The changes are generated by following the current head
         revision back to its origin.  The order of changes is thus
         from most recent to oldest.
+
+        If 'branches' is given, it is a function that tells by the
+        symbolic name of a branch whether the changes on that branch
+        should be yielded as well, which happens after those on HEAD.
         """
         for revision in self.revisions():
             change = self.change(revision)
             if change != None:
                 yield(change)
 
-    def change(self, revision):
+        if branches is None:
+            return
+
+        for name, number in sorted(self.branches().items()):
+            if not branches(name):
+                continue
+            # A file that is dead at the branch point is added on the
+            # branch by its first live revision.
+            base = number.rsplit('.', 1)[0]
+            dead = not self.revs.has_key(base) or \
+                self.revs[base][REV_STATE] == 'dead'
+            for revision in self.branch_revisions(number):
+                change = self.change(revision, branch=name, added=dead)
+                dead = self.revs[revision][REV_STATE] == 'dead'
+                if change != None:
+                    yield(change)
+
+    def change(self, revision, branch=None, added=False):
         """Return a single Change object for <revision>.
 
         If the revision is 1.1 and has state 'dead' then the file was
         added on a branch and None is returned.
+
+        'branch' is the symbolic name of the branch for a revision
+        that isn't on HEAD.  On a branch, 'added' tells whether the
+        file didn't exist before the revision, and None is returned
+        for dead revisions of files that didn't exist.
         """
         rev = self.revs[revision]
-        if rev[REV_STATE] == 'dead':
+        if branch is not None:
+            if rev[REV_STATE] == 'dead':
+                if added:
+                    return None
+                filestatus = FILE_DELETED
+            elif added:
+                filestatus = FILE_ADDED
+            else:
+                filestatus = FILE_MODIFIED
+        elif rev[REV_STATE] == 'dead':
             if revision == '1.1':
                 # This file was initially added on a branch and so
                 # the initial trunk revision was marked 'dead'. We
@@ -153,10 +243,14 @@ class RCSFile(object):
         # XXX: is this right?
         log = unicode(log, self.encoding)
 
-        if rev[REV_MODE] == None:
-            mode = ''
+        # RCS has no per-revision mode.  The last element of the
+        # revision tuple is the 'commitid' that CVS 1.12 and later
+        # record for all files committed together; it is None for
+        # revisions made by older versions of CVS.
+        if len(rev) > REV_COMMITID:
+            commitid = rev[REV_COMMITID]
         else:
-            mode = rev[REV_MODE]
+            commitid = None
 
         return Change(timestamp=rev[REV_TIMESTAMP],
                       author=rev[REV_AUTHOR],
@@ -165,7 +259,9 @@ class RCSFile(object):
                       filename=self.filename,
                       revision=revision,
                       state=rev[REV_STATE],
-                      mode=mode)
+                      mode='',
+                      commitid=commitid,
+                      branch=branch)
 
     def blob(self, revision):
         """Returns the revision's file content.
@@ -184,4 +280,6 @@ class RCSFile(object):
         print '  branches:', rev[REV_BRANCHES]
         print '  next:', rev[REV_NEXT]
         print '  state:', rev[REV_STATE]
+        if len(rev) > REV_COMMITID and rev[REV_COMMITID]:
+            print '  commitid:', rev[REV_COMMITID]
         print '  log:', self.rcsfile.getlog(revision).splitlines()[0]
@@ -0,0 +1,288 @@
+"""Sources from which the RCS files of a CVS repository are read."""
+
+import calendar
+import errno
+import os
+import shutil
+import stat
+import tarfile
+import tempfile
+import zipfile
+
+from cvsgit.i18n import _
+from cvsgit.rcs import RCSFile
+
+# Map the paths of the archives opened so far to (size, mtime, source)
+# tuples, so that each archive is only indexed again if it changed.
+# Worker processes forked later inherit the index.
+_archives = {}
+
+# Number of parsed RCS files that an ArchiveSource keeps, so that the
+# member isn't copied out of the archive again for each revision.
+RCSFILE_CACHE_SIZE = 64
+
+def open_source(path):
+    """Return the source of the files below the absolute 'path', which
+    is either a directory or a path within a tar or zip archive, such
+    as "/var/tmp/cvs.tar/src", or None if it is neither.
+
+    Raises TypeError if the archive is a compressed tar archive.
+    """
+    archive = path
+    while not os.path.exists(archive):
+        parent = os.path.dirname(archive)
+        if parent == archive:
+            return None
+        archive = parent
+
+    if os.path.isdir(archive):
+        if archive != path:
+            return None
+        return DirectorySource()
+    elif zipfile.is_zipfile(archive):
+        return _open_archive(ZipSource, archive)
+    elif tarfile.is_tarfile(archive):
+        return _open_archive(TarSource, archive)
+    else:
+        return None
+
+def _open_archive(cls, archive):
+    st = os.stat(archive)
+    if _archives.has_key(archive) and \
+            _archives[archive][:2] == (st.st_size, st.st_mtime):
+        return _archives[archive][2]
+    source = cls(archive)
+    _archives[archive] = (st.st_size, st.st_mtime, source)
+    return source
+
+class DirectorySource(object):
+    """The files of a CVS repository in the filesystem.
+
+    All paths are absolute.  The methods behave like the functions of
+    the same name in the os and os.path modules.
+    """
+
+    def isdir(self, path):
+        return os.path.isdir(path)
+
+    def isfile(self, path):
+        return os.path.isfile(path)
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def getsize(self, path):
+        return os.path.getsize(path)
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def walk(self, top, onerror=None):
+        return os.walk(top, onerror=onerror)
+
+    def read(self, path):
+        """Return the content of the file 'path'.
+        """
+        f = file(path, 'rb')
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def rcsfile(self, path):
+        """Return an RCSFile object for the RCS file 'path'.
+        """
+        return RCSFile(path)
+
+class ArchiveStat(object):
+    """The subset of the result of os.stat() that an archive records
+    for a member.
+    """
+
+    def __init__(self, mode, mtime, size):
+        self.st_mode = mode
+        self.st_mtime = mtime
+        self.st_size = size
+
+class ArchiveSource(DirectorySource):
+    """The files of a CVS repository in an archive, which are read in
+    place instead of being extracted first.
+
+    The paths of the members are those they would have if the archive
+    file were a directory.  Only an index of the members is kept in
+    memory.  Each RCS file is copied to a temporary file to be parsed,
+    since rcsparse can only read files, and the most recently parsed
+    files are kept for reading further revisions.
+
+    Subclasses add the members to the index and implement open(data),
+    which returns a file object for reading the member described by
+    'data' (see add_member()).
+    """
+
+    def __init__(self, archive):
+        self.archive = archive
+        # Map the names of the files to their ArchiveStat objects and
+        # what open() needs, and the names of all directories, also
+        # those only implied by member names, to the lists of the
+        # names of their subdirectories and files.
+        self.files = {}
+        self.dirs = {'': ([], [])}
+        # Map the paths of recently parsed RCS files to their RCSFile
+        # objects (see rcsfile()).
+        self.rcsfiles = {}
+
+    def add_member(self, name, st, data):
+        """Add a member to the index.  'data' is whatever open()
+        needs to read the member, None for a directory.
+        """
+        name = os.path.normpath(name).lstrip(os.sep)
+        if name in ('', os.curdir, os.pardir) or \
+                name.startswith(os.pardir + os.sep):
+            return
+        if data is None:
+            self._add_dir(name)
+        else:
+            self.files[name] = (st, data)
+            parent, base = os.path.split(name)
+            self._add_dir(parent)
+            self.dirs[parent][1].append(base)
+
+    def _add_dir(self, name):
+        if name in self.dirs:
+            return
+        self.dirs[name] = ([], [])
+        parent, base = os.path.split(name)
+        self._add_dir(parent)
+        self.dirs[parent][0].append(base)
+
+    def _name(self, path):
+        """Return the member name for 'path' or None if 'path' is not
+        within the archive.
+        """
+        if path == self.archive:
+            return ''
+        elif path.startswith(self.archive + os.sep):
+            return os.path.normpath(path[len(self.archive) + 1:])
+        else:
+            return None
+
+    def _member(self, path):
+        name = self._name(path)
+        if not self.files.has_key(name):
+            raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        return self.files[name]
+
+    def isdir(self, path):
+        return self.dirs.has_key(self._name(path))
+
+    def isfile(self, path):
+        return self.files.has_key(self._name(path))
+
+    def exists(self, path):
+        return self.isdir(path) or self.isfile(path)
+
+    def getsize(self, path):
+        return self._member(path)[0].st_size
+
+    def stat(self, path):
+        return self._member(path)[0]
+
+    def walk(self, top, onerror=None):
+        name = self._name(top)
+        if not self.dirs.has_key(name):
+            if onerror is not None:
+                onerror(OSError(errno.ENOENT, os.strerror(errno.ENOENT),
+                                top))
+            return
+        dirnames, filenames = map(sorted, self.dirs[name])
+        yield top, dirnames, filenames
+        # As with os.walk(), the caller may remove names from
+        # 'dirnames' to skip those directories.
+        for dirname in dirnames:
+            for result in self.walk(os.path.join(top, dirname), onerror):
+                yield result
+
+    def read(self, path):
+        f = self.open(self._member(path)[1])
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def rcsfile(self, path):
+        if not self.rcsfiles.has_key(path):
+            if len(self.rcsfiles) >= RCSFILE_CACHE_SIZE:
+                self.rcsfiles.clear()
+            self.rcsfiles[path] = self._parse(path)
+        return self.rcsfiles[path]
+
+    def _parse(self, path):
+        data = self._member(path)[1]
+        f = self.open(data)
+        try:
+            temp = tempfile.NamedTemporaryFile(suffix=',v')
+            try:
+                shutil.copyfileobj(f, temp)
+                temp.flush()
+                # rcsparse maps the whole file into memory, so the
+                # temporary file can be removed right away.
+                return RCSFile(path, path=temp.name)
+            finally:
+                temp.close()
+        finally:
+            f.close()
+
+class TarSource(ArchiveSource):
+    """The files of a CVS repository in an uncompressed tar archive.
+
+    Compressed tar archives are not supported, because the fulltexts
+    of the revisions are read from the RCS files in the order of the
+    changesets, and seeking backwards would decompress the archive
+    from the start each time.
+    """
+
+    def __init__(self, archive):
+        ArchiveSource.__init__(self, archive)
+        try:
+            self.tar = tarfile.open(archive, 'r:')
+        except tarfile.ReadError:
+            raise TypeError, _('not a CVS repository path (%s): %s') \
+                % (_('compressed tar archives are not supported'),
+                   archive)
+        for member in self.tar:
+            st = ArchiveStat(stat.S_IFREG | member.mode,
+                             member.mtime, member.size)
+            if member.isdir():
+                self.add_member(member.name, st, None)
+            elif member.isreg():
+                self.add_member(member.name, st, member)
+        self.pid = os.getpid()
+
+    def open(self, member):
+        if self.pid != os.getpid():
+            # A forked worker process would otherwise share the file
+            # position with its parent.  ZipFile.open() always opens
+            # the archive anew.
+            self.tar.fileobj = file(self.archive, 'rb')
+            self.pid = os.getpid()
+        return self.tar.extractfile(member)
+
+class ZipSource(ArchiveSource):
+    """The files of a CVS repository in a zip archive.
+    """
+
+    def __init__(self, archive):
+        ArchiveSource.__init__(self, archive)
+        self.zip = zipfile.ZipFile(archive)
+        for info in self.zip.infolist():
+            # The permissions are only recorded by Unix archivers.
+            mode = info.external_attr >> 16 or stat.S_IFREG | 0644
+            mtime = calendar.timegm(info.date_time + (0, 0, 0))
+            st = ArchiveStat(mode, mtime, info.file_size)
+            if info.filename.endswith('/'):
+                self.add_member(info.filename, st, None)
+            else:
+                self.add_member(info.filename, st, info)
+
+    def open(self, info):
+        return self.zip.open(info)
@@ -1,22 +1,132 @@
 """Terminal interface and other UI functions."""
 
+from contextlib import contextmanager
 import sys
+import threading
 import time
 
 from cvsgit.i18n import _
 
-class Progress(object):
+# The Progress objects whose background threads are running.
+_tickers = set()
+
+def format_duration(seconds):
+    """Return 'seconds' formatted as [H:]MM:SS.
+
+    >>> format_duration(75)
+    '1:15'
+    >>> format_duration(3725.4)
+    '1:02:05'
+    """
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return '%d:%02d:%02d' % (hours, minutes, seconds)
+    return '%d:%02d' % (minutes, seconds)
+
+class ProgressPhase(object):
+    """The progress of one of several concurrent tasks shown by a
+    Progress object (see Progress.phase()).
+
+    Calling the object with the same message only records the count
+    and the total, which is cheap enough to be done for every item of
+    work.  A new message is shown immediately on a terminal (see
+    Progress.start()).
+    """
+
+    # Weight of the latest rate sample in the smoothed rate.
+    smoothing = 0.3
+
+    def __init__(self, progress):
+        self.progress = progress
+        self.message = None
+        self.state = (None, None)
+        self.reset_rate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, value, traceback):
+        self.progress.remove_phase(self)
+        return False
+
+    def __call__(self, message, count=None, total=None):
+        if message != self.message:
+            self.progress.start(self, message, count, total)
+        else:
+            self.state = (count, total)
+
+    def reset_rate(self):
+        self.rate = None
+        self.sample = None
+
+    def sample_rate(self, now):
+        """Update the smoothed rate at which the count grows.
+        """
+        count = self.state[0]
+        if count is None:
+            return
+        if self.sample is not None and now > self.sample[0]:
+            rate = (count - self.sample[1]) / (now - self.sample[0])
+            if self.rate is None:
+                self.rate = rate
+            else:
+                self.rate = self.smoothing * rate + \
+                    (1 - self.smoothing) * self.rate
+        self.sample = (now, count)
+
+    def text(self):
+        """Return the text showing the progress of this phase.
+        """
+        message = self.message
+        count, total = self.state
+        if count == None:
+            return '%s...' % message
+        elif total == None:
+            return '%s: %d' % (message, count)
+        elif count == total:
+            return '%s: %s (%d/%d)' % (message, _('done.'), count, total)
+        elif self.rate:
+            return '%s: %3.0f%% (%d/%d, %s %s)' % \
+                (message, count * 100.0 / total, count, total, _('ETA'),
+                 format_duration((total - count) / self.rate))
+        else:
+            return '%s: %3.0f%% (%d/%d)' % \
+                (message, count * 100.0 / total, count, total)
+
+class Progress(ProgressPhase):
     """Display progress information.
+
+    Calling the object only records the progress (see ProgressPhase).
+    Within a 'with' block, a background thread shows it every second
+    on a terminal and every 30 seconds otherwise, with an estimate of
+    the remaining time based on the smoothed rate of progress.  What
+    is recorded last is shown when the block ends.  Outside of a
+    'with' block, only new messages are shown.
+
+    On a terminal, a new message is also shown at once within a block.
+    Otherwise, such as in the mail of a cron job, a block that ends
+    within 30 seconds shows a single line.
     """
 
-    def __init__(self):
+    # Seconds between two samples of the rate of progress.
+    tick_interval = 1
+
+    def __init__(self, stream=None):
+        ProgressPhase.__init__(self, self)
+        if stream is None:
+            stream = sys.stdout
+        self.stream = stream
+        self.phases = [self]
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.ticker = None
+        self.stopped = threading.Event()
         self.last_progress = 0
-        self.last_message = ''
-        self.last_count = None
-        self.last_total = None
-        self.update_suppressed = False
+        self.last_line = None
+        self.tty = stream.isatty()
 
-        if sys.stdout.isatty():
+        if self.tty:
             self.update_interval = 1
             self.update = self.update_tty
             self.finish = self.finish_tty
@@ -26,72 +136,138 @@ class Progress(object):
             self.finish = self.finish_dumb
 
     def __enter__(self):
-        self.last_progress = time.time()
+        self.depth += 1
+        if self.depth == 1:
+            self.last_progress = time.time()
+            self.start_ticker()
+        return self
 
     def __exit__(self, exception_type, value, traceback):
-        self.last_progress = 0
-        if self.update_suppressed:
-            self.update(self.last_message, self.last_count, self.last_total)
-            self.update_suppressed = False
-        self.finish()
-        self.last_message = None
+        self.depth -= 1
+        if self.depth == 0:
+            self.stop_ticker()
+            with self.lock:
+                self.render()
+                self.finish()
+                self.message = None
+                self.phases = [self]
         return False
 
-    def __call__(self, message, count=None, total=None):
-        if (self.last_message and message != self.last_message) or \
-                time.time() - self.last_progress > self.update_interval:
-            self.last_progress = time.time()
-            self.update(message, count, total)
-            self.update_suppressed = False
-        else:
-            self.update_suppressed = True
-        self.last_message = message
-        self.last_count = count
-        self.last_total = total
-
-    def update_tty(self, message, count, total):
-        if self.last_message:
-            sys.stdout.write('\r' + (' ' * len(self.last_message)) + '\r')
-        if count == None:
-            sys.stdout.write('%s...' % message)
-        elif total == None:
-            sys.stdout.write('%s: %d' % (message, count))
-        elif count == total:
-            sys.stdout.write('%s: %s (%d/%d)' % \
-                (message, _('done.'), count, total))
-        else:
-            sys.stdout.write('%s: %3.0f%% (%d/%d)' % \
-                (message, count * 100.0 / total, count, total))
-        sys.stdout.flush()
+    def phase(self):
+        """Return a new ProgressPhase that is shown after the phases
+        already shown, until it is used as a context manager and its
+        block ends.
+        """
+        phase = ProgressPhase(self)
+        with self.lock:
+            self.phases.append(phase)
+        return phase
+
+    def remove_phase(self, phase):
+        """Stop showing 'phase', unless it is this object itself.
+        """
+        if phase is not self:
+            with self.lock:
+                self.phases.remove(phase)
+
+    def start(self, phase, message, count, total):
+        """Record the new 'message' of 'phase' and show it, unless it
+        is left to the background thread (see above).
+        """
+        with self.lock:
+            phase.message = message
+            phase.state = (count, total)
+            phase.reset_rate()
+            if self.depth == 0:
+                self.render()
+                self.finish()
+            elif self.tty:
+                self.render()
+
+    def start_ticker(self):
+        self.stopped.clear()
+        self.ticker = threading.Thread(target=self.run_ticker)
+        self.ticker.daemon = True
+        self.ticker.start()
+        _tickers.add(self)
+
+    def stop_ticker(self):
+        _tickers.discard(self)
+        self.stopped.set()
+        self.ticker.join()
+        self.ticker = None
+
+    def run_ticker(self):
+        while not self.stopped.wait(self.tick_interval):
+            now = time.time()
+            with self.lock:
+                for phase in self.phases:
+                    phase.sample_rate(now)
+                if now - self.last_progress >= self.update_interval:
+                    self.render()
+
+    def render(self):
+        """Show the progress of all phases unless it is unchanged.
+        Must be called with the lock held.
+        """
+        self.last_progress = time.time()
+        texts = map(lambda p: p.text(),
+                    filter(lambda p: p.message, self.phases))
+        line = '; '.join(texts)
+        if texts and line != self.last_line:
+            self.update(line)
+            self.last_line = line
+
+    def update_tty(self, line):
+        if self.last_line:
+            self.stream.write('\r' + (' ' * len(self.last_line)) + '\r')
+        self.stream.write(line)
+        self.stream.flush()
 
     def finish_tty(self):
-        sys.stdout.write('\n')
+        if self.last_line:
+            self.stream.write('\n')
+        self.last_line = None
 
-    def update_dumb(self, message, count, total):
-        if count == None:
-            sys.stdout.write('%s...\n' % message)
-        elif total == None:
-            sys.stdout.write('%s: %d\n' % (message, count))
-        elif count == total:
-            sys.stdout.write('%s: %s (%d/%d)\n' % \
-                (message, _('done.'), count, total))
-        else:
-            sys.stdout.write('%s: %3.0f%% (%d/%d)\n' % \
-                (message, count * 100.0 / total, count, total))
-        sys.stdout.flush()
+    def update_dumb(self, line):
+        self.stream.write(line + '\n')
+        self.stream.flush()
 
     def finish_dumb(self):
-        pass
+        self.last_line = None
+
+@contextmanager
+def pause_progress():
+    """Stop the background threads of all Progress objects for the
+    duration of the 'with' block.
+
+    Worker processes must be forked in such a block, so that none of
+    them inherits a partly written progress line, which it would write
+    again when it exits.
+    """
+    paused = list(_tickers)
+    for progress in paused:
+        progress.stop_ticker()
+        with progress.lock:
+            progress.stream.flush()
+    try:
+        yield
+    finally:
+        for progress in paused:
+            progress.start_ticker()
 
 class NoProgress(object):
     """Behaves like Progress but does nothing.
     """
 
     def __enter__(self):
-        pass
+        return self
 
     def __exit__(self, exception_type, value, traceback):
         return False
 
     def __call__(self, message, count=None, total=None):
         pass
+
+    def phase(self):
+        return self
@@ -1,9 +1,11 @@
 """Utility functions and classes."""
 
+import calendar
 import os
 import shutil
 import tempfile
 import textwrap
+import time
 
 class Tempdir(object):
     """Manage a tempoarary directory
@@ -83,6 +85,24 @@ def stripnl(string):
     else:
         raise RuntimeError("string doesn't end in newline: %s" % string)
 
+def tsv_escape(value):
+    """Return 'value' as a field of tab-separated values, with
+    backslash, tab and newline characters escaped.  None becomes the
+    empty string.
+
+    >>> print tsv_escape('a\\tb\\\\c\\n')
+    a\\tb\\\\c\\n
+    >>> tsv_escape(None)
+    u''
+    """
+    if value is None:
+        return u''
+    value = unicode(value)
+    for c, escaped in (('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'),
+                       ('\r', '\\r')):
+        value = value.replace(c, escaped)
+    return value
+
 def dedent(docstring):
     """Dedent a Python docstring treating the first line special.
 
@@ -91,3 +111,33 @@ def dedent(docstring):
     """
     lines = docstring.splitlines()
     return '\n'.join((lines[0], textwrap.dedent('\n'.join(lines[1:])),))
+
+def parse_date(string):
+    """Convert a date in UTC to seconds since the epoch.
+
+    The date can be given as "YYYY-MM-DD", optionally followed by
+    "HH:MM" or "HH:MM:SS" and "UTC", or as "@SECONDS".
+
+    >>> parse_date('2011-09-07')
+    1315353600
+    >>> parse_date('2011-09-07 22:41:51 UTC')
+    1315435311
+    >>> parse_date('@1315435311')
+    1315435311
+    >>> parse_date('yesterday')
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid date: yesterday
+    """
+    if string.startswith('@') and string[1:].isdigit():
+        return int(string[1:])
+
+    date = string.strip()
+    if date.endswith(' UTC'):
+        date = date[:-len(' UTC')]
+    for format in ('%Y-%m-%d', '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return calendar.timegm(time.strptime(date, format))
+        except ValueError:
+            pass
+    raise ValueError, 'invalid date: %s' % string
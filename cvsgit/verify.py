@@ -0,0 +1,384 @@
+"""Verification of Git trees against the CVS repository."""
+
+import bisect
+import multiprocessing
+import os
+import re
+import time
+
+from cvsgit.cvs import CVS
+from cvsgit.git import Git, blob_sha1
+from cvsgit.i18n import _
+from cvsgit.rcs import REV_TIMESTAMP, REV_STATE
+from cvsgit.term import NoProgress
+
+def parse_note(note):
+    """Return a dictionary that maps filenames to RCS revisions from
+    the text of a note in refs/notes/cvs.
+
+    >>> sorted(parse_note('a b.c 1.2\\nd 1.1.1.1\\ne 1.3 dead\\n').items())
+    [('a b.c', '1.2'), ('d', '1.1.1.1'), ('e', '1.3')]
+    """
+    revisions = {}
+    for line in note.splitlines():
+        if line.endswith(' dead'):
+            line = line[:-len(' dead')]
+        if ' ' in line:
+            filename, revision = line.rsplit(' ', 1)
+            revisions[filename] = revision
+    return revisions
+
+# Relative weights for sampling files of each kind.  Binary files and
+# files with RCS keywords are the most likely to be converted wrongly.
+SAMPLE_WEIGHTS = {'binary': 4, 'keywords': 4, 'text': 1}
+
+_keyword_re = re.compile('\$[A-Z][A-Za-z]+(:[^$\r\n]*)?\$')
+
+# Number of parsed RCS files that a TreeVerifier keeps for computing
+# the SHA-1 of further revisions.
+RCSFILE_CACHE_SIZE = 256
+
+def _verify_range(args):
+    """Verify the commits from 'first' up to 'last' in a worker process
+    and return the results of TreeVerifier.verify_history() up to and
+    including the first commit that doesn't match.
+    """
+    directory, source, pathfilter, first, last = args
+    verifier = TreeVerifier(CVS(source, None, pathfilter))
+    results = []
+    for result in verifier.verify_history(Git(directory), first, last):
+        results.append(result)
+        if len(result[2]) > 0:
+            break
+    return results
+
+def verify_history_parallel(cvs, git, commits, jobs):
+    """Yield the same results as TreeVerifier.verify_history() for
+    'commits', which must be ordered from the oldest to the newest,
+    but split them into ranges that are verified by 'jobs' worker
+    processes.  The first commit of each range is compared in full.
+    Results are yielded in order, but only up to the first commit
+    that doesn't match in each range.
+    """
+    size = (len(commits) + jobs - 1) / jobs
+    tasks = []
+    for start in range(0, len(commits), size):
+        tasks.append((git.directory, cvs.prefix, cvs.pathfilter,
+                      commits[start],
+                      commits[min(start + size, len(commits)) - 1]))
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for results in pool.imap(_verify_range, tasks):
+            for result in results:
+                yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+class TreeVerifier(object):
+    """Compare Git trees with the state of the CVS repository at a
+    given time without checking anything out.
+
+    The expected content of each file is computed straight from the
+    RCS file, with keywords expanded the same way as during import,
+    and compared by its Git blob SHA-1 with the output of "git ls-tree".
+    The SHA-1 of each revision is computed only once, and the most
+    recently parsed RCS files are kept to compute those of other
+    revisions, which makes it cheap to verify many commits.
+    """
+
+    def __init__(self, cvs):
+        """'cvs' is the CVS object of the repository to compare with.
+        """
+        self.cvs = cvs
+        self.files = {}
+        self.events = None
+        self.blobs = {}
+        self.weights = {}
+        self.rcsfiles = {}
+
+    def load(self, progress=None):
+        """Collect the revision history of all RCS files.  This is
+        done on demand when the whole tree is compared, but may be
+        called explicitly to report the progress.
+        """
+        if progress is None:
+            progress = NoProgress()
+
+        rcsfiles = self.cvs.rcs_filenames(progress=progress)
+        self.events = []
+        count = 0
+        with progress:
+            for rcsfile in rcsfiles:
+                filename = self.cvs.working_filename(rcsfile)
+                self.files[filename] = self._read(
+                    os.path.join(self.cvs.prefix, rcsfile))
+                for timestamp, dummy, dummy in self.files[filename][2]:
+                    self.events.append((timestamp, filename))
+                count += 1
+                progress(_('Reading RCS files'), count, len(rcsfiles))
+            self.events.sort()
+
+    def _read(self, abspath):
+        """Return an (abspath, mode, timeline) tuple for the RCS file
+        at 'abspath', where 'timeline' is the list of (timestamp,
+        revision, dead) tuples that "cvs checkout -D" chooses from.
+        """
+        rcs = self._rcsfile(abspath)
+        timeline = []
+        for revision in rcs.revisions():
+            rev = rcs.revs[revision]
+            timeline.append((rev[REV_TIMESTAMP], revision,
+                             rev[REV_STATE] == 'dead'))
+        timeline.sort()
+
+        if self.cvs.source.stat(abspath).st_mode & 0111:
+            mode = '100755'
+        else:
+            mode = '100644'
+        return (abspath, mode, timeline)
+
+    def _rcsfile(self, abspath):
+        """Return the parsed RCS file at 'abspath', from the cache of
+        recently parsed files if possible.
+        """
+        if not self.rcsfiles.has_key(abspath):
+            if len(self.rcsfiles) >= RCSFILE_CACHE_SIZE:
+                self.rcsfiles.clear()
+            self.rcsfiles[abspath] = self.cvs.source.rcsfile(abspath)
+        return self.rcsfiles[abspath]
+
+    def _file(self, filename):
+        """Return the tuple from _read() for the working copy file
+        'filename', or None if there is no RCS file for it.  Single
+        files are read on demand if load() hasn't been called.
+        """
+        if not self.files.has_key(filename):
+            if self.events is not None or \
+                    not self.cvs.pathfilter.selected(filename):
+                return None
+            rcsfile = os.path.join(self.cvs.prefix, filename + ',v')
+            if not self.cvs.source.isfile(rcsfile):
+                rcsfile = os.path.join(self.cvs.prefix,
+                                       os.path.dirname(filename), 'Attic',
+                                       os.path.basename(filename) + ',v')
+            if not self.cvs.source.isfile(rcsfile):
+                return None
+            self.files[filename] = self._read(rcsfile)
+        return self.files[filename]
+
+    def expected_tree(self, timestamp):
+        """Return a dictionary that maps working copy filenames to
+        (mode, sha1) tuples for the files that "cvs checkout -D" would
+        produce at 'timestamp' (in seconds since the epoch.)
+        """
+        if self.events is None:
+            self.load()
+
+        tree = {}
+        for filename in self.files.keys():
+            expected = self.expected_file(filename, timestamp)
+            if expected is not None:
+                tree[filename] = expected[1:]
+        return tree
+
+    def expected_file(self, filename, timestamp):
+        """Return a (revision, mode, sha1) tuple for the working copy
+        file 'filename' as "cvs checkout -D" would produce it at
+        'timestamp', or None if the file would not exist.
+        """
+        if self._file(filename) is None:
+            return None
+
+        abspath, mode, timeline = self._file(filename)
+        i = bisect.bisect_right(timeline, (timestamp, '\xff', True))
+        if i == 0:
+            return None
+        dummy, revision, dead = timeline[i - 1]
+        if dead:
+            return None
+        return (revision, mode, self.sha1(abspath, revision))
+
+    def changed_files(self, after, until):
+        """Return the set of working copy filenames that have RCS
+        revisions with a timestamp after 'after' and up to 'until'.
+        """
+        if self.events is None:
+            self.load()
+
+        start = bisect.bisect_right(self.events, (after, '\xff'))
+        end = bisect.bisect_right(self.events, (until, '\xff'))
+        return set(map(lambda e: e[1], self.events[start:end]))
+
+    def sha1(self, abspath, revision):
+        """Return the blob SHA-1 of 'revision' of the RCS file at
+        'abspath' after keyword expansion.
+        """
+        key = (abspath, revision)
+        if not self.blobs.has_key(key):
+            rcsfile = self._rcsfile(abspath)
+            change = rcsfile.change(revision)
+            blob = self.cvs.expand_keywords(rcsfile.blob(revision),
+                                            change, rcsfile, revision)
+            self.blobs[key] = blob_sha1(blob)
+        return self.blobs[key]
+
+    def verify(self, tree, timestamp, filenames=None, revisions=None):
+        """Compare 'tree', as returned by Git.ls_tree(), against the
+        state of the CVS repository at 'timestamp'.
+
+        If 'filenames' is given, only those files are compared.
+        'revisions' may map filenames to the RCS revisions recorded
+        for the commit in refs/notes/cvs, which are then checked as
+        well.
+
+        Returns a list of (filename, message) tuples for all files
+        that differ, sorted by filename.  The list is empty if the
+        tree matches.
+        """
+        if filenames is None:
+            if self.events is None:
+                self.load()
+            filenames = set(tree.keys()) | set(self.files.keys())
+        if revisions is None:
+            revisions = {}
+
+        mismatches = []
+        for filename in filenames:
+            expected = self.expected_file(filename, timestamp)
+            if expected is None:
+                if tree.has_key(filename):
+                    mismatches.append((filename, _('only in Git')))
+                continue
+            revision, mode, sha1 = expected
+
+            if not tree.has_key(filename):
+                mismatches.append((filename, _('only in CVS')))
+            elif tree[filename][1] != sha1:
+                mismatches.append((filename, _('content differs')))
+            elif tree[filename][0] != mode:
+                mismatches.append((filename, _('mode differs (%s, '
+                                               'expected %s)') % \
+                                       (tree[filename][0], mode)))
+            elif revisions.has_key(filename) and \
+                    revisions[filename] != revision:
+                mismatches.append((filename, _('imported revision %s, '
+                                               'expected %s') % \
+                                       (revisions[filename], revision)))
+        mismatches.sort()
+        return mismatches
+
+    def verify_history(self, git, first, last, notes='refs/notes/cvs'):
+        """Yield a (commit, timestamp, mismatches) tuple for each commit
+        from 'first' up to 'last', oldest first, as verify() would.
+
+        Only the tree of 'first' is compared in full.  For each later
+        commit, only the files that the commit modified, that its note
+        in 'notes' lists, and that have RCS revisions since the
+        previous commit are compared, which is sufficient because no
+        other file can have changed in either Git or CVS.
+        """
+        tree = git.ls_tree(first)
+        timestamp = git.commit_timestamp(first)
+        yield (first, timestamp, self.verify(tree, timestamp))
+
+        for commit, next_timestamp, note, changes in \
+                git.log_raw('%s..%s' % (first, last), notes=notes):
+            # Commit timestamps are not necessarily increasing when
+            # changesets overlap in time.
+            filenames = self.changed_files(min(timestamp, next_timestamp),
+                                           max(timestamp, next_timestamp))
+            for mode, sha1, status, path in changes:
+                if status == 'D':
+                    if tree.has_key(path):
+                        del tree[path]
+                else:
+                    tree[path] = (mode, sha1)
+                filenames.add(path)
+
+            revisions = parse_note(note)
+            filenames.update(revisions.keys())
+            timestamp = next_timestamp
+            yield (commit, timestamp, self.verify(tree, timestamp,
+                                                  filenames, revisions))
+
+    def file_kind(self, filename):
+        """Return 'binary' if the RCS file for the working copy file
+        'filename' disables keyword expansion, 'keywords' if its head
+        revision contains RCS keywords and 'text' otherwise.
+        """
+        if not self.weights.has_key(filename):
+            rcsfile = self._rcsfile(self._file(filename)[0])
+            if rcsfile.expand in ('b', 'o'):
+                kind = 'binary'
+            elif _keyword_re.search(rcsfile.blob(rcsfile.head)):
+                kind = 'keywords'
+            else:
+                kind = 'text'
+            self.weights[filename] = kind
+        return self.weights[filename]
+
+    def verify_sample(self, git, commits, random, count=None, budget=None,
+                      candidates=8):
+        """Yield a (commit, timestamp, filename, mismatches) tuple for
+        each file of a random sample from the trees of 'commits', which
+        must be ordered from the newest to the oldest.
+
+        Commits are chosen with a bias toward recent history.  From
+        each commit, one of several 'candidates' files is chosen
+        according to SAMPLE_WEIGHTS.  'random' is a random.Random
+        instance, which makes the sample reproducible.  Sampling stops
+        after 'count' files or 'budget' seconds, whichever is first.
+        """
+        start_time = time.time()
+        trees = {}
+        seen = set()
+        sampled = 0
+        attempts = 0
+        while len(commits) > 0:
+            if count is not None and sampled >= count:
+                break
+            if budget is not None and time.time() - start_time >= budget:
+                break
+            # Give up when the sample covers (almost) everything.
+            attempts += 1
+            if attempts > 10 * (sampled + 100):
+                break
+
+            commit = commits[int(len(commits) * random.random() ** 2)]
+            if not trees.has_key(commit):
+                if len(trees) >= 16:
+                    trees.clear()
+                trees[commit] = (git.commit_timestamp(commit),
+                                 git.ls_tree(commit))
+            timestamp, tree = trees[commit]
+            if len(tree) == 0:
+                continue
+
+            filenames = sorted(tree.keys())
+            filenames = random.sample(filenames,
+                                      min(candidates, len(filenames)))
+            weights = []
+            for filename in filenames:
+                if self._file(filename) is None:
+                    # Only in Git, which verify() will report.
+                    weights.append(1)
+                else:
+                    kind = self.file_kind(filename)
+                    weights.append(SAMPLE_WEIGHTS[kind])
+            choice = random.random() * sum(weights)
+            for filename, weight in zip(filenames, weights):
+                choice -= weight
+                if choice < 0:
+                    break
+
+            if (commit, filename) in seen:
+                continue
+            seen.add((commit, filename))
+            sampled += 1
+            yield (commit, timestamp, filename,
+                   self.verify(tree, timestamp, [filename]))
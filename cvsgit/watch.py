@@ -0,0 +1,91 @@
+"""Change notification for RCS files in a CVS repository."""
+
+import time
+
+# pyinotify is optional.  Without it, the Watcher falls back to
+# waiting for the full timeout, after which the caller rescans the
+# repository.
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+# Seconds to wait for more events after the first one, so that a
+# burst of modifications (a multi-file commit or a mirror run) is
+# reported at once.
+SETTLE_TIME = 1
+
+class Watcher(object):
+    """Wait for modifications of RCS files below a directory.
+
+    >>> w = Watcher('/nonexistent', inotify=False)
+    >>> w.wait(0)
+    True
+    """
+
+    def __init__(self, directory, inotify=True):
+        """Watch 'directory' recursively.
+
+        If 'inotify' is False or pyinotify is not installed, every
+        call to wait() simply sleeps for the given timeout.
+        """
+        self.directory = directory
+        self.changed = set()
+        self.rescan = False
+        self.notifier = None
+
+        if inotify and pyinotify is not None:
+            mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO | \
+                pyinotify.IN_CREATE | pyinotify.IN_DELETE | \
+                pyinotify.IN_ATTRIB
+            wm = pyinotify.WatchManager()
+            self.notifier = pyinotify.Notifier(wm, self._event)
+            wm.add_watch(directory, mask, rec=True, auto_add=True)
+
+    def _event(self, event):
+        if event.dir:
+            # Files may have been created in a new directory before
+            # it was watched, such as by rsync, or moved in with it.
+            self.rescan = True
+        elif event.pathname.endswith(',v'):
+            self.changed.add(event.pathname)
+
+    def wait(self, timeout=None):
+        """Wait until RCS files were modified or 'timeout' seconds
+        have passed, whichever happens first.
+
+        Returns True if RCS files may have been modified, in which case
+        the absolute pathnames of those files which are known to have
+        been modified are in the 'changed' attribute.  If directories
+        were created or moved, the 'rescan' attribute is True and the
+        whole repository must be scanned, since files in them may not
+        have been noticed.  The caller is responsible for calling
+        clear() afterwards.
+        """
+        if self.notifier is None:
+            if timeout:
+                time.sleep(timeout)
+            return True
+
+        if timeout is not None:
+            timeout = int(timeout * 1000)
+        if not self.notifier.check_events(timeout):
+            return False
+
+        while True:
+            self.notifier.read_events()
+            self.notifier.process_events()
+            if not self.notifier.check_events(SETTLE_TIME * 1000):
+                break
+        return self.rescan or len(self.changed) > 0
+
+    def clear(self):
+        """Forget the modifications reported by wait().
+        """
+        self.changed.clear()
+        self.rescan = False
+
+    def close(self):
+        if self.notifier is not None:
+            self.notifier.stop()
+            self.notifier = None
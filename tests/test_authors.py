@@ -59,3 +59,12 @@ class Test(unittest.TestCase):
             authors.write('nobody Non-existent User\n')
         with self.assertRaises(UnknownAuthorFullnames):
             self.cvs_clone('--authors=authors', '--stop-on-unknown-author')
+
+    def test_clone_from_date_with_authors(self):
+        """Clone from a date with --stop-on-unknown-author.
+        """
+        with open('authors', 'w') as authors:
+            authors.write('uwe Some Dude\n')
+        self.cvs_clone('--authors=authors', '--stop-on-unknown-author',
+                       '-D', '2030-01-01')
+        self.assertEquals('git-cvs <git-cvs>', self.git_authors())
@@ -1,10 +1,14 @@
 import os
 from os.path import dirname, join, isfile
 from shutil import rmtree
+from StringIO import StringIO
+from subprocess import PIPE, Popen
+import sys
 import unittest
 
 from cvsgit.command.init import init
 from cvsgit.command.clone import Clone
+from cvsgit.command.fetch import fetch
 from cvsgit.command.pull import pull
 from cvsgit.command.verify import Verify
 from cvsgit.git import Git
@@ -20,6 +24,10 @@ class Test(unittest.TestCase):
             self.assertEquals(Clone().eval('--quiet', '--no-skip-latest', source), 0)
             os.chdir('tree')
             self.assertEquals(0, Verify().eval())
+            self.assertEquals(0, Verify().eval('--quiet', '--blobs'))
+            self.assertEquals(0, Verify().eval('--quiet', '--blobs',
+                                               '--history'))
+            self.assertEquals(0, Verify().eval('--quiet', '--sample', '3'))
 
             # A/mu inherits the executable bits from the RCS file.
             rcs_mode = os.stat(join(source, 'A/mu,v')).st_mode
@@ -34,6 +42,10 @@ class Test(unittest.TestCase):
             source = join(dirname(__file__), 'data', 'greek', 'tree')
             self.assertEquals(Clone().eval('--quiet', '--no-skip-latest', '--bare', source), 0)
             self.assertTrue(isfile(join(tempdir, 'tree', 'config')))
+            os.chdir('tree')
+            self.assertEquals(0, Verify().eval('--quiet', '--history'))
+            self.assertEquals(0, Verify().eval('--quiet', '--history',
+                                               '--jobs', '2'))
 
     def test_clone_with_zombie_rcs_file(self):
         """Clone a repository that has a misplaced RCS file.
@@ -48,6 +60,106 @@ class Test(unittest.TestCase):
             # FIXME: zombie repository fails verification
             #self.assertEquals(0, Verify().eval())
 
+    def test_clone_from_date(self):
+        """Clone with a snapshot of the files as of a date.
+        """
+        with Tempdir(cwd=True):
+            source = join(dirname(__file__), 'data', 'zombie')
+            self.assertEquals(0, Clone().eval('--quiet', '--no-skip-latest',
+                                              '-D', '2008-09-01', source))
+            os.chdir('zombie')
+            git = Git()
+            self.assertEquals(4, len(git.rev_list('HEAD').split()))
+            root = git.rev_list('--max-parents=0', 'HEAD')
+            self.assertEquals('Snapshot of CVS as of 2008-09-01 00:00:00 UTC',
+                              git.check_command('log', '-1', '--format=%s',
+                                                root, stdout=PIPE))
+            self.assertEquals(0, Verify().eval('--quiet', '--blobs',
+                                               '--history'))
+
+    def test_clone_shallow(self):
+        """Clone the last changesets only and fetch the rest later.
+        """
+        with Tempdir(cwd=True):
+            source = join(dirname(__file__), 'data', 'zombie')
+            self.assertEquals(0, Clone().eval('--quiet', '--no-skip-latest',
+                                              '--depth', '2', source))
+            os.chdir('zombie')
+            git = Git()
+            head = git.rev_parse('HEAD')
+            self.assertEquals(3, len(git.rev_list('HEAD').split()))
+            self.assertEquals(0, Verify().eval('--quiet', '--blobs',
+                                               '--history'))
+
+            self.assertEquals(0, fetch().eval('--quiet', '--unshallow'))
+            self.assertEquals(head, git.rev_parse('HEAD'))
+            self.assertEquals(5, len(git.rev_list('HEAD').split()))
+            self.assertEquals(0, Verify().eval('--quiet', '--blobs',
+                                               '--history'))
+
+    def test_clone_include_exclude(self):
+        """Clone only part of the greek tree.
+        """
+        with Tempdir(cwd=True):
+            source = join(dirname(__file__), 'data', 'greek', 'tree')
+            self.assertEquals(0, Clone().eval('--quiet', '--no-skip-latest',
+                                              '--include', 'A/D',
+                                              '--include', 'A/*/lambda',
+                                              '--exclude', 'A/D/[GH]',
+                                              source))
+            os.chdir('tree')
+            git = Git()
+            self.assertEquals(['A/B/lambda', 'A/D/gamma'],
+                              sorted(git.ls_tree('HEAD').keys()))
+            self.assertEquals(0, Verify().eval('--quiet', '--history'))
+
+    def test_clone_branches(self):
+        """Clone the trunk, a branch and tags in one pass.
+        """
+        with Tempdir(cwd=True):
+            source = join(dirname(__file__), 'data', 'branches', 'proj')
+            self.assertEquals(0, Clone().eval('--quiet', '--no-skip-latest',
+                                              '--branches', 'STAB*',
+                                              '--tags', '*', source))
+            os.chdir('proj')
+            git = Git()
+            self.assertEquals(['a', 'b'], sorted(git.ls_tree('HEAD').keys()))
+            self.assertEquals(['a', 'b', 'c'],
+                              sorted(git.ls_tree('cvs/STABLE').keys()))
+            self.assertEquals('line 1\nline 2 on STABLE',
+                              git.check_command('show', 'cvs/STABLE:a',
+                                                stdout=PIPE))
+            # The branch forks before the trunk commit to b that
+            # precedes the first commit on the branch.
+            self.assertEquals('this is b',
+                              git.check_command('show', 'cvs/STABLE:b',
+                                                stdout=PIPE))
+            self.assertEquals(git.rev_parse('HEAD^^'),
+                              git.rev_parse('cvs/STABLE^'))
+            self.assertEquals(git.rev_parse('HEAD^^'),
+                              git.rev_parse('STABLE_BASE'))
+            # b is tagged at its base revision on the trunk.
+            self.assertEquals(git.rev_parse('cvs/STABLE'),
+                              git.rev_parse('STABLE_FIX'))
+            # MIXED tags a on the branch and b after the branch point.
+            self.assertFalse(git.ref_exists('refs/tags/MIXED'))
+            self.assertEquals(0, Verify().eval('--quiet', '--blobs',
+                                               '--history'))
+
+    def test_clone_tags_without_branch(self):
+        """Skip tags on a branch that isn't imported.
+        """
+        with Tempdir(cwd=True):
+            source = join(dirname(__file__), 'data', 'branches', 'proj')
+            self.assertEquals(0, Clone().eval('--quiet', '--no-skip-latest',
+                                              '--tags', '*', source))
+            os.chdir('proj')
+            git = Git()
+            self.assertEquals(git.rev_parse('HEAD^^'),
+                              git.rev_parse('STABLE_BASE'))
+            self.assertFalse(git.ref_exists('refs/tags/STABLE_FIX'))
+            self.assertFalse(git.ref_exists('refs/tags/MIXED'))
+
     def test_clone_partial_alternative(self):
         """Using --limit several times is the same as cloning.
         
@@ -73,6 +185,56 @@ class Test(unittest.TestCase):
             self.assertEquals(0, pull().eval('--quiet', '--no-skip-latest', '--limit=3'))
             self.assertEqual(head1, Git().rev_parse('HEAD'))
 
+    def test_verify_tampered(self):
+        """Verification by blob hash reports a file that differs.
+        """
+        with Tempdir(cwd=True) as tempdir:
+            source = join(dirname(__file__), 'data', 'greek', 'tree')
+            self.assertEquals(0, Clone().eval('--quiet', '--no-skip-latest',
+                                              source))
+            os.chdir('tree')
+
+            # Replace the HEAD commit by one in whose tree A/mu has
+            # different content, but with the same metadata.
+            git = Git()
+            blob = self.git_input(['hash-object', '-w', '--stdin'],
+                                  'tampered\n')
+            os.environ['GIT_INDEX_FILE'] = join(tempdir, 'index')
+            try:
+                git.check_command('read-tree', 'HEAD')
+                git.check_command('update-index', '--cacheinfo',
+                                  '100755,%s,A/mu' % blob)
+                tree = git.check_command('write-tree', stdout=PIPE).strip()
+            finally:
+                del os.environ['GIT_INDEX_FILE']
+            commit = git.check_command('cat-file', 'commit', 'HEAD',
+                                       stdout=PIPE)
+            commit = 'tree %s\n' % tree + commit.split('\n', 1)[1]
+            commit = self.git_input(['hash-object', '-t', 'commit', '-w',
+                                     '--stdin'], commit)
+            git.check_command('replace', 'HEAD', commit)
+
+            for args in [('--blobs',), ('--blobs', '--history'),
+                         ('--blobs', '--history', '--jobs', '2'),
+                         ('--sample', '50')]:
+                stdout = sys.stdout
+                sys.stdout = StringIO()
+                try:
+                    returncode = Verify().eval('--quiet', *args)
+                    output = sys.stdout.getvalue()
+                finally:
+                    sys.stdout = stdout
+                self.assertNotEquals(0, returncode)
+                self.assertTrue('A/mu: ' in output, output)
+
+    def git_input(self, args, data):
+        """Run git with 'data' as input and return its output.
+        """
+        pipe = Popen(['git'] + args, stdin=PIPE, stdout=PIPE)
+        output = pipe.communicate(data)[0]
+        self.assertEquals(0, pipe.returncode)
+        return output.strip()
+
     def test_git_clone_from_cvs_clone(self):
         """Cloning a new Git repo from a bare CVS tracking repo.
         """
@@ -0,0 +1,49 @@
+"""Test the command registry in the cvsgit.command package
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+from glob import glob
+
+import cvsgit.command
+from cvsgit.main import Command
+
+class Test(unittest.TestCase):
+
+    def test_registry(self):
+        """Every command module is registered with its class name.
+        """
+        modules = []
+        for path in cvsgit.command.__path__:
+            for filename in glob(os.path.join(path, '[!_]*.py')):
+                modules.append(os.path.basename(filename)[:-3])
+        self.assertEquals(sorted(modules),
+                          sorted(cvsgit.command.commands.keys()))
+
+        for command, klass_name in cvsgit.command.commands.items():
+            module_name = 'cvsgit.command.%s' % command
+            __import__(module_name)
+            klass = getattr(sys.modules[module_name], klass_name)
+            self.assertTrue(issubclass(klass, Command))
+
+    def test_light_imports(self):
+        """Command modules don't load the CVS and meta database
+        subsystems until they run.
+        """
+        script = 'import sys\n'
+        for command in cvsgit.command.commands.keys():
+            script += '__import__("cvsgit.command.%s")\n' % command
+        script += 'print sorted(filter(lambda m: m in sys.modules, ' \
+            '["cvsgit.cvs", "cvsgit.meta", "cvsgit.rcs"]))\n'
+        pipe = subprocess.Popen([sys.executable, '-c', script],
+                                stdout=subprocess.PIPE, env=dict(os.environ,
+                                PYTHONPATH=os.pathsep.join(sys.path)))
+        stdout, stderr = pipe.communicate()
+        self.assertEquals(0, pipe.returncode)
+        self.assertEquals('[]', stdout.strip())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,8 @@ import unittest
 
 from cvsgit.cvs import CVS
 from cvsgit.changeset import Change
+from cvsgit.meta import MetaDb
+from cvsgit.utils import Tempdir
 
 class Test(unittest.TestCase):
 
@@ -22,3 +24,105 @@ class Test(unittest.TestCase):
         expected = join(cvs.root, 'patches/Attic/patch-Makefile,v')
         actual = cvs.rcsfilename(c)
         self.assertEqual(expected, actual)
+
+    def test_limit(self):
+        """Runs with a limit produce the same changesets as one without.
+        """
+        def changesets(limit=None):
+            cvs = CVS(join(dirname(__file__), 'data', 'zombie'),
+                      MetaDb(':memory:'))
+            # Three changes with the same author and log message that
+            # are farther apart than the quiet period.
+            for i, filename in enumerate(['a', 'b', 'c']):
+                cvs.metadb.add_change(Change(
+                        timestamp=1000000000 + i * 1000, author='jack',
+                        log='Fix\n', filestatus='M', filename=filename,
+                        revision='1.2', state='Exp', mode=''))
+            while True:
+                count = cvs.count_changesets()
+                cvs.generate_changesets(limit=limit, flush=True)
+                if cvs.count_changesets() == count:
+                    break
+            return map(lambda cs: (cs.start_time, cs.end_time,
+                                   map(lambda c: c.filename, cs.changes)),
+                       cvs.metadb.changesets_by_start_time())
+
+        expected = changesets()
+        self.assertEqual(3, len(expected))
+        self.assertEqual(expected, changesets(limit=1))
+        self.assertEqual(expected, changesets(limit=2))
+
+    def test_parallel_changesets(self):
+        """Generate the same changesets with worker processes.
+        """
+        # (time, author, log, filename, revision), not in time order.
+        changes = [(900, 'jack', 'Y', 'a', '1.4'),
+                   (0, 'jack', 'Fix', 'a', '1.1'),
+                   (10, 'jack', 'Fix', 'b', '1.1'),
+                   (20, 'jill', 'Other', 'c', '1.1'),
+                   (200, 'jack', 'Fix', 'd', '1.1'),
+                   (230, 'jack', 'Fix', 'a', '1.2'),
+                   (500, 'jill', 'X', 'b', '1.2'),
+                   (505, 'jill', 'X', 'c', '1.2'),
+                   (910, 'jack', 'Y', 'd', '1.2'),
+                   (505, 'jill', 'X', 'a', '1.3')]
+
+        def changesets(jobs):
+            with Tempdir() as tempdir:
+                cvs = CVS(join(dirname(__file__), 'data', 'zombie'),
+                          MetaDb(join(tempdir, 'cvsgit.db')))
+                for t, author, log, filename, revision in changes:
+                    cvs.metadb.add_change(Change(
+                            timestamp=1000000000 + t, author=author,
+                            log=log + '\n', filestatus='M',
+                            filename=filename, revision=revision,
+                            state='Exp', mode=''))
+                cvs.metadb.commit()
+                self.assertEqual(4, len(cvs.metadb.change_windows(60)))
+                cvs.generate_changesets(jobs=jobs)
+                def members(cs):
+                    return map(lambda c: (c.filename, c.revision),
+                               cs.changes)
+                return (map(lambda cs: (cs.id, cs.start_time, cs.end_time,
+                                        members(cs)),
+                            cvs.metadb.changesets_by_start_time()),
+                        map(members, cvs.metadb.open_changesets()))
+
+        expected = changesets(1)
+        # The changesets of the last window are retained.
+        self.assertEqual(4, len(expected[0]))
+        self.assertEqual([[('a', '1.4'), ('d', '1.2')]], expected[1])
+        self.assertEqual(expected, changesets(2))
+
+    def test_parallel_blobs(self):
+        """Extract fulltexts in worker processes in order.
+        """
+        cvs = CVS(join(dirname(__file__), 'data', 'greek', 'tree'),
+                  MetaDb(':memory:'))
+        cvs.fetch_changes()
+        changes = list(cvs.changes(reentrant=False)) * 10
+        expected = map(lambda c: cvs.blob(c, None), changes)
+        cvs.jobs = 2
+        self.assertEqual(expected, list(cvs._parallel_blobs(changes)))
+
+    def test_changes_filters(self):
+        """Select changes by author, path prefix and time.
+        """
+        cvs = CVS(join(dirname(__file__), 'data', 'zombie'),
+                  MetaDb(':memory:'))
+        cvs.fetch_changes()
+        self.assertEqual(5, len(list(cvs.changes(reentrant=False))))
+
+        changes = list(cvs.changes(reentrant=False, authors=['pea']))
+        self.assertEqual(['pea'], map(lambda c: c.author, changes))
+
+        changes = list(cvs.changes(reentrant=False,
+                                   prefix=u'patches/patch-p',
+                                   max_time=1253195027))
+        self.assertEqual(['1.1', '1.2'],
+                         map(lambda c: c.revision, changes))
+        self.assertEqual(1, len(list(cvs.changes(
+                        reentrant=False, prefix=u'patches/patch-p',
+                        max_time=1253195026))))
+        self.assertEqual([], list(cvs.changes(reentrant=False,
+                                              processed=True)))
@@ -0,0 +1,67 @@
+import os
+from os.path import dirname, join
+import shutil
+import unittest
+
+from cvsgit.command.clone import Clone
+from cvsgit.command.fetch import fetch
+from cvsgit.command.gc import gc
+from cvsgit.git import Git
+from cvsgit.main import Conduit
+from cvsgit.utils import Tempdir
+
+class Test(unittest.TestCase):
+
+    def test_gc(self):
+        """Compact the meta database after an import.
+        """
+        with Tempdir(cwd=True) as tempdir:
+            shutil.copytree(join(dirname(__file__), 'data', 'greek'),
+                            'cvs')
+            self.assertEquals(0, Clone().eval('--quiet', '--no-skip-latest',
+                                              join(tempdir, 'cvs', 'tree'),
+                                              'greek'))
+            shutil.rmtree(join('cvs', 'tree', 'A', 'D', 'G'))
+            os.chdir('greek')
+
+            # All but one of the 11 changes in the initial commit
+            # lose their log message.  The stat() information of the
+            # three removed RCS files is dropped.  The remaining log
+            # message is too short to be compressed.
+            self.assertEquals((10, 3, 0), Conduit().gc())
+            self.assertEquals((0, 0, 0), Conduit().gc())
+
+            cvs = Conduit().cvs
+            self.assertEquals(1, len(filter(lambda c: c.log != '',
+                                            cvs.changes(reentrant=False))))
+            results = cvs.search_changesets('greek')
+            self.assertEquals(1, len(results))
+            self.assertEquals('Import greek tree\n', results[0][3])
+
+            # The compacted changes are not imported again.
+            head = Git().rev_parse('HEAD')
+            self.assertEquals(0, fetch().eval('--quiet'))
+            self.assertEquals(head, Git().rev_parse('cvs/HEAD'))
+            self.assertEquals(0, gc().eval('--quiet'))
+
+    def test_gc_without_source(self):
+        """Compact the meta database while the repository is missing.
+        """
+        with Tempdir(cwd=True) as tempdir:
+            shutil.copytree(join(dirname(__file__), 'data', 'greek'),
+                            'cvs')
+            self.assertEquals(0, Clone().eval('--quiet', '--no-skip-latest',
+                                              join(tempdir, 'cvs', 'tree'),
+                                              'greek'))
+            os.rename('cvs', 'unmounted')
+            os.chdir('greek')
+
+            # The stat() information is kept for when the repository
+            # is back.
+            self.assertEquals((10, 0, 0), Conduit().gc())
+            self.assertEquals(0, gc().eval('--quiet'))
+            os.rename(join(tempdir, 'unmounted'), join(tempdir, 'cvs'))
+            self.assertEquals((0, 0, 0), Conduit().gc())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -74,3 +74,29 @@ class Test(unittest.TestCase):
             git.init(quiet=True)
             git.config_set('foo.bar', 'baz')
             self.assertEquals('baz', git.config_get('foo.bar'))
+
+    def test_log_raw_special_paths(self):
+        """Parse the changes of files whose names git would quote.
+        """
+        with Tempdir(cwd=True):
+            git = Git()
+            git.init(quiet=True)
+            git.config_set('user.name', 'Jack')
+            git.config_set('user.email', 'jack@example.org')
+            names = ['tab\there', 'quote"back\\slash', ':colon',
+                     'new\nline']
+            for name in names:
+                f = open(name, 'w')
+                f.write(name)
+                f.close()
+            git.check_command('add', '.')
+            git.check_command('commit', '--quiet', '-m', 'Add')
+            git.check_command('rm', '--quiet', '--', './:colon')
+            git.check_command('commit', '--quiet', '-m', 'Remove')
+
+            commits = list(git.log_raw('HEAD'))
+            self.assertEquals(2, len(commits))
+            self.assertEquals(sorted(names),
+                              sorted(map(lambda c: c[3], commits[0][3])))
+            self.assertEquals([('000000', '0' * 40, 'D', ':colon')],
+                              commits[1][3])
@@ -0,0 +1,128 @@
+"""Test the cvsgit.meta module
+"""
+
+from os.path import exists, join
+import unittest
+
+from cvsgit.changeset import Change
+from cvsgit.meta import LOG_DICTIONARY_SAMPLE, MetaDb
+from cvsgit.utils import Tempdir
+
+def change(revision, timestamp, log='Log\n'):
+    return Change(timestamp=timestamp, author='uwe', log=log,
+                  filestatus='M', filename='file', revision=revision,
+                  state='Exp', mode='')
+
+class Test(unittest.TestCase):
+
+    def test_staging(self):
+        """Stage a new database in memory until it is saved.
+        """
+        with Tempdir() as tempdir:
+            filename = join(tempdir, 'cvsgit.db')
+            metadb = MetaDb(filename, staging_limit=1024 * 1024)
+            metadb.add_change(change('1.1', 1))
+            metadb.commit()
+            self.assertFalse(exists(filename))
+
+            metadb.save()
+            self.assertEquals(1, MetaDb(filename).count_changes())
+            self.assertFalse(exists(filename + '.tmp'))
+
+            # Saving again replaces the file.
+            metadb.add_change(change('1.2', 2))
+            metadb.save()
+            self.assertEquals(2, MetaDb(filename).count_changes())
+
+    def test_staging_limit(self):
+        """Continue on disk once the staging limit has been reached.
+        """
+        with Tempdir() as tempdir:
+            filename = join(tempdir, 'cvsgit.db')
+            metadb = MetaDb(filename, staging_limit=1)
+            metadb.add_change(change('1.1', 1))
+            self.assertFalse(exists(filename))
+
+            # The limit is checked at each commit, such as the one
+            # after a batch of changesets.
+            metadb.commit()
+            self.assertTrue(exists(filename))
+            metadb.add_change(change('1.2', 2))
+            metadb.commit()
+            self.assertEquals(2, MetaDb(filename).count_changes())
+
+    def test_staging_limit_transactions(self):
+        """Check the staging limit before each batch of changes and
+        after marking changesets.
+        """
+        with Tempdir() as tempdir:
+            filename = join(tempdir, 'cvsgit.db')
+            metadb = MetaDb(filename, staging_limit=1)
+            metadb.add_change(change('1.1', 1))
+            metadb.begin_transaction()
+            self.assertTrue(exists(filename))
+
+            filename = join(tempdir, 'marks.db')
+            metadb = MetaDb(filename, staging_limit=1)
+            metadb.add_change(change('1.1', 1))
+            metadb.mark_changesets([(1, 'a' * 40)])
+            self.assertTrue(exists(filename))
+
+    def test_no_staging_for_existing_database(self):
+        """An existing database is never staged.
+        """
+        with Tempdir() as tempdir:
+            filename = join(tempdir, 'cvsgit.db')
+            MetaDb(filename).commit()
+            metadb = MetaDb(filename, staging_limit=1024 * 1024)
+            metadb.add_change(change('1.1', 1))
+            metadb.commit()
+            self.assertEquals(1, MetaDb(filename).count_changes())
+
+    def test_compressed_logs(self):
+        """Compress log messages once the dictionary has been trained.
+        """
+        with Tempdir() as tempdir:
+            filename = join(tempdir, 'cvsgit.db')
+            metadb = MetaDb(filename)
+            log = u'Update to %d.\n\nok sthen@ ajacoutot@ \xfc\n'
+            for i in range(LOG_DICTIONARY_SAMPLE):
+                metadb.add_change(change('1.%d' % (i + 1), i, log % i))
+            metadb.commit()
+            self.assertEquals(0, metadb.dbh.execute("""
+                SELECT COUNT(*) FROM change
+                WHERE typeof(log) = 'blob'""").fetchone()[0])
+
+            # The dictionary is trained before the next batch.
+            metadb.begin_transaction()
+            metadb.add_change(change('2.1', 5000, log % 5000))
+            metadb.commit()
+            self.assertEquals(1, metadb.dbh.execute("""
+                SELECT COUNT(*) FROM change
+                WHERE typeof(log) = 'blob'""").fetchone()[0])
+
+            # Earlier changes are compressed by compress_logs().
+            metadb = MetaDb(filename)
+            self.assertEquals(LOG_DICTIONARY_SAMPLE, metadb.compress_logs())
+            self.assertEquals(0, metadb.compress_logs())
+            changes = list(metadb.changes_by_timestamp(reentrant=False))
+            self.assertEquals(LOG_DICTIONARY_SAMPLE + 1, len(changes))
+            self.assertEquals(log % 0, changes[0].log)
+            self.assertEquals(log % 5000, changes[-1].log)
+
+    def test_compress_logs_without_dictionary(self):
+        """compress_logs() trains the dictionary from any changes.
+        """
+        metadb = MetaDb(':memory:')
+        self.assertEquals(0, metadb.compress_logs())
+        log = u'Merge the changes from the vendor branch\n' * 3
+        metadb.add_change(change('1.1', 1, log))
+        metadb.add_change(change('1.2', 2, log))
+        metadb.commit()
+        self.assertEquals(2, metadb.compress_logs())
+        self.assertEquals([log, log],
+                          map(lambda c: c.log,
+                              metadb.changes_by_timestamp(reentrant=False)))
+
+if __name__ == '__main__':
+    unittest.main()
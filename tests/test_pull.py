@@ -128,6 +128,32 @@ class Test(unittest.TestCase):
                 Parsing RCS files: done. (1/1)
                 Processing changes: done. (1/1)
                 Importing changesets: done. (1/1)
+                Marking changesets: done. (1/1)
+                """, 0, re.MULTILINE),
+                stdout.getvalue())
+        self.assertEquals(isfile('file_b'), True)
+        self.assertEquals(
+            ['675ccc10b5cdca1ead0eec6020a16e3d51b8e548',
+             '21d3c522acefc5d240848876968504d8ea85347f'],
+            split(self.git.rev_list('HEAD')))
+
+    def test_pull_new_file_from_change_list(self):
+        """Pull a new file listed in rsync --itemize-changes output.
+        """
+        TarFile('add-file_b').extract(self.cvsroot)
+        changes = join(self.tempdir, 'changes')
+        with open(changes, 'w') as f:
+            f.write('>f+++++++++ src/file_b,v\n')
+        with redirect_stdout() as stdout:
+            self.assertEquals(pull().eval('--no-skip-latest',
+                                          '--changes-from', changes), 0)
+            self.assertEquals(
+                re.sub('^\s*', '', """\
+                Collecting RCS files: 1
+                Parsing RCS files: done. (1/1)
+                Processing changes: done. (1/1)
+                Importing changesets: done. (1/1)
+                Marking changesets: done. (1/1)
                 """, 0, re.MULTILINE),
                 stdout.getvalue())
         self.assertEquals(isfile('file_b'), True)
@@ -148,8 +174,8 @@ class Test(unittest.TestCase):
                  'Parsing RCS files: done. (2/2)',
                  'Processing changes: done. (3/3)',
                  'Retained changesets: 1',
-                 'Importing changesets:  50% (1/2)',
-                 'Importing changesets: done. (2/2)'],
+                 'Importing changesets: done. (2/2)',
+                 'Marking changesets: done. (2/2)'],
                 splitlines(stdout.getvalue()))
         self.assertEquals(
             ['24231f1cd29a5e1caaf9c0167283b8aa5955ea7f',
@@ -157,6 +183,29 @@ class Test(unittest.TestCase):
              '21d3c522acefc5d240848876968504d8ea85347f'],
             split(self.git.rev_list('HEAD')))
 
+    def test_incomplete_commit_completed(self):
+        """Retained changesets are resumed by the next pull.
+
+        The second pull only processes the change that was added since
+        the first one and completes the retained changeset with it.
+        """
+        TarFile('add-file_b').extract(self.cvsroot)
+        TarFile('split-commit-part1').extract(self.cvsroot)
+        with redirect_stdout():
+            self.assertEquals(pull().eval(), 0)
+        TarFile('split-commit-part2').extract(self.cvsroot)
+        with redirect_stdout() as stdout:
+            self.assertEquals(pull().eval('--no-skip-latest'), 0)
+            self.assertEquals(
+                ['Collecting RCS files: 2',
+                 'Parsing RCS files: done. (1/1)',
+                 'Processing changes: done. (1/1)',
+                 'Importing changesets: done. (1/1)',
+                 'Marking changesets: done. (1/1)'],
+                splitlines(stdout.getvalue()))
+        self.assertEquals(4, len(split(self.git.rev_list('HEAD'))))
+        self.assertEquals('this is file_b\n', open('file_b').read())
+
 def splitlines(s):
     """Split string `s' into lines and trim whitespace.
     """
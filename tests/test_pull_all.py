@@ -0,0 +1,40 @@
+import os
+from os.path import dirname, join
+import unittest
+
+from cvsgit.command.init import init
+from cvsgit.git import Git
+from cvsgit.utils import Tempdir
+
+# The command module name contains a dash.
+pull_all = __import__('cvsgit.command.pull-all', fromlist=['pull_all'])
+
+class Test(unittest.TestCase):
+
+    def test_pull_all(self):
+        """Pull several repositories with a shared worker pool.
+        """
+        with Tempdir(cwd=True):
+            data = join(dirname(__file__), 'data')
+            self.assertEquals(0, init().eval('--quiet',
+                                             join(data, 'greek', 'tree'),
+                                             'greek'))
+            self.assertEquals(0, init().eval('--quiet', '--bare',
+                                             join(data, 'zombie'),
+                                             'zombie'))
+            with open('list', 'w') as f:
+                f.write('# CVS mirrors\ngreek\nzombie\nmissing\n')
+
+            # The missing directory is reported, but doesn't stop the
+            # others.
+            self.assertEquals(1, pull_all.pull_all().eval(
+                    '--quiet', '--no-skip-latest', '--jobs', '2',
+                    '--parse-jobs', '1', 'list'))
+            self.assertEquals(5, len(Git('zombie').rev_list(
+                        'master').split()))
+            os.chdir('greek')
+            self.assertEquals(Git().rev_parse('HEAD'),
+                              Git().rev_parse('cvs/HEAD'))
+
+if __name__ == '__main__':
+    unittest.main()
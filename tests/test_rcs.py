@@ -17,6 +17,29 @@ class Test(unittest.TestCase):
         f = RCSFile(join(dirname(__file__), 'data', 'patch-copyin_c,v'))
         for c in f.changes(): self.assertTrue(False)
 
+    def test_branches(self):
+        """Changes on selected branches follow those on the trunk.
+
+        The file from testNoRevisionsOnTrunk was added on each release
+        branch.
+        """
+        f = RCSFile(join(dirname(__file__), 'data', 'patch-copyin_c,v'))
+        self.assertEqual({'OPENBSD_3_6': '1.1.2', 'OPENBSD_3_7': '1.1.4',
+                          'OPENBSD_3_8': '1.1.6'}, f.branches())
+        changes = list(f.changes(branches=lambda n: n != 'OPENBSD_3_7'))
+        self.assertEqual([('OPENBSD_3_6', '1.1.2.1', 'A'),
+                          ('OPENBSD_3_8', '1.1.6.1', 'A')],
+                         map(lambda c: (c.branch, c.revision, c.filestatus),
+                             changes))
+
+    def test_tags(self):
+        """Tags are the symbols that aren't branch numbers.
+        """
+        f = RCSFile(join(dirname(__file__), 'data', 'branches', 'proj',
+                         'a,v'))
+        self.assertEqual({'MIXED': '1.1.2.1', 'STABLE_BASE': '1.1',
+                          'STABLE_FIX': '1.1.2.1'}, f.tags())
+
     def testIncompleteRevisionTrail(self):
         """HEAD branch missing 1.3 and earlier ancestors
 
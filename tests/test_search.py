@@ -0,0 +1,48 @@
+import os
+from os.path import dirname, join
+from subprocess import PIPE
+import sqlite3
+import unittest
+
+from cvsgit.command.clone import Clone
+from cvsgit.command.search import search
+from cvsgit.git import Git
+from cvsgit.main import Conduit
+from cvsgit.meta import MetaDb
+from cvsgit.utils import Tempdir
+
+class Test(unittest.TestCase):
+
+    def test_search(self):
+        """Find imported changesets by their log message.
+        """
+        with Tempdir(cwd=True):
+            source = join(dirname(__file__), 'data', 'zombie')
+            self.assertEquals(0, Clone().eval('--quiet', '--bare',
+                                              '--no-skip-latest', source))
+            os.chdir('zombie')
+            git = Git()
+
+            results = Conduit().cvs.search_changesets('unbreak build')
+            self.assertEquals(1, len(results))
+            commit, timestamp, author, log = results[0]
+            self.assertEquals(log.rstrip('\n'), git.check_command(
+                    'log', '-1', '--format=%B', commit, stdout=PIPE).strip())
+
+            self.assertEquals(2, len(Conduit().cvs.search_changesets(
+                        'update OR unbreak', limit=2)))
+            self.assertEquals(0, search().eval('"reserved keyword"'))
+            self.assertEquals(1, search().eval('nonexistent'))
+            self.assertEquals(2, search().eval('"unbalanced'))
+
+            # An index missing from an older database is rebuilt.
+            filename = join(git.git_dir, 'cvsgit.db')
+            dbh = sqlite3.connect(filename)
+            dbh.execute('DROP TABLE changeset_log')
+            dbh.commit()
+            dbh.close()
+            self.assertEquals(results,
+                              MetaDb(filename).search_changesets('unbreak'))
+
+if __name__ == '__main__':
+    unittest.main()
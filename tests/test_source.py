@@ -0,0 +1,137 @@
+"""Test the cvsgit.source module
+"""
+
+import os
+from os.path import dirname, join
+from subprocess import PIPE
+import tarfile
+import unittest
+import zipfile
+
+from cvsgit.command.clone import Clone
+from cvsgit.command.verify import Verify
+from cvsgit.cvs import CVS
+from cvsgit.git import Git
+from cvsgit.meta import MetaDb
+from cvsgit.source import TarSource, open_source
+from cvsgit.utils import Tempdir
+
+GREEK = join(dirname(__file__), 'data', 'greek')
+
+def make_tar(filename, mode='w'):
+    tar = tarfile.open(filename, mode)
+    tar.add(GREEK, 'greek')
+    tar.close()
+
+def make_zip(filename):
+    archive = zipfile.ZipFile(filename, 'w')
+    for dirpath, dirnames, filenames in os.walk(GREEK):
+        for name in filenames:
+            path = join(dirpath, name)
+            archive.write(path, join('greek', path[len(GREEK) + 1:]))
+    archive.close()
+
+class Test(unittest.TestCase):
+
+    def test_walk(self):
+        """Walk the members of an archive like a directory.
+        """
+        with Tempdir(cwd=True) as tempdir:
+            make_tar('greek.tar')
+            top = join(tempdir, 'greek.tar', 'greek', 'tree')
+            source = open_source(top)
+            self.assertTrue(isinstance(source, TarSource))
+            self.assertTrue(source.isdir(join(top, 'A', 'D')))
+            self.assertTrue(source.isfile(join(top, 'A', 'mu,v')))
+            self.assertFalse(source.exists(join(top, 'A', 'nu,v')))
+
+            walk = source.walk(top)
+            self.assertEquals((top, ['A'], []), walk.next())
+            dirpath, dirnames, filenames = walk.next()
+            self.assertEquals(join(top, 'A'), dirpath)
+            self.assertEquals('mu,v', filenames[0])
+            # Skip all subdirectories of A.
+            dirnames[:] = []
+            self.assertRaises(StopIteration, walk.next)
+
+    def test_index_once(self):
+        """Index an archive again only if it changed.
+        """
+        with Tempdir(cwd=True) as tempdir:
+            make_tar('greek.tar')
+            top = join(tempdir, 'greek.tar', 'greek', 'tree')
+            source = open_source(top)
+            self.assertTrue(source is open_source(join(top, 'A')))
+
+            make_tar('greek.tar', 'a')
+            os.utime('greek.tar', (0, 0))
+            self.assertFalse(source is open_source(top))
+
+    def test_rcsfile_cache(self):
+        """Parse each RCS file in an archive only once.
+        """
+        with Tempdir(cwd=True) as tempdir:
+            make_zip('greek.zip')
+            path = join(tempdir, 'greek.zip', 'greek', 'tree', 'A', 'mu,v')
+            source = open_source(path)
+            rcsfile = source.rcsfile(path)
+            self.assertEquals(path, rcsfile.filename)
+            self.assertTrue(rcsfile is source.rcsfile(path))
+
+    def test_parallel_blobs(self):
+        """Extract fulltexts from an archive in worker processes.
+        """
+        with Tempdir(cwd=True) as tempdir:
+            make_tar('greek.tar')
+            cvs = CVS(join(tempdir, 'greek.tar', 'greek', 'tree'),
+                      MetaDb(':memory:'))
+            cvs.fetch_changes()
+            changes = list(cvs.changes(reentrant=False)) * 10
+            expected = map(lambda c: cvs.blob(c, None), changes)
+            cvs.jobs = 2
+            self.assertEqual(expected, list(cvs._parallel_blobs(changes)))
+
+    def test_compressed_tar(self):
+        """Compressed tar archives are rejected.
+        """
+        with Tempdir(cwd=True) as tempdir:
+            make_tar('greek.tar.gz', 'w:gz')
+            self.assertRaises(TypeError, open_source,
+                              join(tempdir, 'greek.tar.gz', 'greek'))
+
+    def test_clone(self):
+        """Clone from tar and zip archives without extracting them.
+        """
+        with Tempdir(cwd=True) as tempdir:
+            make_tar('greek.tar')
+            make_zip('greek.zip')
+            sources = [('dir', join(GREEK, 'tree')),
+                       ('tar', join(tempdir, 'greek.tar', 'greek', 'tree')),
+                       ('zip', join(tempdir, 'greek.zip', 'greek', 'tree'))]
+            for directory, source in sources:
+                self.assertEquals(0, Clone().eval('--quiet',
+                                                  '--no-skip-latest',
+                                                  source, directory))
+
+            tree = Git('dir').check_command('ls-tree', '-r', 'HEAD',
+                                            stdout=PIPE)
+            self.assertTrue('A/mu' in tree)
+            for directory in ['tar', 'zip']:
+                self.assertEquals(tree, Git(directory).check_command(
+                    'ls-tree', '-r', 'HEAD', stdout=PIPE))
+
+    def test_verify(self):
+        """Verify a clone against the archive it was cloned from.
+        """
+        with Tempdir(cwd=True) as tempdir:
+            make_tar('greek.tar')
+            source = join(tempdir, 'greek.tar', 'greek', 'tree')
+            self.assertEquals(0, Clone().eval('--quiet', '--no-skip-latest',
+                                              source, 'tar'))
+            os.chdir('tar')
+            self.assertEquals(0, Verify().eval('--quiet', '--blobs'))
+            self.assertEquals(0, Verify().eval('--quiet', '--blobs',
+                                               '--history', '--jobs', '2'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Test the cvsgit.term module
+"""
+
+from StringIO import StringIO
+import unittest
+
+from cvsgit.term import Progress, pause_progress
+
+class Terminal(StringIO):
+
+    def isatty(self):
+        return True
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = StringIO()
+        self.progress = Progress(self.stream)
+        # Keep the ticker from interfering.
+        self.progress.tick_interval = 60
+
+    def test_progress(self):
+        """Show only the last count of a short block if the output is
+        not a terminal.
+        """
+        with self.progress:
+            self.progress('Parsing RCS files', 0, 10)
+            self.progress('Parsing RCS files', 5, 10)
+            self.progress('Parsing RCS files', 7, 10)
+            self.progress('Processing changes', 0, 10)
+        self.progress('Retained changesets', 1)
+        self.assertEquals('Processing changes:   0% (0/10)\n'
+                          'Retained changesets: 1\n',
+                          self.stream.getvalue())
+
+    def test_progress_tty(self):
+        """Show new messages at once and the last count at the end on a
+        terminal.
+        """
+        self.stream = Terminal()
+        self.progress = Progress(self.stream)
+        self.progress.tick_interval = 60
+        with self.progress:
+            self.progress('Parsing RCS files', 0, 10)
+            self.progress('Parsing RCS files', 7, 10)
+        self.assertEquals(['Parsing RCS files:   0% (0/10)',
+                           'Parsing RCS files:  70% (7/10)\n'],
+                          lines(self.stream.getvalue()))
+
+    def test_phases(self):
+        """Show concurrent phases on one line with an estimate of the
+        remaining time.
+        """
+        self.stream = Terminal()
+        self.progress = Progress(self.stream)
+        self.progress.tick_interval = 60
+        with self.progress:
+            self.progress('Parsing RCS files', 1)
+            with self.progress.phase() as phase:
+                phase('Importing', 0, 100)
+                phase.sample_rate(10.0)
+                phase('Importing', 10, 100)
+                phase.sample_rate(15.0)
+                self.assertEquals('Importing:  10% (10/100, ETA 0:45)',
+                                  phase.text())
+            self.progress('Parsing RCS files', 2)
+        self.assertEquals(['Parsing RCS files: 1',
+                           'Parsing RCS files: 1; Importing:   0% (0/100)',
+                           'Parsing RCS files: 2\n'],
+                          lines(self.stream.getvalue()))
+
+    def test_pause_progress(self):
+        """Stop the background thread while worker processes may be
+        forked and start it again afterwards.
+        """
+        with self.progress:
+            ticker = self.progress.ticker
+            with pause_progress():
+                self.assertEquals(None, self.progress.ticker)
+                self.assertFalse(ticker.is_alive())
+            self.assertTrue(self.progress.ticker.is_alive())
+        self.assertEquals(None, self.progress.ticker)
+        with pause_progress():
+            self.assertEquals(None, self.progress.ticker)
+
+def lines(output):
+    """Return the lines written to a terminal, without the blanks that
+    overwrite each line.
+    """
+    return filter(lambda line: line.strip(), output.split('\r'))
+
+if __name__ == '__main__':
+    unittest.main()
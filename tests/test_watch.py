@@ -0,0 +1,92 @@
+"""Test the watch loop of cvsgit.main.Conduit
+"""
+
+import os
+from os.path import dirname, join
+import shutil
+from subprocess import PIPE
+import unittest
+
+from cvsgit.command.clone import Clone
+import cvsgit.watch
+from cvsgit.main import Conduit
+from cvsgit.utils import Tempdir
+from cvsgit.watch import Watcher
+
+class Stop(Exception):
+    pass
+
+class Event(object):
+    def __init__(self, pathname, dir):
+        self.pathname = pathname
+        self.dir = dir
+
+class Notifier(object):
+    """Stands in for pyinotify.Notifier and delivers queued events.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.events = []
+
+    def check_events(self, timeout=None):
+        return len(self.events) > 0
+
+    def read_events(self):
+        pass
+
+    def process_events(self):
+        while len(self.events) > 0:
+            self.callback(self.events.pop(0))
+
+    def stop(self):
+        pass
+
+class MirrorWatcher(Watcher):
+    """Pretends that inotify is available and that a mirror run
+    creates a directory with RCS files in it before the directory is
+    watched, so that only the directory itself is reported.
+    """
+
+    def __init__(self, directory):
+        Watcher.__init__(self, directory, inotify=False)
+        self.notifier = Notifier(self._event)
+        self.waits = 0
+
+    def wait(self, timeout=None):
+        self.waits += 1
+        if self.waits > 1:
+            raise Stop()
+        target = join(self.directory, 'A', 'D')
+        shutil.move(join(dirname(self.directory), 'D'), target)
+        self.notifier.events.append(Event(target, True))
+        return Watcher.wait(self, timeout)
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.watcher = cvsgit.watch.Watcher
+        cvsgit.watch.Watcher = MirrorWatcher
+
+    def tearDown(self):
+        cvsgit.watch.Watcher = self.watcher
+
+    def test_new_directory(self):
+        """Rescan the repository when a directory is created.
+        """
+        with Tempdir(cwd=True) as tempdir:
+            shutil.copytree(join(dirname(__file__), 'data', 'greek'),
+                            'greek')
+            source = join(tempdir, 'greek', 'tree')
+            shutil.move(join(source, 'A', 'D'), join(tempdir, 'greek', 'D'))
+            self.assertEquals(0, Clone().eval('--quiet', '--no-skip-latest',
+                                              source, 'git'))
+            os.chdir('git')
+            conduit = Conduit()
+            self.assertRaises(Stop, conduit.watch)
+            tree = conduit.git.check_command('ls-tree', '-r', '--name-only',
+                                             'cvs/HEAD', stdout=PIPE)
+            self.assertTrue('A/D/gamma' in tree.split())
+
+if __name__ == '__main__':
+    unittest.main()